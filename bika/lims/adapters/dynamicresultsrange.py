@@ -109,10 +109,7 @@ class DynamicResultsRange(object):
             return {}
         # A matching Analysis Keyword is mandatory for any further matches
         keyword = self.analysis.getKeyword()
-        by_keyword = self.dynamicspec.get_by_keyword()
-        # Get all specs (rows) from the Excel with the same Keyword
-        specs = by_keyword.get(keyword)
-        if not specs:
+        if keyword not in self.dynamicspec.get_index(()):
             return {}
 
         # Generate a match data object, which match both the column names and
@@ -121,35 +118,24 @@ class DynamicResultsRange(object):
 
         rr = {}
 
-        # Iterate over the rows and return the first where **all** values match
-        # with the analysis' values
-        for spec in specs:
-            skip = False
-
-            for k, v in match_data.items():
-                # break if the values do not match
-                if v != spec[k]:
-                    skip = True
-                    break
-
-            # skip the whole specification row
-            if skip:
-                continue
-
-            # at this point we have a match, update the results range dict
-            for key in self.range_keys:
-                value = spec.get(key, marker)
-                # skip if the range key is not set in the Excel
-                if value is marker:
-                    continue
-                # skip if the value is not floatable
-                if not api.is_floatable(value):
-                    continue
-                # set the range value
-                rr[key] = value
-            # return the updated result range
+        # Lookup the first row where **all** values match with the analysis'
+        # values. The rows are indexed by the matching columns.
+        spec = self.dynamicspec.find_spec(keyword, match_data)
+        if spec is None:
             return rr
 
+        # at this point we have a match, update the results range dict
+        for key in self.range_keys:
+            value = spec.get(key, marker)
+            # skip if the range key is not set in the Excel
+            if value is marker:
+                continue
+            # skip if the value is not floatable
+            if not api.is_floatable(value):
+                continue
+            # set the range value
+            rr[key] = value
+        # return the updated result range
         return rr
 
     def __call__(self):
@@ -18,11 +18,17 @@
 # Copyright 2018-2020 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+import ast
+import math
+import re
 from collections import Mapping
+from collections import OrderedDict
+
 from bika.lims import api
 from bika.lims.api import _marker
 from bika.lims.config import MIN_OPERATORS, MAX_OPERATORS
 from bika.lims.content.analysisspec import ResultsRangeDict
+from bika.lims.content.calculation import parse_formula
 from bika.lims.interfaces import IAnalysis, IReferenceAnalysis, \
     IResultOutOfRange
 from zope.component._api import getAdapters
@@ -31,6 +37,55 @@ from bika.lims.interfaces import IDuplicateAnalysis
 from bika.lims.interfaces import ISubmitted
 from bika.lims.interfaces.analysis import IRequestAnalysis
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Variable names of the keywords in a parsed formula
+FORMULA_VARIABLE_RX = re.compile(r"_v\d+$")
+
+# Functions from math (and builtins) with an element-wise NumPy counterpart
+# that returns the same values: name -> (numpy function, number of arguments)
+VECTORIZABLE_FUNCTIONS = {
+    "acos": ("arccos", 1),
+    "asin": ("arcsin", 1),
+    "atan": ("arctan", 1),
+    "atan2": ("arctan2", 2),
+    "ceil": ("ceil", 1),
+    "cos": ("cos", 1),
+    "cosh": ("cosh", 1),
+    "exp": ("exp", 1),
+    "fabs": ("fabs", 1),
+    "floor": ("floor", 1),
+    "log": ("log", 1),
+    "log10": ("log10", 1),
+    "pow": ("power", 2),
+    "sin": ("sin", 1),
+    "sinh": ("sinh", 1),
+    "sqrt": ("sqrt", 1),
+    "tan": ("tan", 1),
+    "tanh": ("tanh", 1),
+}
+
+VECTORIZABLE_BUILTINS = {
+    "abs": ("absolute", 1),
+    "pow": ("power", 2),
+}
+
+VECTORIZABLE_CONSTANTS = {
+    "e": math.e,
+    "pi": math.pi,
+}
+
+# Arithmetic nodes of a formula expression that behave the same with floats
+# and with NumPy arrays of floats
+VECTORIZABLE_NODES = (
+    ast.Expression, ast.Load, ast.BinOp, ast.UnaryOp, ast.Num, ast.Name,
+    ast.Attribute, ast.Call, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod,
+    ast.Pow, ast.UAdd, ast.USub,
+)
+
 
 def is_out_of_range(brain_or_object, result=_marker):
     """Checks if the result for the analysis passed in is out of range and/or
@@ -218,3 +273,243 @@ def is_result_range_compliant(analysis):
         return True
 
     return rr == sample_rr
+
+
+def calculate_results(analyses, override=False):
+    """Calculates the results of the analyses passed in that have a
+    Calculation assigned, evaluating each formula once for all the analyses
+    that share the same Calculation.
+
+    The values of the interims and dependencies are gathered as columns, so
+    formulas with arithmetic operations and `math` functions only are
+    evaluated with NumPy arrays in a single pass (if NumPy is installed). The
+    rest of formulas are evaluated row by row. The results, as well as the
+    "NA" and "0/0" results on errors, are the same as those obtained with
+    `calculateResult` for each analysis.
+
+    Analyses that depend on other analyses from the list are calculated after
+    their dependencies.
+
+    :param analyses: list of analysis objects or brains
+    :param override: if True, overwrite the results already set
+    :returns: list of analyses for which a result has been calculated
+    """
+    def is_calculable(analysis):
+        if analysis.getResult() and not override:
+            return False
+        return analysis.getCalculation() and True or False
+
+    analyses = map(api.get_object, analyses)
+    pending = filter(is_calculable, analyses)
+    calculated = []
+    check_dependencies = True
+
+    while pending:
+        pending_keys = set(map(_get_dependency_key, pending))
+        groups = OrderedDict()
+        remaining = []
+        for analysis in pending:
+            calculation = analysis.getCalculation()
+            if check_dependencies and _depends_on_any(analysis, pending_keys):
+                # Wait until the dependencies have been calculated
+                remaining.append(analysis)
+                continue
+
+            mapping = analysis.getCalculationMapping(override=override)
+            if mapping is None:
+                # Interims or dependencies are not available yet
+                remaining.append(analysis)
+                continue
+
+            uid = api.get_uid(calculation)
+            group = groups.setdefault(uid, (calculation, [], []))
+            group[1].append(analysis)
+            group[2].append(mapping)
+
+        if not groups:
+            if not check_dependencies:
+                break
+            # No progress possible, maybe because of circular dependencies
+            # or dependencies that cannot be calculated. Calculate the
+            # remaining analyses with the results their dependencies have
+            check_dependencies = False
+            pending = remaining
+            continue
+
+        for calculation, rows, mappings in groups.values():
+            results = evaluate_formula(calculation, mappings)
+            for analysis, result in zip(rows, results):
+                analysis.setResult(result)
+                calculated.append(analysis)
+
+        pending = remaining
+
+    return calculated
+
+
+def evaluate_formula(calculation, mappings):
+    """Evaluates the formula of the calculation for each mapping passed in
+
+    :param calculation: the Calculation object
+    :param mappings: list of dicts of keyword -> value
+    :returns: list with the result for each mapping, as strings
+    """
+    results = _evaluate_vectorized(calculation, mappings)
+    if results is None:
+        results = map(lambda m: _evaluate_row(calculation, m), mappings)
+    return results
+
+
+def _evaluate_row(calculation, mapping):
+    """Evaluates the formula for a single mapping of keyword -> value, with
+    same results on errors as `calculateResult`
+    """
+    try:
+        result = calculation.evaluateFormula(mapping)
+    except (TypeError, KeyError, ImportError):
+        return "NA"
+    except ZeroDivisionError:
+        return "0/0"
+    return str(result)
+
+
+def _evaluate_vectorized(calculation, mappings):
+    """Evaluates the formula for all mappings in one pass with NumPy arrays.
+    Returns None if the formula or the values are not suitable for a
+    vectorized evaluation or if a floating point error occurred, so the
+    mappings need to be evaluated one by one instead
+    """
+    if numpy is None or len(mappings) < 2:
+        return None
+
+    code, keywords = calculation.getCompiledFormula()
+    if not keywords:
+        return None
+
+    try:
+        # Python imports that are not available result in "NA"
+        calculation.getFormulaGlobals()
+    except ImportError:
+        return None
+
+    functions = _get_vectorizable_functions(calculation)
+    source = parse_formula(calculation.getMinifiedFormula())[0]
+    if not _is_vectorizable(source, functions):
+        return None
+
+    variables = {}
+    for num, keyword in enumerate(keywords):
+        column = map(lambda mapping: mapping.get(keyword), mappings)
+        if not all(map(lambda value: isinstance(value, float), column)):
+            # Missing keywords or non-float values (e.g. BELOWLDL flags)
+            return None
+        variables["_v{}".format(num)] = numpy.array(column, dtype=float)
+
+    globs = {"__builtins__": None}
+    math_functions = dict(VECTORIZABLE_CONSTANTS)
+    for name, (func, num_args) in functions.items():
+        if name.startswith("math."):
+            math_functions[name[len("math."):]] = func
+        else:
+            globs[name] = func
+    globs["math"] = type("math", (object, ), math_functions)
+
+    try:
+        with numpy.errstate(all="raise", under="ignore"):
+            results = eval(code, globs, variables)
+    except Exception:
+        # Division by zero, domain errors, etc. Fallback to row by row
+        return None
+
+    if not isinstance(results, numpy.ndarray):
+        return None
+    if results.shape != (len(mappings), ):
+        return None
+    return map(str, results.tolist())
+
+
+def _get_vectorizable_functions(calculation):
+    """Returns a dict of function name -> (numpy function, number of args)
+    with the functions the formula of the calculation can use in a
+    vectorized evaluation
+    """
+    functions = {}
+    for name, (func, num_args) in VECTORIZABLE_BUILTINS.items():
+        functions[name] = (getattr(numpy, func), num_args)
+    for name, (func, num_args) in VECTORIZABLE_FUNCTIONS.items():
+        key = "math.{}".format(name)
+        functions[key] = (getattr(numpy, func), num_args)
+    for imp in calculation.getPythonImports():
+        name = imp.get("function")
+        if imp.get("module") == "math" and name in VECTORIZABLE_FUNCTIONS:
+            func, num_args = VECTORIZABLE_FUNCTIONS[name]
+            functions[name] = (getattr(numpy, func), num_args)
+        else:
+            # Imported member that shadows a builtin, if any
+            functions.pop(name, None)
+    return functions
+
+
+def _is_vectorizable(source, functions):
+    """Returns whether the parsed formula only contains arithmetic operations
+    and calls to the functions passed in, so it can be evaluated with arrays
+    """
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError:
+        return False
+
+    names = set(functions.keys())
+    for node in ast.walk(tree):
+        if not isinstance(node, VECTORIZABLE_NODES):
+            return False
+        if isinstance(node, ast.Num):
+            if not isinstance(node.n, (int, long, float)):
+                return False
+        elif isinstance(node, ast.Name):
+            if node.id not in names and node.id != "math" and \
+                    not FORMULA_VARIABLE_RX.match(node.id):
+                return False
+        elif isinstance(node, ast.Attribute):
+            if not isinstance(node.value, ast.Name):
+                return False
+            if node.value.id != "math":
+                return False
+            name = "math.{}".format(node.attr)
+            if name not in names and node.attr not in VECTORIZABLE_CONSTANTS:
+                return False
+        elif isinstance(node, ast.Call):
+            if node.keywords or node.starargs or node.kwargs:
+                return False
+            func = node.func
+            if isinstance(func, ast.Attribute):
+                name = "{}.{}".format(getattr(func.value, "id", ""), func.attr)
+            else:
+                name = getattr(func, "id", None)
+            if name not in functions:
+                return False
+            if len(node.args) != functions[name][1]:
+                return False
+    return True
+
+
+def _get_dependency_key(analysis):
+    """Returns the key that identifies the analysis passed in as a dependency
+    of the analyses that share the same container
+    """
+    parent_uid = api.get_uid(api.get_parent(analysis))
+    return parent_uid, analysis.getKeyword()
+
+
+def _depends_on_any(analysis, keys):
+    """Returns whether the formula of the analysis refers to any of the
+    analyses represented by the keys passed in, other than itself
+    """
+    parent_uid = api.get_uid(api.get_parent(analysis))
+    keywords = analysis.getCalculation().getCompiledFormula()[1]
+    keywords = set(map(lambda kw: kw.split(".")[0], keywords))
+    keywords.discard(analysis.getKeyword())
+    for keyword in keywords:
+        if (parent_uid, keyword) in keys:
+            return True
+    return False
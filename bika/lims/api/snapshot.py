@@ -20,6 +20,8 @@
 
 import json
 
+from BTrees.IOBTree import IOBTree
+from BTrees.OOBTree import OOTreeSet
 from bika.lims import _
 from bika.lims import api
 from bika.lims import logger
@@ -28,6 +30,7 @@ from bika.lims.api.security import get_user_id
 from bika.lims.interfaces import IAuditable
 from bika.lims.interfaces import IDoNotSupportSnapshots
 from DateTime import DateTime
+from persistent import Persistent
 from persistent.list import PersistentList
 from plone.memoize.ram import cache
 from senaite.core.supermodel import SuperModel
@@ -37,6 +40,131 @@ from zope.interface import alsoProvides
 
 SNAPSHOT_STORAGE = "senaite.core.snapshots"
 
+# Number of versions after which a full snapshot is stored again, so that any
+# version can be reconstructed by applying this many diffs at most
+REBASE_INTERVAL = 10
+
+_marker = object()
+
+
+class SnapshotStorage(Persistent):
+    """Version -> snapshot storage
+
+    Only every `rebase_interval`-th version holds the full snapshot data. The
+    versions in between only hold the fields that changed (or were removed)
+    compared to the previous version.
+
+    The records are kept as JSON in a BTree keyed by version, so appending a
+    new version does not rewrite the whole history.
+    """
+
+    # Searchable tokens of the stored versions, see `update_tokens`
+    _tokens = None
+    _tokens_version = 0
+
+    def __init__(self, snapshots=None, rebase_interval=REBASE_INTERVAL):
+        self.rebase_interval = max(1, rebase_interval)
+        self._records = IOBTree()
+        self.extend(snapshots or [])
+
+    def __len__(self):
+        if not self._records:
+            return 0
+        return self._records.maxKey() + 1
+
+    def __iter__(self):
+        """Reconstructs the snapshots version by version
+        """
+        snapshot = {}
+        for record in self._records.values():
+            snapshot = self._apply(snapshot, record)
+            yield dict(snapshot)
+
+    def __getitem__(self, version):
+        length = len(self)
+        if version < 0:
+            version += length
+        if version < 0 or version >= length:
+            raise IndexError("Snapshot version out of range")
+        return self.get(version)
+
+    def __repr__(self):
+        return "<SnapshotStorage with {} versions>".format(len(self))
+
+    def get(self, version):
+        """Reconstructs the snapshot of the given version
+
+        :param version: The version of the snapshot
+        :returns: Snapshot dictionary or None
+        """
+        if version not in self._records:
+            return None
+        base = version - version % self.rebase_interval
+        snapshot = {}
+        for record in self._records.values(min=base, max=version):
+            snapshot = self._apply(snapshot, record)
+        return snapshot
+
+    def append(self, snapshot):
+        """Appends the snapshot as a new version
+
+        :param snapshot: Snapshot dictionary
+        """
+        version = len(self)
+        # normalize the data to what is stored, e.g. tuples -> lists
+        snapshot = json.loads(json.dumps(snapshot))
+        if version % self.rebase_interval == 0:
+            record = {"base": snapshot}
+        else:
+            previous = self.get(version - 1)
+            changed = dict(filter(lambda item: previous.get(item[0], _marker)
+                                  != item[1], snapshot.items()))
+            removed = filter(lambda key: key not in snapshot, previous)
+            record = {"diff": changed, "removed": removed}
+        self._records[version] = json.dumps(record)
+
+    def extend(self, snapshots):
+        for snapshot in snapshots:
+            self.append(snapshot)
+
+    def clear(self):
+        self._records.clear()
+        self._tokens = None
+        self._tokens_version = 0
+
+    def update_tokens(self, extract):
+        """Extends the searchable tokens with the ones of the versions that
+        were appended since the last update
+
+        Only the changed values of each version are passed in, because the
+        tokens of the unchanged values were already added before.
+
+        :param extract: Function that returns the tokens of a values dict
+        :returns: OOTreeSet of tokens
+        """
+        if self._tokens is None:
+            self._tokens = OOTreeSet()
+        length = len(self)
+        if self._tokens_version >= length:
+            return self._tokens
+        for record in self._records.values(min=self._tokens_version):
+            record = json.loads(record)
+            values = record.get("base", record.get("diff"))
+            self._tokens.update(extract(values))
+        self._tokens_version = length
+        return self._tokens
+
+    def _apply(self, snapshot, record):
+        """Applies the JSON record to the snapshot of the previous version
+        """
+        record = json.loads(record)
+        if "base" in record:
+            return record["base"]
+        snapshot.update(record["diff"])
+        for key in record["removed"]:
+            snapshot.pop(key, None)
+        return snapshot
+
 
 def _objectdata_cache_key(func, obj):
     """Cache Key for object data
@@ -63,13 +191,52 @@ def supports_snapshots(obj):
 def get_storage(obj):
     """Get or create the audit log storage for the given object
 
+    Storages of the former format (list of JSON snapshots) are migrated
+
     :param obj: Content object
-    :returns: PersistentList
+    :returns: SnapshotStorage
     """
     annotation = IAnnotations(obj)
-    if annotation.get(SNAPSHOT_STORAGE) is None:
-        annotation[SNAPSHOT_STORAGE] = PersistentList()
-    return annotation[SNAPSHOT_STORAGE]
+    storage = annotation.get(SNAPSHOT_STORAGE)
+    if storage is None:
+        storage = annotation[SNAPSHOT_STORAGE] = SnapshotStorage()
+    elif isinstance(storage, PersistentList):
+        storage = migrate_storage(obj)
+    return storage
+
+
+def get_snapshot_storage(obj):
+    """Get the audit log storage for the given object without modifying it
+
+    Storages of the former format are converted on the fly, but not migrated
+
+    :param obj: Content object
+    :returns: SnapshotStorage
+    """
+    try:
+        annotation = IAnnotations(obj)
+    except TypeError:
+        return SnapshotStorage()
+    storage = annotation.get(SNAPSHOT_STORAGE)
+    if storage is None:
+        return SnapshotStorage()
+    elif isinstance(storage, PersistentList):
+        return SnapshotStorage(map(json.loads, storage))
+    return storage
+
+
+def migrate_storage(obj):
+    """Migrates the list of JSON snapshots to a `SnapshotStorage`
+
+    :param obj: Content object
+    :returns: SnapshotStorage or None if the object had no storage
+    """
+    annotation = IAnnotations(obj)
+    storage = annotation.get(SNAPSHOT_STORAGE)
+    if isinstance(storage, PersistentList):
+        storage = SnapshotStorage(map(json.loads, storage))
+        annotation[SNAPSHOT_STORAGE] = storage
+    return storage
 
 
 def get_snapshots(obj):
@@ -78,8 +245,8 @@ def get_snapshots(obj):
     :param obj: Content object
     :returns: List of snapshot dictionaries
     """
-    snapshots = get_storage(obj)
-    return map(json.loads, snapshots)
+    snapshots = get_snapshot_storage(obj)
+    return list(snapshots)
 
 
 def has_snapshots(obj):
@@ -88,8 +255,7 @@ def has_snapshots(obj):
     :param obj: Content object
     :returns: True/False
     """
-    storage = get_storage(obj)
-    return len(storage) > 0
+    return get_snapshot_count(obj) > 0
 
 
 def get_snapshot_count(obj):
@@ -132,10 +298,8 @@ def get_snapshot_by_version(obj, version=0):
     """
     if version < 0:
         return None
-    snapshots = get_snapshots(obj)
-    if version > len(snapshots) - 1:
-        return None
-    return snapshots[version]
+    storage = get_snapshot_storage(obj)
+    return storage.get(version)
 
 
 def get_snapshot_version(obj, snapshot):
@@ -145,8 +309,10 @@ def get_snapshot_version(obj, snapshot):
     :param snapshot: Snapshot dictionary
     :returns: Index where the object is lcated
     """
-    snapshots = get_snapshots(obj)
-    return snapshots.index(snapshot)
+    for version, item in enumerate(get_snapshot_storage(obj)):
+        if item == snapshot:
+            return version
+    raise ValueError("Snapshot not found")
 
 
 def get_last_snapshot(obj):
@@ -300,9 +466,6 @@ def take_snapshot(obj, store=True, **kw):
     # store the metadata
     snapshot["__metadata__"] = metadata
 
-    # convert the snapshot to JSON
-    data = json.dumps(snapshot)
-
     # return immediately
     if not store:
         return snapshot
@@ -311,7 +474,7 @@ def take_snapshot(obj, store=True, **kw):
     storage = get_storage(obj)
 
     # store the snapshot data
-    storage.append(data)
+    storage.append(snapshot)
 
     # Mark the content as auditable
     alsoProvides(obj, IAuditable)
@@ -420,12 +583,27 @@ def _process_value(value):
     return str(value)
 
 
+def get_title_or_id_from_uid(uid, default=None):
+    """Returns the title or ID from the given UID
+
+    The title is taken from the metadata of the UID catalog, which is up to
+    date on all ZEO clients, so that the referenced object is not loaded.
+
+    :param uid: UID of the referenced object
+    :param default: Value to return if no object was found
+    :returns: Title or ID of the object
+    """
+    brain = api.get_brain_by_uid(uid)
+    if brain is not None:
+        return api.get_title(brain) or api.get_id(brain)
+    # objects not indexed in the UID catalog, e.g. Dexterity contents
+    obj = api.get_object_by_uid(uid, default=None)
+    if obj is None:
+        return default
+    return api.get_title(obj) or api.get_id(obj)
+
+
 def _get_title_or_id_from_uid(uid):
     """Returns the title or ID from the given UID
     """
-    try:
-        obj = api.get_object_by_uid(uid)
-    except api.APIError:
-        return "<Deleted {}>".format(uid)
-    title_or_id = api.get_title(obj) or api.get_id(obj)
-    return title_or_id
+    return get_title_or_id_from_uid(uid, "<Deleted {}>".format(uid))
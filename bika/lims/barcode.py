@@ -24,8 +24,10 @@ import plone.protect
 from Products.CMFCore.WorkflowCore import WorkflowException
 from Products.CMFCore.utils import getToolByName
 
+from bika.lims import api
 from bika.lims.browser import BrowserView
 from bika.lims.catalog import CATALOG_ANALYSIS_REQUEST_LISTING
+from bika.lims.catalog import idlookup
 from bika.lims.permissions import EditResults
 
 
@@ -48,17 +50,13 @@ class barcode_entry(BrowserView):
                 'failure': True,
                 'error': 'No barcode entry submitted'})
 
-        instance = self.resolve_item(entry)
-        if not instance:
+        url = self.resolve_url(entry)
+        if not url:
             return self.return_json({
                 'success': False,
                 'failure': True,
                 'error': 'Cannot resolve ID or Title: %s' % entry})
 
-        url = getattr(self, 'handle_' + instance.portal_type)(instance) \
-            if hasattr(self, 'handle_' + instance.portal_type) \
-            else instance.absolute_url()
-
         return self.return_json({
             'success': True,
             'failure': False,
@@ -70,6 +68,35 @@ class barcode_entry(BrowserView):
         entry = entry.strip()
         return entry
 
+    def resolve_url(self, entry):
+        """Returns the redirect URL for the entry
+
+        The entry is looked up in the ID lookup index first. The lookup index
+        is not filtered by the roles of the user, so the hits are searched by
+        UID in their catalog, which only returns the objects the user is
+        allowed to view. The object is only woken up if there is a handler for
+        its portal type, otherwise the URL is built from the stored path
+        """
+        records = idlookup.lookup(entry, fields=["title", "id"]) or []
+        for record in records:
+            catalog = api.get_catalogs_for(record['portal_type'])[0]
+            brains = catalog(UID=record['uid'])
+            if not brains:
+                continue
+            handler = getattr(self, 'handle_' + record['portal_type'], None)
+            if handler is None:
+                return self.request.physicalPathToURL(record['path'])
+            return handler(api.get_object(brains[0]))
+
+        # Not in the lookup index, search the catalogs
+        instance = self.resolve_item(entry)
+        if not instance:
+            return None
+        handler = getattr(self, 'handle_' + instance.portal_type, None)
+        if handler is None:
+            return instance.absolute_url()
+        return handler(instance)
+
     def resolve_item(self, entry):
         ar_catalog = getToolByName(
             self.context, CATALOG_ANALYSIS_REQUEST_LISTING)
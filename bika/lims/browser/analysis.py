@@ -39,6 +39,9 @@ class JSONReadExtender(object):
     implements(IJSONReadExtender)
     adapts(IAnalysis)
 
+    # keys added to the data, only if requested
+    fields = ("specification", )
+
     def __init__(self, context):
         self.context = context
 
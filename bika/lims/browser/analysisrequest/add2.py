@@ -767,19 +767,38 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
         form = self.request.form
         ar_count = self.get_ar_count()
 
-        records = []
+        records = [{} for arnum in range(ar_count)]
         # Group belonging AR fields together
-        for arnum in range(ar_count):
-            record = {}
-            s1 = "-{}".format(arnum)
-            keys = filter(lambda key: s1 in key, form.keys())
-            for key in keys:
-                new_key = key.replace(s1, "")
-                value = form.get(key)
-                record[new_key] = value
-            records.append(record)
+        for key, value in form.items():
+            name, sep, arnum = key.rpartition("-")
+            if not sep or not arnum.isdigit():
+                continue
+            arnum = int(arnum)
+            if arnum < ar_count:
+                records[arnum][name] = value
         return records
 
+    def get_changed_arnums(self):
+        """Returns the numbers of the columns to recalculate
+
+        The form sends the numbers of the columns that changed since the last
+        recalculation in the `arnums` parameter (comma separated). All columns
+        are returned if the parameter is missing
+        """
+        ar_count = self.get_ar_count()
+        arnums = self.request.form.get("arnums")
+        if arnums is None:
+            return range(ar_count)
+        if isinstance(arnums, basestring):
+            arnums = arnums.split(",")
+        arnums = map(lambda arnum: api.to_int(arnum, -1), arnums)
+        return sorted(set(filter(lambda arnum: 0 <= arnum < ar_count, arnums)))
+
+    def get_record_key(self, record):
+        """Returns a key for the form values of the record passed in
+        """
+        return json.dumps(record, sort_keys=True, default=repr)
+
     def get_uids_from_record(self, record, key):
         """Returns a list of parsed UIDs from a single form field identified by
         the given key.
@@ -1215,33 +1234,51 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
         return info
 
     def ajax_recalculate_records(self):
+        """Returns the metadata of the records of the changed columns
+
+        Only the columns passed in the `arnums` parameter are recalculated,
+        see `get_changed_arnums`. Columns with the same form values share the
+        same metadata, and the info of the objects is computed once per request
+        """
         out = {}
         records = self.get_records()
-        for num_sample, record in enumerate(records):
-            # Get reference fields metadata
-            metadata = self.get_record_metadata(record)
+        # mapping of record key -> metadata
+        recalculated = {}
+        for num_sample in self.get_changed_arnums():
+            record = records[num_sample]
+            key = self.get_record_key(record)
+            if key not in recalculated:
+                recalculated[key] = self.get_recalculated_record(record)
 
-            # Extract additional metadata from this record
-            # service_to_specs
-            service_to_specs = self.get_service_to_specs_info(metadata)
-            metadata.update(service_to_specs)
+            # Set the metadata for current sample number (column)
+            out[num_sample] = recalculated[key]
 
-            # service_to_templates, template_to_services
-            templates_additional = self.get_template_additional_info(metadata)
-            metadata.update(templates_additional)
+        return out
 
-            # service_to_profiles, profiles_to_services
-            profiles_additional = self.get_profiles_additional_info(metadata)
-            metadata.update(profiles_additional)
+    def get_recalculated_record(self, record):
+        """Returns the metadata of a single record (column)
+        """
+        # Get reference fields metadata
+        metadata = self.get_record_metadata(record)
 
-            # dependencies
-            dependencies = self.get_unmet_dependencies_info(metadata)
-            metadata.update(dependencies)
+        # Extract additional metadata from this record
+        # service_to_specs
+        service_to_specs = self.get_service_to_specs_info(metadata)
+        metadata.update(service_to_specs)
 
-            # Set the metadata for current sample number (column)
-            out[num_sample] = metadata
+        # service_to_templates, template_to_services
+        templates_additional = self.get_template_additional_info(metadata)
+        metadata.update(templates_additional)
 
-        return out
+        # service_to_profiles, profiles_to_services
+        profiles_additional = self.get_profiles_additional_info(metadata)
+        metadata.update(profiles_additional)
+
+        # dependencies
+        dependencies = self.get_unmet_dependencies_info(metadata)
+        metadata.update(dependencies)
+
+        return metadata
 
     def get_record_metadata(self, record):
         """Returns the metadata for the record passed in
@@ -1315,22 +1352,18 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
         # We don't expect more than one template, but who knows about future?
         for uid, obj_info in template.items():
             obj = self.get_object_by_uid(uid)
+            # N.B. the info of the template is cached per request
+            template_info = self.get_template_info(obj)
             # profile from the template
-            profile = obj.getAnalysisProfile()
+            profile_uid = template_info["analysis_profile_uid"]
             # add the profile to the other profiles
-            if profile is not None:
-                profile_uid = api.get_uid(profile)
-                if profile_uid not in profiles_metadata:
-                    profile = self.get_object_by_uid(profile_uid)
-                    profile_info = self.get_profile_info(profile)
-                    profiles_metadata[profile_uid] = profile_info
-
-            # get the template analyses
-            # [{'partition': 'part-1', 'service_uid': '...'},
-            # {'partition': 'part-1', 'service_uid': '...'}]
-            analyses = obj.getAnalyses() or []
-            # get all UIDs of the template records
-            service_uids = map(lambda rec: rec.get("service_uid"), analyses)
+            if profile_uid and profile_uid not in profiles_metadata:
+                profile = self.get_object_by_uid(profile_uid)
+                profile_info = self.get_profile_info(profile)
+                profiles_metadata[profile_uid] = profile_info
+
+            # get all UIDs of the template analyses
+            service_uids = template_info["service_uids"]
             # remember a mapping of template uid -> service
             template_to_services[uid] = service_uids
             # remember a mapping of service uid -> templates
@@ -1360,16 +1393,12 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
         profiles = metadata.get("profiles_metadata", {})
         for uid, obj_info in profiles.items():
             obj = self.get_object_by_uid(uid)
-            # get all services of this profile
-            services = obj.getService()
             # get all UIDs of the profile services
-            service_uids = map(api.get_uid, services)
+            service_uids = self.get_profile_service_uids(obj)
             # remember all services of this profile
             profile_to_services[uid] = service_uids
             # remember a mapping of service uid -> profiles
-            for service in services:
-                # get the UID of this service
-                service_uid = api.get_uid(service)
+            for service_uid in service_uids:
                 # remember the profiles of this service
                 if service_uid in service_to_profiles:
                     service_to_profiles[service_uid].append(uid)
@@ -1377,6 +1406,7 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
                     service_to_profiles[service_uid] = [uid]
                 # remember the service metadata
                 if service_uid not in service_metadata:
+                    service = self.get_object_by_uid(service_uid)
                     service_info = self.get_service_info(service)
                     service_metadata[service_uid] = service_info
 
@@ -1393,26 +1423,38 @@ class ajaxAnalysisRequestAddView(AnalysisRequestAddView):
         for uid, obj_info in services.items():
             obj = self.get_object_by_uid(uid)
             # get the dependencies of this service
-            deps = get_service_dependencies_for(obj)
+            deps = self.get_service_dependencies_info(obj)
 
             # check for unmet dependencies
-            for dep in deps["dependencies"]:
+            for dep in deps:
                 # we use the UID to test for equality
-                dep_uid = api.get_uid(dep)
+                dep_uid = dep["uid"]
                 if dep_uid not in services:
                     if uid in unmet_dependencies:
-                        unmet_dependencies[uid].append(self.get_base_info(dep))
+                        unmet_dependencies[uid].append(dep)
                     else:
-                        unmet_dependencies[uid] = [self.get_base_info(dep)]
+                        unmet_dependencies[uid] = [dep]
             # remember the dependencies in the service metadata
             metadata["service_metadata"][uid].update({
-                "dependencies": map(
-                    self.get_base_info, deps["dependencies"]),
+                "dependencies": deps,
             })
         return {
             "unmet_dependencies": unmet_dependencies
         }
 
+    @cache(cache_key)
+    def get_profile_service_uids(self, obj):
+        """Returns the UIDs of the services of the profile
+        """
+        return map(api.get_uid, obj.getService())
+
+    @cache(cache_key)
+    def get_service_dependencies_info(self, obj):
+        """Returns the base info of the services the service depends on
+        """
+        deps = get_service_dependencies_for(obj)
+        return map(self.get_base_info, deps["dependencies"])
+
     def get_objects_info(self, record, key):
         """
         Returns a list with the metadata for the objects the field with
@@ -227,6 +227,9 @@ class JSONReadExtender(object):
     implements(IJSONReadExtender)
     adapts(IAnalysisService)
 
+    # keys added to the data, only if requested
+    fields = ("MethodInstruments", )
+
     def __init__(self, context):
         self.context = context
 
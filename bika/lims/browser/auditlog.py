@@ -24,9 +24,8 @@ from bika.lims import api
 from bika.lims import bikaMessageFactory as _
 from bika.lims.api.snapshot import compare_snapshots
 from bika.lims.api.snapshot import get_snapshot_by_version
+from bika.lims.api.snapshot import get_snapshot_count
 from bika.lims.api.snapshot import get_snapshot_metadata
-from bika.lims.api.snapshot import get_snapshot_version
-from bika.lims.api.snapshot import get_snapshots
 from bika.lims.browser.bika_listing import BikaListingView
 from bika.lims.interfaces import IAuditable
 from bika.lims.utils import t
@@ -178,19 +177,16 @@ class AuditLogView(BikaListingView):
         """Generate folderitems for each version
         """
         items = []
-        # get the snapshots
-        snapshots = get_snapshots(self.context)
-        # reverse the order to get the most recent change first
-        snapshots = list(reversed(snapshots))
         # set the total number of items
-        self.total = len(snapshots)
-        # slice a batch
-        batch = snapshots[self.limit_from:self.limit_from+self.pagesize]
-
-        for snapshot in batch:
+        self.total = get_snapshot_count(self.context)
+        # versions of the batch, most recent change first
+        last_version = self.total - 1 - self.limit_from
+        versions = range(last_version, last_version - self.pagesize, -1)
+
+        for version in filter(lambda v: v >= 0, versions):
+            # only the snapshots of the batch are reconstructed
+            snapshot = get_snapshot_by_version(self.context, version)
             item = self.make_empty_item(**snapshot)
-            # get the version of the snapshot
-            version = get_snapshot_version(self.context, snapshot)
 
             # Version
             item["version"] = version
@@ -34,6 +34,7 @@ from bika.lims import logger
 from bika.lims.api import get_tool
 from bika.lims.api import search
 from bika.lims.browser import BrowserView
+from bika.lims.catalog import aggregates
 from bika.lims.catalog import CATALOG_ANALYSIS_LISTING
 from bika.lims.catalog import CATALOG_ANALYSIS_REQUEST_LISTING
 from bika.lims.catalog import CATALOG_WORKSHEET_LISTING
@@ -47,6 +48,12 @@ from plone.memoize import view as viewcache
 
 DASHBOARD_FILTER_COOKIE = 'dashboard_filter_cookie'
 
+# Search criteria that can be resolved with the aggregated counts
+AGGREGATES_CRITERIA = ['portal_type', 'review_state', 'is_active', 'Creator']
+
+# Review states of the objects that are not active
+INACTIVE_STATES = ['cancelled', 'inactive']
+
 # Supported periodicities for evolution charts
 PERIODICITY_DAILY = "d"
 PERIODICITY_WEEKLY = "w"
@@ -671,6 +678,9 @@ class DashboardView(BrowserView):
         return created
 
     def fill_dates_evo(self, catalog, query):
+        if self.use_aggregates(query):
+            return self._fill_dates_evo_from_aggregates(query,
+                                                        self.periodicity)
         sorted_query = collections.OrderedDict(sorted(query.items()))
         query_json = json.dumps(sorted_query)
         return self._fill_dates_evo(query_json, catalog.id, self.periodicity)
@@ -689,6 +699,46 @@ class DashboardView(BrowserView):
         This is an expensive function that will not be called more than once
         every 2 hours (note cache decorator with `time() // (60 * 60 * 2)
         """
+        # Get the date range
+        date_from, date_to = self.get_date_range(periodicity)
+        query = json.loads(query_json)
+        if 'review_state' in query:
+            del query['review_state']
+        query['sort_on'] = 'created'
+        query['created'] = {'query': (date_from, date_to),
+                            'range': 'min:max'}
+
+        brains = search(query, catalog_name)
+        counts = map(lambda brain: (brain.created, brain.review_state, 1),
+                     brains)
+        return self._build_dates_evo(query['portal_type'], periodicity,
+                                     counts)
+
+    def _fill_dates_evo_from_aggregates(self, query, periodicity):
+        """Returns the same as `_fill_dates_evo`, but computed from the
+        number of items created per day and review state kept in aggregates
+        """
+        date_from, date_to = self.get_date_range(periodicity)
+        portal_type = query['portal_type']
+        daily = aggregates.get_aggregates().daily(
+            portal_type, date_from, date_to, creator=query.get('Creator'))
+        if query.get('is_active'):
+            daily = filter(lambda item: item[1] not in INACTIVE_STATES, daily)
+
+        days = {}
+        counts = []
+        for day, state, count in daily:
+            if day not in days:
+                days[day] = DateTime(day)
+            counts.append((days[day], state, count))
+        return self._build_dates_evo(portal_type, periodicity, counts)
+
+    def _build_dates_evo(self, portal_type, periodicity, counts):
+        """Groups the counts by date and review_state, based on the passed in
+        periodicity
+
+        :param counts: list of (created, review_state, count) tuples
+        """
         outevoidx = {}
         outevo = []
         days = 1
@@ -707,15 +757,9 @@ class DashboardView(BrowserView):
 
         # Get the date range
         date_from, date_to = self.get_date_range(periodicity)
-        query = json.loads(query_json)
-        if 'review_state' in query:
-            del query['review_state']
-        query['sort_on'] = 'created'
-        query['created'] = {'query': (date_from, date_to),
-                            'range': 'min:max'}
 
         otherstate = _('Other status')
-        statesmap = self.get_states_map(query['portal_type'])
+        statesmap = self.get_states_map(portal_type)
         stats = statesmap.values()
         stats.sort()
         stats.append(otherstate)
@@ -733,26 +777,24 @@ class DashboardView(BrowserView):
                 outevoidx[currstr] = len(outevo)-1
             curr = curr + datetime.timedelta(days=days)
 
-        brains = search(query, catalog_name)
-        for brain in brains:
-            created = brain.created
-            state = brain.review_state
+        for created, state, count in counts:
             if state not in statesmap:
-                logger.warn("'%s' State for '%s' not available" % (state, query['portal_type']))
+                logger.warn("'%s' State for '%s' not available" % (state, portal_type))
             state = statesmap[state] if state in statesmap else otherstate
             created = self._getDateStr(periodicity, created)
-            statscount[state] += 1
+            statscount[state] += count
             if created in outevoidx:
                 oidx = outevoidx[created]
                 if state in outevo[oidx]:
-                    outevo[oidx][state] += 1
+                    outevo[oidx][state] += count
                 else:
-                    outevo[oidx][state] = 1
+                    outevo[oidx][state] = count
             else:
                 # Create new row
                 currow = {'date': created,
-                          state: 1}
+                          state: count}
                 outevo.append(currow)
+                outevoidx[created] = len(outevo)-1
 
         # Remove all those states for which there is no data
         rstates = [k for k, v in statscount.items() if v == 0]
@@ -767,11 +809,36 @@ class DashboardView(BrowserView):
         sorted_states.reverse()
         return {'data': outevo, 'states': sorted_states}
 
+    def use_aggregates(self, query):
+        """Checks if the number of items matching with the query can be
+        obtained from the aggregates instead of searching the catalog
+        """
+        if set(query.keys()).difference(AGGREGATES_CRITERIA):
+            return False
+        if query['portal_type'] not in aggregates.SUPPORTED_TYPES:
+            return False
+        return aggregates.is_available()
+
     def search_count(self, query, catalog_name):
+        if self.use_aggregates(query):
+            return self._aggregates_count(query)
         sorted_query = collections.OrderedDict(sorted(query.items()))
         query_json = json.dumps(sorted_query)
         return self._search_count(query_json, catalog_name)
 
+    def _aggregates_count(self, query):
+        portal_type = query['portal_type']
+        counter = aggregates.get_aggregates()
+        states = query.get('review_state')
+        if states is None:
+            states = counter.get_review_states(portal_type)
+        elif isinstance(states, basestring):
+            states = [states]
+        if query.get('is_active'):
+            states = filter(lambda st: st not in INACTIVE_STATES, states)
+        return counter.count(portal_type, review_states=states,
+                             creator=query.get('Creator'))
+
     @viewcache.memoize
     def _search_count(self, query_json, catalog_name):
         query = json.loads(query_json)
@@ -840,3 +907,13 @@ class DashboardViewPermissionUpdate(BrowserView):
         registry_info[section_name] = get_unicode(role_permissions)
         set_dashboard_registry_record(registry_info)
         return True
+
+
+class RebuildDashboardAggregatesView(BrowserView):
+    """Rebuilds the aggregated counts displayed in the dashboard from the
+    catalogs
+    """
+
+    def __call__(self):
+        counter = aggregates.rebuild()
+        return "{} objects aggregated".format(len(counter))
@@ -106,6 +106,9 @@ class ARAnalysesField(ObjectField):
         :type specs: list
         :param hidden: List of AnalysisService UID -> Hidden mappings
         :type hidden: list
+        :param dependencies: Dependencies of the services passed in, resolved
+                             from the services if None
+        :type dependencies: list
         :returns: list of new assigned Analyses
         """
         if items is None:
@@ -131,8 +134,10 @@ class ARAnalysesField(ObjectField):
         services = filter(None, map(self._to_service, items))
 
         # Calculate dependencies
-        dependencies = map(lambda s: s.getServiceDependencies(), services)
-        dependencies = list(itertools.chain.from_iterable(dependencies))
+        dependencies = kw.get("dependencies")
+        if dependencies is None:
+            dependencies = map(lambda s: s.getServiceDependencies(), services)
+            dependencies = list(itertools.chain.from_iterable(dependencies))
 
         # Merge dependencies and services
         services = set(services + dependencies)
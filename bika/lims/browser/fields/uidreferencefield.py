@@ -19,11 +19,12 @@
 # Some rights reserved, see README and LICENSE.
 
 from AccessControl import ClassSecurityInfo
+from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOTreeSet
 from Products.Archetypes.Field import Field, StringField
 from bika.lims import logger
 from bika.lims import api
 from bika.lims.interfaces.field import IUIDReferenceField
-from persistent.list import PersistentList
 from persistent.dict import PersistentDict
 from zope.annotation.interfaces import IAnnotations
 from zope.interface import implements
@@ -70,9 +71,8 @@ class UIDReferenceField(StringField):
         # N.B. only like this we get the persistent mapping!
         backrefs = get_backreferences(source, relationship=None)
         if key not in backrefs:
-            backrefs[key] = PersistentList()
-        if target_uid not in backrefs[key]:
-            backrefs[key].append(target_uid)
+            backrefs[key] = OOTreeSet()
+        backrefs[key].insert(target_uid)
         return True
 
     def unlink_reference(self, source, target):
@@ -300,10 +300,39 @@ def _get_object(context, value):
 
 
 def get_storage(context):
+    """Get or create the backreferences storage of the given object
+
+    The storage maps each relationship to an `OOTreeSet` of UIDs. Storages
+    of the former format (dict of lists) are migrated
+
+    :param context: The object which is the target of references
+    :returns: OOBTree
+    """
+    annotation = IAnnotations(context)
+    storage = annotation.get(BACKREFS_STORAGE)
+    if storage is None:
+        storage = annotation[BACKREFS_STORAGE] = OOBTree()
+    elif isinstance(storage, PersistentDict):
+        storage = migrate_storage(context)
+    return storage
+
+
+def migrate_storage(context):
+    """Migrates the backreferences storage from a dict of UID lists to a
+    BTree of UID sets
+
+    :param context: The object which is the target of references
+    :returns: the migrated storage or None if the object had no storage
+    """
     annotation = IAnnotations(context)
-    if annotation.get(BACKREFS_STORAGE) is None:
-        annotation[BACKREFS_STORAGE] = PersistentDict()
-    return annotation[BACKREFS_STORAGE]
+    storage = annotation.get(BACKREFS_STORAGE)
+    if not isinstance(storage, PersistentDict):
+        return storage
+    migrated = OOBTree()
+    for relationship, uids in storage.items():
+        migrated[relationship] = OOTreeSet(uids)
+    annotation[BACKREFS_STORAGE] = migrated
+    return migrated
 
 
 def _get_catalog_for_uid(uid):
@@ -342,8 +371,8 @@ def get_backreferences(context, relationship=None, as_brains=None):
 
     - If the relationship is not provided, then the entire set of
       backreferences to the context object is returned (by reference) as a
-      dictionary.  This value can then be modified in-place, to edit the stored
-      backreferences.
+      mapping of relationship -> set of UIDs.  This value can then be modified
+      in-place, to edit the stored backreferences.
     """
 
     instance = context.aq_base
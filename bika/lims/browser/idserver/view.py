@@ -71,7 +71,7 @@ class IDServerView(BrowserView):
                     message = _("Could not convert '{}' to an integer"
                                 .format(value))
                 elif value == 0:
-                    del self.storage[key]
+                    self.storage.delete_number(key)
                     message = _("Removed key {} from storage".format(key))
                 else:
                     self.set_seed(key, value)
@@ -89,8 +89,8 @@ class IDServerView(BrowserView):
 
     @property
     def storage(self):
-        number_generator = getUtility(INumberGenerator)
-        return number_generator.storage
+        # the number generator maps each key to its last generated number
+        return getUtility(INumberGenerator)
 
     def add_status_message(self, message, level="info"):
         """Set a portal status message
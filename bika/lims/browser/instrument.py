@@ -33,6 +33,7 @@ from bika.lims.catalog.analysis_catalog import CATALOG_ANALYSIS_LISTING
 from bika.lims.content.instrumentmaintenancetask import \
     InstrumentMaintenanceTaskStatuses as mstatus
 from bika.lims.utils import get_image, get_link, t
+from bika.lims.utils.instrument import sweep_instruments_validity
 from plone.app.layout.globals.interfaces import IViewView
 from Products.CMFCore.utils import getToolByName
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
@@ -881,3 +882,14 @@ class ajaxGetInstrumentMethods(BrowserView):
                     "title": method.Title(),
                 })
         return json.dumps(out)
+
+
+class UpdateInstrumentsValidityView(BrowserView):
+    """Updates the validity of the instruments whose certification,
+    calibration or validation periods started or ended since the last update.
+    Meant to be called periodically, e.g. from a cron job
+    """
+
+    def __call__(self):
+        changed = sweep_instruments_validity()
+        return json.dumps(map(api.get_uid, changed))
@@ -45,6 +45,8 @@
       this.get_portal_url = bind(this.get_portal_url, this);
       this.update_form = bind(this.update_form, this);
       this.recalculate_prices = bind(this.recalculate_prices, this);
+      this.get_records_hashes = bind(this.get_records_hashes, this);
+      this.get_arnum_from_name = bind(this.get_arnum_from_name, this);
       this.recalculate_records = bind(this.recalculate_records, this);
       this.get_flush_settings = bind(this.get_flush_settings, this);
       this.get_global_settings = bind(this.get_global_settings, this);
@@ -63,6 +65,7 @@
       this.global_settings = {};
       this.flush_settings = {};
       this.records_snapshot = {};
+      this.records_hashes = {};
       this.applied_templates = {};
       $(".blurrable").removeClass("blurrable");
       this.bind_eventhandler();
@@ -212,15 +215,103 @@
     AnalysisRequestAdd.prototype.recalculate_records = function() {
 
       /*
-       * Submit all form values to the server to recalculate the records
+       * Submit the form values of the changed columns to the server to
+       * recalculate their records
        */
-      return this.ajax_post_form("recalculate_records").done(function(records) {
+      var arnums, form_data, hashes, names;
+      hashes = this.get_records_hashes();
+      arnums = [];
+      $.each(hashes, (function(_this) {
+        return function(arnum, hash) {
+          if (_this.records_hashes[arnum] !== hash) {
+            return arnums.push(arnum);
+          }
+        };
+      })(this));
+      if (arnums.length === 0) {
+        console.debug("Recalculate Analyses: No columns changed");
+        return;
+      }
+      form_data = new FormData(this.get_form()[0]);
+      names = [];
+      form_data.forEach((function(_this) {
+        return function(value, name) {
+          var arnum;
+          arnum = _this.get_arnum_from_name(name);
+          if ((arnum != null) && indexOf.call(arnums, arnum) < 0) {
+            return names.push(name);
+          }
+        };
+      })(this));
+      $.each(names, function(index, name) {
+        return form_data["delete"](name);
+      });
+      form_data.append("arnums", arnums.join(","));
+      return this.ajax_post_form("recalculate_records", {
+        data: form_data
+      }).done(function(records) {
         console.debug("Recalculate Analyses: Records=", records);
-        this.records_snapshot = records;
+        $.each(records, (function(_this) {
+          return function(arnum, record) {
+            _this.records_snapshot[arnum] = record;
+            return _this.records_hashes[arnum] = hashes[arnum];
+          };
+        })(this));
         return $(this).trigger("data:updated", records);
       });
     };
 
+    AnalysisRequestAdd.prototype.get_arnum_from_name = function(name) {
+
+      /*
+       * Returns the column number of the form field name, e.g. "Contact-0",
+       * "Analyses-0:list" or "Specification-0.uid:records"
+       */
+      var match;
+      match = /-(\d+)(\.\w+)?(:\w+)*$/.exec(name);
+      if (!match) {
+        return null;
+      }
+      return match[1];
+    };
+
+    AnalysisRequestAdd.prototype.get_records_hashes = function() {
+
+      /*
+       * Returns a mapping of arnum -> hash of the form values of the column
+       */
+      var form_data, hashes, values;
+      values = {};
+      form_data = new FormData(this.get_form()[0]);
+      form_data.forEach((function(_this) {
+        return function(value, name) {
+          var arnum;
+          arnum = _this.get_arnum_from_name(name);
+          if (arnum == null) {
+            return;
+          }
+          if (value instanceof File) {
+            value = value.name;
+          }
+          if (values[arnum] == null) {
+            values[arnum] = [];
+          }
+          return values[arnum].push(name + "=" + value);
+        };
+      })(this));
+      hashes = {};
+      $.each(values, function(arnum, items) {
+        var hash, i, j, ref, text;
+        text = items.sort().join("\n");
+        hash = 0;
+        for (i = j = 0, ref = text.length; 0 <= ref ? j < ref : j > ref; i = 0 <= ref ? ++j : --j) {
+          hash = ((hash << 5) - hash + text.charCodeAt(i)) | 0;
+        }
+        return hashes[arnum] = hash;
+      });
+      return hashes;
+    };
+
     AnalysisRequestAdd.prototype.recalculate_prices = function() {
 
       /*
@@ -253,9 +344,9 @@
       var me;
       console.debug("*** update_form ***");
       me = this;
-      $(".service-lockbtn").hide();
       return $.each(records, function(arnum, record) {
         var discard;
+        $(".service-lockbtn[arnum=" + arnum + "]").hide();
         discard = ["service_metadata", "specification_metadata", "template_metadata"];
         $.each(record, function(name, metadata) {
           if (indexOf.call(discard, name) >= 0 || !name.endsWith("_metadata")) {
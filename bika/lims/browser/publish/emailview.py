@@ -21,13 +21,19 @@
 import inspect
 import itertools
 import re
+import uuid
 from collections import OrderedDict
+from collections import defaultdict
 from string import Template
 
 import transaction
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.SecurityManagement import noSecurityManager
+from AccessControl.SpecialUsers import system
 from bika.lims import _
 from bika.lims import api
 from bika.lims import logger
+from bika.lims import mailspool
 from bika.lims.api import mail as mailapi
 from bika.lims.api.security import get_user
 from bika.lims.api.security import get_user_id
@@ -40,12 +46,80 @@ from Products.CMFCore.WorkflowCore import WorkflowException
 from Products.CMFPlone.utils import safe_unicode
 from Products.Five.browser import BrowserView
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+from ZODB.POSException import ConflictError
 from ZODB.POSException import POSKeyError
+from zope.component.hooks import setSite
 from zope.interface import implements
 from zope.publisher.interfaces import IPublishTraverse
 
 DEFAULT_MAX_EMAIL_SIZE = 15
 
+# Max attempts to write the delivery status to the send log on conflicts
+SENDLOG_RETRIES = 3
+
+
+def set_email_status(envelope, status):
+    """Sets the delivery status of the spooled email in the send log records
+    of the reports
+    """
+    info = envelope["info"]
+    to_addr = envelope["to_addr"]
+    for uid in info.get("reports", []):
+        report = api.get_object_by_uid(uid, default=None)
+        if report is None:
+            continue
+        records = map(dict, report.getSendLog())
+        for record in records:
+            if record.get("email_id") != info.get("email_id"):
+                continue
+            email_status = dict(record.get("email_status") or {})
+            email_status[to_addr] = {
+                "status": status,
+                "attempts": envelope["attempts"],
+                "error": envelope["error"],
+                "date": DateTime().ISO8601(),
+            }
+            record["email_status"] = email_status
+        report.setSendLog(records)
+
+
+def update_sendlog(results):
+    """Writes the delivery status of spooled emails to the send log of the
+    reports they were sent for
+
+    Called by the mail spool worker thread, outside of any request
+
+    :param results: list of (envelope, status) tuples
+    """
+    import Zope2
+    by_site = defaultdict(list)
+    for envelope, status in results:
+        site_path = envelope["info"].get("site")
+        if site_path:
+            by_site[site_path].append((envelope, status))
+    if not by_site:
+        return
+
+    app = Zope2.app()
+    newSecurityManager(None, system)
+    try:
+        for site_path, items in by_site.items():
+            setSite(app.unrestrictedTraverse(site_path))
+            for attempt in range(SENDLOG_RETRIES):
+                try:
+                    for envelope, status in items:
+                        set_email_status(envelope, status)
+                    transaction.commit()
+                    break
+                except ConflictError:
+                    transaction.abort()
+                    app._p_jar.sync()
+    finally:
+        transaction.abort()
+        setSite(None)
+        noSecurityManager()
+        app._p_jar.close()
+
 
 class EmailView(BrowserView):
     """Email Attachments View
@@ -63,6 +137,8 @@ class EmailView(BrowserView):
         self.traverse_subpath = []
         # toggle to allow email sending
         self.allow_send = True
+        # id of the emails in the send log records of the reports
+        self.email_id = uuid.uuid4().hex
 
     def __call__(self):
         # dispatch subpath request to `ajax_` methods
@@ -394,6 +470,11 @@ class EmailView(BrowserView):
         email_subject = self.email_subject
         email_body = self.render_email_template(self.email_body)
         email_attachments = map(api.get_uid, self.attachments)
+        # delivery status per email address, updated by the mail spool
+        email_status = {}
+        for recipient in self.email_recipients_and_responsibles:
+            address = mailapi.parse_email_address(recipient)[1]
+            email_status[address] = {"status": mailspool.QUEUED}
 
         record = {
             "actor": actor,
@@ -404,7 +485,8 @@ class EmailView(BrowserView):
             "email_subject": email_subject,
             "email_body": email_body,
             "email_attachments": email_attachments,
-
+            "email_id": self.email_id,
+            "email_status": email_status,
         }
         # keywords take precedence
         record.update(kw)
@@ -483,15 +565,26 @@ class EmailView(BrowserView):
         return email_template
 
     def send_email(self, recipients, subject, body, attachments=None):
-        """Prepare and send email to the recipients
+        """Prepare and queue the email to the recipients
+
+        The message with the attachments is built once. A copy for each
+        recipient is delivered by the mail spool in the background after the
+        transaction commits.
 
         :param recipients: a list of email or name,email strings
         :param subject: the email subject
         :param body: the email body
         :param attachments: list of email attachments
-        :returns: True if all emails were sent, else False
+        :returns: True if all emails were queued, else False
         """
         email_body = self.render_email_template(body)
+        mime_msg = mailapi.compose_email(self.email_sender_address,
+                                         "",
+                                         subject,
+                                         email_body,
+                                         attachments=attachments)
+        site_path = api.get_path(self.portal)
+        report_uids = map(api.get_uid, self.reports)
 
         success = []
         # Send one email per recipient
@@ -500,18 +593,24 @@ class EmailView(BrowserView):
             # Recipient address rejected: User unknown in local recipient table
             pair = mailapi.parse_email_address(recipient)
             to_address = pair[1]
-            mime_msg = mailapi.compose_email(self.email_sender_address,
-                                             to_address,
-                                             subject,
-                                             email_body,
-                                             attachments=attachments)
-            sent = mailapi.send_email(mime_msg)
-            if not sent:
+            mime_msg.replace_header("To", mailapi.to_email_address(to_address))
+            try:
+                mailspool.queue_email(self.email_sender_address,
+                                      to_address,
+                                      mime_msg,
+                                      site=site_path,
+                                      reports=report_uids,
+                                      email_id=self.email_id)
+                queued = True
+            except EnvironmentError as e:
+                logger.error(e)
+                queued = False
+            if not queued:
                 msg = _("Could not send email to {0} ({1})").format(pair[0],
                                                                     pair[1])
                 self.add_status_message(msg, "warning")
                 logger.error(msg)
-            success.append(sent)
+            success.append(queued)
 
         if not all(success):
             return False
@@ -18,15 +18,13 @@
 # Copyright 2018-2020 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
-import StringIO
-import csv
-import datetime
-from collections import OrderedDict
-
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims import api
 from bika.lims import bikaMessageFactory as _
 from bika.lims.browser import BrowserView
+from bika.lims.browser.reports.streaming import OUTPUT_FORMATS
+from bika.lims.browser.reports.streaming import get_writer
+from bika.lims.browser.reports.streaming import iter_brains
 from bika.lims.catalog.analysis_catalog import CATALOG_ANALYSIS_LISTING
 from bika.lims.utils import formatDateQuery, formatDateParms, logged_in_client
 from bika.lims.utils import t
@@ -58,7 +56,7 @@ class Report(BrowserView):
         parms = []
 
         # Base query
-        query = dict(portal_type="Analysis", sort_on='getClientTitle')
+        query = dict(portal_type="Analysis")
 
         # Filter by client
         self.add_filter_by_client(query, parms)
@@ -69,34 +67,35 @@ class Report(BrowserView):
         # Filter analyses by review_state
         self.add_filter_by_review_state(query, parms)
 
-        # Fetch and fill data
-        data = OrderedDict()
-        analyses = api.search(query, CATALOG_ANALYSIS_LISTING)
-        total_num_analyses = len(analyses)
+        # Fetch and fill data in a single pass from catalog metadata
+        data = {}
+        total_num_analyses = 0
         total_num_ars = 0
-        for analysis in analyses:
+        for analysis in iter_brains(query, CATALOG_ANALYSIS_LISTING):
             client = analysis.getClientTitle
-            data_client = data.get(client, {})
+            data_client = data.get(client)
+            if data_client is None:
+                data_client = data[client] = {"requests": set(),
+                                              "analyses": 0}
             request = analysis.getRequestID
-            requests = data_client.get("requests", [])
-            if request not in requests:
-                requests += [request]
-                data_client["requests"] = requests
+            if request not in data_client["requests"]:
+                data_client["requests"].add(request)
                 total_num_ars += 1
-            data_client["analyses"] = data_client.get("analyses", 0) + 1
-            data[client] = data_client
+            data_client["analyses"] += 1
+            total_num_analyses += 1
 
         # Generate datalines
         data_lines = list()
-        for client, data in data.items():
-            ars_count = len(data.get('requests', []))
-            ans_count = data.get('analyses', 0)
+        for client in sorted(data.keys()):
+            ars_count = len(data[client]["requests"])
+            ans_count = data[client]["analyses"]
             data_lines.append([{"value": client},
                                {"value": ars_count},
                                {"value": ans_count}])
 
-        if self.request.get('output_format', '') == 'CSV':
-            return self.generate_csv(data_lines)
+        output_format = self.request.get('output_format', '')
+        if output_format in OUTPUT_FORMATS:
+            return self.generate_csv(data_lines, output_format)
 
         self.report_content = {
             'headings': self.headings,
@@ -153,30 +152,16 @@ class Report(BrowserView):
         state = workflow.getTitleForStateOnType(query[index], 'Analysis')
         out_params.append({'title': title, 'value': state, 'type': 'text'})
 
-    def generate_csv(self, data_lines):
-        """Generates and writes a CSV to request's reposonse
+    def generate_csv(self, data_lines, output_format="CSV"):
+        """Writes the data lines as CSV or XLSX to request's response
         """
         fieldnames = [
             'Client',
             'Samples',
             'Analyses',
         ]
-        output = StringIO.StringIO()
-        dw = csv.DictWriter(output, extrasaction='ignore',
-                            fieldnames=fieldnames)
-        dw.writerow(dict((fn, fn) for fn in fieldnames))
+        writer = get_writer(output_format, self.request.RESPONSE,
+                            "analysesperclient", fieldnames)
         for row in data_lines:
-            dw.writerow({
-                'Client': row[0]['value'],
-                'Samples': row[1]['value'],
-                'Analyses': row[2]['value'],
-            })
-        report_data = output.getvalue()
-        output.close()
-
-        date = datetime.datetime.now().strftime("%Y%m%d%H%M")
-        setheader = self.request.RESPONSE.setHeader
-        setheader('Content-Type', 'text/csv')
-        setheader("Content-Disposition",
-                  "attachment;filename=\"analysesperclient_%s.csv\"" % date)
-        self.request.RESPONSE.write(report_data)
+            writer.writerow(map(lambda col: col['value'], row))
+        writer.close()
@@ -23,13 +23,35 @@ from bika.lims.browser import BrowserView
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
 from bika.lims import api
 from bika.lims import bikaMessageFactory as _
+from bika.lims.browser.reports.streaming import OUTPUT_FORMATS
+from bika.lims.browser.reports.streaming import get_writer
+from bika.lims.browser.reports.streaming import iter_brains
 from bika.lims.utils import t
 from bika.lims.utils import formatDateQuery, formatDateParms, \
     logged_in_client
+from DateTime import DateTime
 from plone.app.layout.globals.interfaces import IViewView
 from zope.interface import implements
 
 
+def get_earliness(analysis, now):
+    """Returns the remaining time in minutes for the analysis to be completed
+    within its maximum turnaround time, computed from the catalog metadata as
+    `getEarliness` of the analysis does. The analysis is late if the earliness
+    is negative. Returns zero if the analysis has no turnaround time set
+    """
+    tat = analysis.getMaxTimeAllowed
+    if not tat:
+        return 0
+    max_minutes = api.to_minutes(**tat)
+    # routine analyses are ready to process once the sample is received
+    start = analysis.getDateReceived
+    if not start:
+        return max_minutes
+    end = analysis.getDateVerified or now
+    return max_minutes - (end - start) * 24 * 60
+
+
 class Report(BrowserView):
     implements(IViewView)
     template = ViewPageTemplateFile("templates/report_out.pt")
@@ -79,11 +101,12 @@ class Report(BrowserView):
 
         query['review_state'] = 'published'
 
+        # Analyses are aggregated in a single pass from catalog metadata,
+        # without waking up the objects
         services = {}
-        analyses = bc(query)
-        for a in analyses:
-            analysis = a.getObject()
-            service_uid = analysis.getServiceUID()
+        now = DateTime()
+        for analysis in iter_brains(query, bc.getId()):
+            service_uid = analysis.getServiceUID
             if service_uid not in services:
                 services[service_uid] = {'count_early': 0,
                                          'count_late': 0,
@@ -91,7 +114,7 @@ class Report(BrowserView):
                                          'mins_late': 0,
                                          'count_undefined': 0,
                 }
-            earliness = analysis.getEarliness()
+            earliness = get_earliness(analysis, now)
             if earliness < 0:
                 count_late = services[service_uid]['count_late']
                 mins_late = services[service_uid]['mins_late']
@@ -286,11 +309,8 @@ class Report(BrowserView):
             'datalines': datalines,
             'footings': footlines}
 
-        if self.request.get('output_format', '') == 'CSV':
-            import csv
-            import StringIO
-            import datetime
-
+        output_format = self.request.get('output_format', '')
+        if output_format in OUTPUT_FORMATS:
             fieldnames = [
                 'Analysis',
                 'Count',
@@ -300,31 +320,14 @@ class Report(BrowserView):
                 'Early',
                 'Average early',
             ]
-            output = StringIO.StringIO()
-            dw = csv.DictWriter(output, extrasaction='ignore',
-                                fieldnames=fieldnames)
-            dw.writerow(dict((fn, fn) for fn in fieldnames))
+            writer = get_writer(output_format, self.request.RESPONSE,
+                                "analysestats", fieldnames)
             for row in datalines:
                 if len(row) == 1:
                     # category heading thingy
                     continue
-                dw.writerow({
-                    'Analysis': row[0]['value'],
-                    'Count': row[1]['value'],
-                    'Undefined': row[2]['value'],
-                    'Late': row[3]['value'],
-                    'Average late': row[4]['value'],
-                    'Early': row[5]['value'],
-                    'Average early': row[6]['value'],
-                })
-            report_data = output.getvalue()
-            output.close()
-            date = datetime.datetime.now().strftime("%Y%m%d%H%M")
-            setheader = self.request.RESPONSE.setHeader
-            setheader('Content-Type', 'text/csv')
-            setheader("Content-Disposition",
-                      "attachment;filename=\"analysestats_%s.csv\"" % date)
-            self.request.RESPONSE.write(report_data)
+                writer.writerow(map(lambda col: col['value'], row))
+            writer.close()
         else:
             return {'report_title': t(headings['header']),
                     'report_data': self.template()}
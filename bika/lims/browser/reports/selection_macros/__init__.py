@@ -22,6 +22,7 @@ from Products.CMFCore.utils import getToolByName
 from zope.i18n import translate
 from bika.lims.browser import BrowserView
 from Products.Five.browser.pagetemplatefile import ViewPageTemplateFile
+from bika.lims.browser.reports.streaming import OUTPUT_FORMATS
 from bika.lims.utils import getUsers
 from bika.lims import bikaMessageFactory as _
 from bika.lims import PMF
@@ -486,4 +487,13 @@ class SelectionMacrosView(BrowserView):
     @ram.cache(_cache_key_select_output_format)
     def select_output_format(self, style=None):
         self.style = style
+        self.output_formats = ["PDF", "CSV"]
+        return self.select_output_format_pt()
+
+    @ram.cache(_cache_key_select_output_format)
+    def select_streamed_output_format(self, style=None):
+        """Output formats of the reports that support streamed output
+        """
+        self.style = style
+        self.output_formats = ["PDF"] + OUTPUT_FORMATS
         return self.select_output_format_pt()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+
+"""Helpers for reports that are computed from catalog metadata only
+
+`iter_brains` searches the catalog window by window over a date index, so
+only the brains of a single window are kept in memory, while the report
+aggregates the values of the brains in a single pass.
+
+`CSVWriter` and `XLSXWriter` write the rows of a report to the response in
+chunks, instead of building the whole output in memory first.
+"""
+
+import StringIO
+import csv
+import datetime
+import os
+import tempfile
+
+from bika.lims import api
+from bika.lims.utils import to_utf8
+from DateTime import DateTime
+
+# Number of rows written to the response at once
+CHUNK_ROWS = 500
+
+# Size of the chunks of binary output written to the response
+CHUNK_SIZE = 1 << 16
+
+# Number of days searched at once by iter_brains
+WINDOW_DAYS = 30
+
+# Supported output formats for streamed reports
+OUTPUT_FORMATS = ["CSV", "XLSX"]
+
+
+def get_date_range(query, date_index, catalog):
+    """Returns the (from, to) DateTime range of the date index to search for.
+    Missing bounds are resolved with the earliest indexed date and now
+    """
+    date_query = query.get(date_index) or {}
+    value = date_query.get("query")
+    range_ = date_query.get("range", "")
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    value = filter(None, value)
+    date_from = date_to = None
+    if range_ == "min:max" and len(value) == 2:
+        date_from, date_to = value
+    elif range_ == "min" and value:
+        date_from = value[0]
+    elif range_ == "max" and value:
+        date_to = value[0]
+
+    if date_from is None:
+        earliest = dict(query, sort_on=date_index, sort_order="ascending",
+                        sort_limit=1)
+        earliest.pop(date_index, None)
+        brains = api.search(earliest, catalog)[:1]
+        if not brains:
+            return None, None
+        date_from = getattr(brains[0], date_index, None)
+        if callable(date_from):
+            date_from = date_from()
+        if not date_from:
+            return None, None
+    return DateTime(date_from), DateTime(date_to or DateTime())
+
+
+def iter_brains(query, catalog, date_index="created", days=WINDOW_DAYS):
+    """Yields the brains matching with the query, searching the catalog in
+    windows of the given number of days over the date index
+
+    :param query: catalog query. The criteria for the date index, if any, set
+        the range of dates to search for
+    :param catalog: id of the catalog to search
+    :param date_index: DateIndex to split the search by
+    :param days: number of days of each window
+    """
+    date_from, date_to = get_date_range(query, date_index, catalog)
+    if date_from is None:
+        return
+    query = dict(query)
+    query.pop("sort_on", None)
+    query.pop("sort_order", None)
+
+    # DateIndex has a resolution of minutes: windows do not overlap if they
+    # end one minute before the next one starts
+    minute = 1.0 / 24 / 60
+    start = date_from
+    while start <= date_to:
+        end = min(start + days - minute, date_to)
+        query[date_index] = {"query": (start, end), "range": "min:max"}
+        for brain in api.search(query, catalog):
+            yield brain
+        start = start + days
+
+
+def get_filename(prefix, output_format):
+    date = datetime.datetime.now().strftime("%Y%m%d%H%M")
+    return "{}_{}.{}".format(prefix, date, output_format.lower())
+
+
+def get_writer(output_format, response, filename_prefix, fieldnames):
+    """Returns the writer for the given output format
+    """
+    if output_format == "XLSX":
+        return XLSXWriter(response, filename_prefix, fieldnames)
+    return CSVWriter(response, filename_prefix, fieldnames)
+
+
+class CSVWriter(object):
+    """Writes the rows of a report as CSV to the response in chunks
+    """
+    content_type = "text/csv"
+    output_format = "CSV"
+
+    def __init__(self, response, filename_prefix, fieldnames):
+        self.response = response
+        self.filename = get_filename(filename_prefix, self.output_format)
+        self.fieldnames = fieldnames
+        self.started = False
+        self.open()
+        self.writerow(fieldnames)
+
+    def open(self):
+        self.buffer = StringIO.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = 0
+
+    def start(self):
+        """Sets the response headers before the first chunk is written
+        """
+        if self.started:
+            return
+        setheader = self.response.setHeader
+        setheader("Content-Type", self.content_type)
+        setheader("Content-Disposition",
+                  "attachment;filename=\"{}\"".format(self.filename))
+        self.started = True
+
+    def writerow(self, row):
+        self.writer.writerow(map(to_utf8, row))
+        self.pending += 1
+        if self.pending >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        self.start()
+        data = self.buffer.getvalue()
+        if data:
+            self.response.write(data)
+        self.buffer.close()
+        self.open()
+
+    def close(self):
+        self.flush()
+        self.buffer.close()
+
+
+class XLSXWriter(CSVWriter):
+    """Writes the rows of a report to a XLSX workbook in optimized mode, which
+    keeps the rows in temporary files instead of memory, and streams the
+    resulting file to the response in chunks
+    """
+    content_type = \
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    output_format = "XLSX"
+
+    def open(self):
+        from openpyxl.workbook import Workbook
+        self.workbook = Workbook(optimized_write=True)
+        self.worksheet = self.workbook.create_sheet()
+
+    def writerow(self, row):
+        self.worksheet.append(map(lambda value: isinstance(
+            value, basestring) and to_utf8(value) or value, row))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            self.workbook.save(path)
+            self.start()
+            self.response.setHeader("Content-Length", os.path.getsize(path))
+            with open(path, "rb") as xlsx:
+                chunk = xlsx.read(CHUNK_SIZE)
+                while chunk:
+                    self.response.write(chunk)
+                    chunk = xlsx.read(CHUNK_SIZE)
+        finally:
+            os.remove(path)
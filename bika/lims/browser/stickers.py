@@ -20,7 +20,6 @@
 
 import os
 import os.path
-import tempfile
 import traceback
 
 from bika.lims import api
@@ -286,9 +285,7 @@ class Sticker(BrowserView):
         reporthtml = "<html><head>{0}</head><body>{1}</body></html>"
         reporthtml = reporthtml.format(style, html)
         reporthtml = safe_unicode(reporthtml).encode("utf-8")
-        pdf_fn = tempfile.mktemp(suffix=".pdf")
-        pdf_file = createPdf(htmlreport=reporthtml, outfile=pdf_fn)
-        return pdf_file
+        return createPdf(htmlreport=reporthtml)
 
     def _resolve_number_of_copies(self, items):
         """For the given objects generate as many copies as the desired number
@@ -24,6 +24,7 @@ from collections import defaultdict
 from bika.lims import api
 from bika.lims import bikaMessageFactory as _
 from bika.lims import logger
+from bika.lims.api.analysis import calculate_results
 from bika.lims.api.analysis import is_out_of_range
 from bika.lims.browser.referenceanalysis import AnalysesRetractedListReport
 from bika.lims.browser.workflow import WorkflowActionGenericAdapter
@@ -109,6 +110,10 @@ class WorkflowActionSubmitAdapter(WorkflowActionGenericAdapter):
             if result != analysis.getResult():
                 analysis.setResult(result)
 
+        # Calculate the results of analyses with a calculation and without a
+        # result set, all at once grouped by calculation
+        calculate_results(filter(IAnalysis.providedBy, objects))
+
         # Submit all analyses
         transitioned = self.do_action(action, objects)
         if not transitioned:
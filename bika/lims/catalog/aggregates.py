@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+
+"""Aggregated counts of Samples, Analyses and Worksheets
+
+Keeps the number of objects per portal type, review state, creation day,
+client, department and creator, so that the dashboard panels and evolution
+charts are computed from a few hundred counters instead of searching and
+iterating the catalogs on every request.
+
+Counters are `BTrees.Length.Length` objects, which resolve conflicts of
+concurrent transactions. Counters are never removed, because a removal would
+not conflict with a concurrent change of the same counter.
+
+The aggregates are maintained by the `AggregatesProcessor` indexing queue
+processor and rebuilt from the catalog metadata by `rebuild`.
+"""
+
+from Acquisition import aq_base
+from BTrees.Length import Length
+from BTrees.OOBTree import OOBTree
+from bika.lims import api
+from bika.lims import logger
+from bika.lims.catalog import CATALOG_ANALYSIS_LISTING
+from bika.lims.catalog import CATALOG_ANALYSIS_REQUEST_LISTING
+from bika.lims.catalog import CATALOG_WORKSHEET_LISTING
+from bika.lims.catalog import SETUP_CATALOG
+from bika.lims.config import USE_COLLECTIVE_INDEXING
+from bika.lims.utils import to_utf8
+from persistent import Persistent
+from zope.annotation.interfaces import IAnnotations
+from zope.interface import implements
+
+if USE_COLLECTIVE_INDEXING:
+    from collective.indexing.interfaces import IIndexQueueProcessor
+
+STORAGE_KEY = "bika.lims.aggregates"
+
+# Portal types counted and the catalog to rebuild their counters from
+SUPPORTED_TYPES = {
+    "AnalysisRequest": CATALOG_ANALYSIS_REQUEST_LISTING,
+    "Analysis": CATALOG_ANALYSIS_LISTING,
+    "Worksheet": CATALOG_WORKSHEET_LISTING,
+}
+
+# Format of the creation day of the objects
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def get_record(portal_type, review_state, created, client_uid="",
+               department_uid="", creator=""):
+    """Returns the record of an object as it is kept in the aggregates:
+    (portal_type, review_state, day, client, department, creator)
+    """
+    day = created and created.strftime(DAY_FORMAT) or ""
+    return tuple(map(lambda value: to_utf8(value or ""), (
+        portal_type, review_state, day, client_uid, department_uid, creator)))
+
+
+def get_object_record(obj):
+    """Returns the record of the object passed in
+    """
+    portal_type = api.get_portal_type(obj)
+    client_uid = ""
+    department_uid = ""
+    if portal_type == "AnalysisRequest":
+        client_uid = obj.getClientUID()
+    elif portal_type == "Analysis":
+        client_uid = obj.getClientUID()
+        department_uid = obj.getRawDepartment()
+    return get_record(portal_type, api.get_review_status(obj),
+                      obj.created(), client_uid=client_uid,
+                      department_uid=department_uid, creator=obj.Creator())
+
+
+def prefix_range(btree, prefix):
+    """Returns the items of the btree whose keys start with the given prefix.
+    The last element of the prefix must be a string
+    """
+    upper = prefix[:-1] + (prefix[-1] + "\x00", )
+    return btree.items(min=prefix, max=upper, excludemax=True)
+
+
+class Aggregates(Persistent):
+    """Persistent counters of objects
+    """
+    # Set once the counters were built with all existing objects
+    complete = False
+
+    def __init__(self):
+        # (portal_type, review_state, creator) -> Length
+        self._totals = OOBTree()
+        # (portal_type, day, review_state, creator) -> Length
+        self._daily = OOBTree()
+        # (portal_type, review_state, day, client, department) -> Length
+        self._details = OOBTree()
+        # uid -> record
+        self._objects = OOBTree()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, uid):
+        return uid in self._objects
+
+    def _get_keys(self, record):
+        portal_type, review_state, day, client, department, creator = record
+        return (
+            (self._totals, (portal_type, review_state, creator)),
+            (self._daily, (portal_type, day, review_state, creator)),
+            (self._details,
+             (portal_type, review_state, day, client, department)),
+        )
+
+    def _change(self, record, delta):
+        for btree, key in self._get_keys(record):
+            counter = btree.get(key)
+            if counter is None:
+                counter = btree[key] = Length()
+            counter.change(delta)
+
+    def index_object(self, uid, record):
+        """Adds or updates the object with the given UID
+        """
+        current = self._objects.get(uid)
+        if current == record:
+            # nothing changed, e.g. a reindex of the results
+            return False
+        if current is not None:
+            self._change(current, -1)
+        self._change(record, 1)
+        self._objects[uid] = record
+        return True
+
+    def unindex_object(self, uid):
+        """Removes the object with the given UID
+        """
+        current = self._objects.get(uid)
+        if current is None:
+            return False
+        self._change(current, -1)
+        del self._objects[uid]
+        return True
+
+    def count(self, portal_type, review_states=None, creator=None):
+        """Returns the number of objects of the given type
+
+        :param review_states: states to count. All states if None
+        :param creator: only count the objects created by this user
+        """
+        if review_states is None:
+            review_states = self.get_review_states(portal_type)
+        total = 0
+        for review_state in review_states:
+            if creator is not None:
+                counter = self._totals.get(
+                    (portal_type, review_state, to_utf8(creator)))
+                total += counter and counter() or 0
+                continue
+            prefix = (portal_type, review_state)
+            total += sum(map(lambda it: it[1](),
+                             prefix_range(self._totals, prefix)))
+        return total
+
+    def get_review_states(self, portal_type):
+        """Returns the review states with objects of the given type
+        """
+        states = set()
+        for key in self._totals.keys(min=(portal_type, ),
+                                     max=(portal_type + "\x00", ),
+                                     excludemax=True):
+            states.add(key[1])
+        return sorted(states)
+
+    def daily(self, portal_type, date_from, date_to, creator=None):
+        """Returns a list of (day, review_state, count) with the number of
+        objects of the given type created per day in the given date range
+        """
+        day_from = date_from.strftime(DAY_FORMAT)
+        day_to = date_to.strftime(DAY_FORMAT)
+        creator = creator is not None and to_utf8(creator) or None
+        counts = {}
+        items = self._daily.items(min=(portal_type, day_from),
+                                  max=(portal_type, day_to + "\x00"),
+                                  excludemax=True)
+        for (_, day, review_state, key_creator), counter in items:
+            if creator is not None and key_creator != creator:
+                continue
+            key = (day, review_state)
+            counts[key] = counts.get(key, 0) + counter()
+        return sorted(map(lambda it: it[0] + (it[1], ),
+                          filter(lambda it: it[1], counts.items())))
+
+    def clear(self):
+        self._totals.clear()
+        self._daily.clear()
+        self._details.clear()
+        self._objects.clear()
+        self.complete = False
+
+
+def get_aggregates(create=False):
+    """Returns the aggregates of the portal
+
+    :param create: create the aggregates if they do not exist yet
+    :returns: Aggregates or None
+    """
+    annotations = IAnnotations(api.get_portal())
+    aggregates = annotations.get(STORAGE_KEY)
+    if aggregates is None and create:
+        aggregates = Aggregates()
+        annotations[STORAGE_KEY] = aggregates
+    return aggregates
+
+
+def is_supported(brain_or_object):
+    """Checks if the object is counted in the aggregates
+    """
+    return api.get_portal_type(brain_or_object) in SUPPORTED_TYPES
+
+
+def is_available():
+    """Checks if the aggregates were built with all existing objects
+    """
+    aggregates = get_aggregates()
+    return aggregates is not None and aggregates.complete
+
+
+def index(obj):
+    """Adds or updates the object in the aggregates
+    """
+    if not is_supported(obj):
+        return False
+    return get_aggregates(create=True).index_object(
+        api.get_uid(obj), get_object_record(obj))
+
+
+def unindex(obj):
+    """Removes the object from the aggregates
+    """
+    if not is_supported(obj):
+        return False
+    aggregates = get_aggregates()
+    if aggregates is None:
+        return False
+    return aggregates.unindex_object(api.get_uid(obj))
+
+
+def rebuild():
+    """Rebuilds the aggregates from the catalog metadata, without waking up
+    the objects
+    """
+    aggregates = get_aggregates(create=True)
+    aggregates.clear()
+
+    # Clients of the samples and departments of the services, cause the
+    # catalog of analyses does not keep them as metadata
+    clients = {}
+    brains = api.search({"portal_type": "AnalysisRequest"},
+                        CATALOG_ANALYSIS_REQUEST_LISTING)
+    for brain in brains:
+        clients[brain.UID] = brain.getClientUID
+    departments = {}
+    brains = api.search({"portal_type": "AnalysisService"}, SETUP_CATALOG)
+    for brain in brains:
+        service = api.get_object(brain)
+        departments[brain.UID] = service.getRawDepartment()
+
+    for portal_type, catalog in SUPPORTED_TYPES.items():
+        brains = api.search({"portal_type": portal_type}, catalog)
+        logger.info("Aggregating {} {} objects".format(
+            len(brains), portal_type))
+        for brain in brains:
+            client_uid = ""
+            department_uid = ""
+            if portal_type == "AnalysisRequest":
+                client_uid = brain.getClientUID
+            elif portal_type == "Analysis":
+                client_uid = clients.get(brain.getParentUID)
+                department_uid = departments.get(brain.getServiceUID)
+            record = get_record(portal_type, brain.review_state,
+                                brain.created, client_uid=client_uid,
+                                department_uid=department_uid,
+                                creator=brain.Creator)
+            aggregates.index_object(brain.UID, record)
+    aggregates.complete = True
+    return aggregates
+
+
+class AggregatesProcessor(object):
+    """Indexing queue processor that keeps the aggregates up to date
+    """
+    if USE_COLLECTIVE_INDEXING:
+        implements(IIndexQueueProcessor)
+
+    def index(self, obj, attributes=None):
+        index(obj)
+
+    def reindex(self, obj, attributes=None):
+        self.index(obj, attributes)
+
+    def unindex(self, obj):
+        if aq_base(obj).__class__.__name__ == "PathWrapper":
+            # Could be a PathWrapper object from collective.indexing.
+            obj = obj.context
+        unindex(obj)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def abort(self):
+        pass
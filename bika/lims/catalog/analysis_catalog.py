@@ -57,6 +57,8 @@ _indexes_dict = {
     "getInstrumentUID": "FieldIndex",
     "getWorksheetUID": "FieldIndex",
     "getOriginalReflexedAnalysisUID": "FieldIndex",
+    # Used to find the analyses created by reflex rules
+    "getReflexRuleLocalID": "FieldIndex",
     "getPrioritySortkey": "FieldIndex",
     "getAncestorsUIDs": "KeywordIndex",
     "isSampleReceived": "BooleanIndex",
@@ -114,6 +116,9 @@ _columns_list = [
     "getSampleTypeUID",
     "getClientOrderNumber",
     "getDateReceived",
+    # Used in productivity reports
+    "getDateVerified",
+    "getMaxTimeAllowed",
 ]
 
 # Adding basic indexes
@@ -18,15 +18,14 @@
 # Copyright 2018-2020 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
-import transaction
 from AccessControl import ClassSecurityInfo
 from AccessControl.Permissions import \
     manage_zcatalog_entries as ManageZCatalogEntries
-from Acquisition import aq_inner
-from Acquisition import aq_parent
 from App.class_init import InitializeClass
 from bika.lims import api
 from bika.lims import logger
+from bika.lims.catalog import indexqueue
+from bika.lims.catalog.rebuild import rebuild_catalog
 from plone.dexterity.interfaces import IDexterityFTI
 from Products.CMFPlone.CatalogTool import CatalogTool
 from Products.CMFPlone.utils import base_hasattr
@@ -79,54 +78,38 @@ class BaseCatalog(CatalogTool):
             return False
         return True
 
-    @security.protected(ManageZCatalogEntries)
-    def clearFindAndRebuild(self):
-        # Empties catalog, then finds all contentish objects (i.e. objects
-        # with an indexObject method), and reindexes them.
-        # This may take a long time.
-
-        # The Catalog ID
-        cid = self.getId()
-
-        # The catalog indexes
-        idxs = list(self.indexes())
-
-        # Types to consider for this catalog
-        obj_metatypes = self.get_mapped_types()
-
-        def indexObject(obj, path):
-            __traceback_info__ = path
-
-            # skip non-indexable types
-            if not self.is_indexable(obj):
-                return
+    def searchResults(self, REQUEST=None, **kw):
+        """Flush the pending operations of this catalog before searching
+        """
+        indexqueue.process(catalog_id=self.getId())
+        return CatalogTool.searchResults(self, REQUEST, **kw)
 
-            # skip types that are not mapped to this catalog
-            if self.get_portal_type(obj) not in obj_metatypes:
-                return
+    __call__ = searchResults
 
-            self.counter += 1
+    def unrestrictedSearchResults(self, REQUEST=None, **kw):
+        """Flush the pending operations of this catalog before searching
+        """
+        indexqueue.process(catalog_id=self.getId())
+        return CatalogTool.unrestrictedSearchResults(self, REQUEST, **kw)
 
-            try:
-                obj.reindexObject(idxs=idxs)
-            except TypeError:
-                # Catalogs have 'indexObject' as well, but they
-                # take different args, and will fail
-                pass
+    def getCounter(self):
+        """Flush the pending operations of this catalog before counting
+        """
+        indexqueue.process(catalog_id=self.getId())
+        return CatalogTool.getCounter(self)
 
-            if self.counter % 100 == 0:
-                logger.info("Progress: {} objects have been cataloged for {}."
-                            .format(self.counter, cid))
-                transaction.savepoint(optimistic=True)
+    @security.protected(ManageZCatalogEntries)
+    def clearFindAndRebuild(self):
+        """Empties the catalog and indexes the objects of the mapped types
 
+        The objects are enumerated from the UID catalogs instead of walking
+        the whole site and are only indexed in this catalog. Large catalogs
+        are better rebuilt with the resumable `bika.lims.catalog.rebuild`
+        script, which commits in batches.
+        """
+        cid = self.getId()
         logger.info("Cleaning and rebuilding catalog '{}'...".format(cid))
-        self.counter = 0
-        self.manage_catalogClear()
-        portal = aq_parent(aq_inner(self))
-        portal.ZopeFindAndApply(
-            portal,
-            search_sub=True,
-            apply_func=indexObject)
+        self.counter = rebuild_catalog(self, commit=False)
         logger.info("Catalog '{}' cleaned and rebuilt".format(cid))
 
 
@@ -21,6 +21,8 @@
 from Acquisition import aq_base
 from bika.lims import api
 from bika.lims import logger
+from bika.lims.catalog import indexqueue
+from bika.lims.catalog.base import BaseCatalog
 from bika.lims.config import USE_COLLECTIVE_INDEXING
 from bika.lims.interfaces import IMultiCatalogBehavior
 from zope.interface import implements
@@ -35,6 +37,9 @@ REQUIRED_CATALOGS = [
 
 class CatalogMultiplexProcessor(object):
     """A catalog multiplex processor
+
+    The operations for the SENAITE catalogs are not applied immediately, but
+    merged per object and catalog in the transaction scoped `indexqueue`
     """
     if USE_COLLECTIVE_INDEXING:
         implements(IIndexQueueProcessor)
@@ -47,6 +52,13 @@ class CatalogMultiplexProcessor(object):
             catalogs.append(rc)
         return map(api.get_tool, catalogs)
 
+    def is_queued(self, catalog):
+        """Check if the operations for the catalog are queued
+
+        Only SENAITE catalogs flush the queue before they are searched
+        """
+        return isinstance(aq_base(catalog), BaseCatalog)
+
     def supports_multi_catalogs(self, obj):
         """Check if the Multi Catalog Behavior is enabled
         """
@@ -65,7 +77,7 @@ class CatalogMultiplexProcessor(object):
         url = api.get_path(obj)
 
         for catalog in catalogs:
-            logger.info(
+            logger.debug(
                 "CatalogMultiplexProcessor::indexObject:catalog={} url={}"
                 .format(catalog.id, url))
             # We want the intersection of the catalogs idxs
@@ -75,7 +87,10 @@ class CatalogMultiplexProcessor(object):
             if attributes and not indexes:
                 continue
             # recatalog the object
-            catalog.catalog_object(obj, url, idxs=list(indexes))
+            if self.is_queued(catalog):
+                indexqueue.index(catalog, obj, url, idxs=list(indexes))
+            else:
+                catalog.catalog_object(obj, url, idxs=list(indexes))
 
     def reindex(self, obj, attributes=None):
         self.index(obj, attributes)
@@ -94,8 +109,10 @@ class CatalogMultiplexProcessor(object):
         url = api.get_path(wrapped_obj)
 
         for catalog in catalogs:
-            if catalog._catalog.uids.get(url, None) is not None:
-                logger.info(
+            if self.is_queued(catalog):
+                indexqueue.unindex(catalog, url)
+            elif catalog._catalog.uids.get(url, None) is not None:
+                logger.debug(
                     "CatalogMultiplexProcessor::unindex:catalog={} url={}"
                     .format(catalog.id, url))
                 catalog.uncatalog_object(url)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Persistent lookup index of IDs and barcodes
+
+Maps the normalized ID, Title and Client Sample ID of Samples, Partitions,
+Reference Samples, Batches and Worksheets to the UID, portal type and physical
+path of the object, so that scanned barcodes or IDs from instrument files are
+resolved with a single BTree lookup and without waking up the objects.
+
+The index is maintained by the `IDLookupProcessor` indexing queue processor.
+"""
+
+from Acquisition import aq_base
+from BTrees.OOBTree import OOBTree
+from bika.lims import api
+from bika.lims.config import USE_COLLECTIVE_INDEXING
+from persistent import Persistent
+from Products.CMFPlone.utils import safe_unicode
+from zope.annotation.interfaces import IAnnotations
+from zope.interface import implements
+
+if USE_COLLECTIVE_INDEXING:
+    from collective.indexing.interfaces import IIndexQueueProcessor
+
+STORAGE_KEY = "bika.lims.idlookup"
+
+# Portal types kept in the index
+SUPPORTED_TYPES = (
+    "AnalysisRequest",
+    "ReferenceSample",
+    "Batch",
+    "Worksheet",
+)
+
+# Fields of the objects that are kept in the index
+FIELDS = (
+    "id",
+    "title",
+    "getClientSampleID",
+)
+
+
+def normalize(value):
+    """Returns the normalized key for the ID or barcode passed in
+    """
+    if not isinstance(value, basestring):
+        return ""
+    value = value.replace("*", "").strip()
+    return safe_unicode(value).lower()
+
+
+def get_keys(brain_or_object):
+    """Returns the (field, normalized value) pairs of the object to index
+    """
+    values = (
+        ("id", api.get_id(brain_or_object)),
+        ("title", api.get_title(brain_or_object)),
+        ("getClientSampleID",
+         api.safe_getattr(brain_or_object, "getClientSampleID", "")),
+    )
+    keys = []
+    for field, value in values:
+        key = normalize(value)
+        if key and (field, key) not in keys:
+            keys.append((field, key))
+    return tuple(keys)
+
+
+class IDLookupIndex(Persistent):
+    """Persistent index of normalized IDs to objects
+    """
+    # Set once the index was built with all existing objects
+    complete = False
+
+    def __init__(self):
+        # normalized value -> ((field, uid), ...)
+        self._index = OOBTree()
+        # uid -> (portal_type, path, ((field, normalized value), ...))
+        self._objects = OOBTree()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, uid):
+        return uid in self._objects
+
+    def index_object(self, uid, portal_type, path, keys):
+        """Adds or updates the entries of the object with the given UID
+        """
+        record = (portal_type, path, tuple(keys))
+        current = self._objects.get(uid)
+        if current == record:
+            # nothing changed, e.g. a reindex of the review state
+            return False
+        if current is not None:
+            self._remove_keys(uid, current[2])
+        for field, key in record[2]:
+            entries = self._index.get(key, ())
+            self._index[key] = entries + ((field, uid), )
+        self._objects[uid] = record
+        return True
+
+    def unindex_object(self, uid):
+        """Removes the entries of the object with the given UID
+        """
+        current = self._objects.get(uid)
+        if current is None:
+            return False
+        self._remove_keys(uid, current[2])
+        del self._objects[uid]
+        return True
+
+    def _remove_keys(self, uid, keys):
+        for field, key in keys:
+            entries = self._index.get(key, ())
+            entries = tuple(filter(lambda entry: entry != (field, uid),
+                                   entries))
+            if entries:
+                self._index[key] = entries
+            elif key in self._index:
+                del self._index[key]
+
+    def lookup(self, value, fields=None, portal_types=None):
+        """Returns the records matching with the ID or barcode passed in
+
+        Each record is a dict with the keys `uid`, `portal_type`, `path` and
+        `field`. Records are sorted by the order of `fields`
+
+        :param value: ID, Title or Client Sample ID to look for
+        :param fields: fields to match with. All fields if None
+        :param portal_types: portal types to match with. All types if None
+        """
+        fields = fields or FIELDS
+        records = []
+        for field, uid in self._index.get(normalize(value), ()):
+            if field not in fields:
+                continue
+            portal_type, path, keys = self._objects[uid]
+            if portal_types and portal_type not in portal_types:
+                continue
+            records.append({
+                "uid": uid,
+                "portal_type": portal_type,
+                "path": path,
+                "field": field,
+            })
+        return sorted(records, key=lambda rec: fields.index(rec["field"]))
+
+    def clear(self):
+        self._index.clear()
+        self._objects.clear()
+        self.complete = False
+
+
+def get_index(create=False):
+    """Returns the lookup index of the portal
+
+    :param create: create the index if it does not exist yet
+    :returns: IDLookupIndex or None
+    """
+    annotations = IAnnotations(api.get_portal())
+    lookup_index = annotations.get(STORAGE_KEY)
+    if lookup_index is None and create:
+        lookup_index = IDLookupIndex()
+        annotations[STORAGE_KEY] = lookup_index
+    return lookup_index
+
+
+def is_supported(brain_or_object):
+    """Checks if the object is kept in the lookup index
+    """
+    return api.get_portal_type(brain_or_object) in SUPPORTED_TYPES
+
+
+def index(brain_or_object):
+    """Adds or updates the object in the lookup index
+    """
+    if not is_supported(brain_or_object):
+        return False
+    return get_index(create=True).index_object(
+        api.get_uid(brain_or_object),
+        api.get_portal_type(brain_or_object),
+        api.get_path(brain_or_object),
+        get_keys(brain_or_object))
+
+
+def unindex(brain_or_object):
+    """Removes the object from the lookup index
+    """
+    if not is_supported(brain_or_object):
+        return False
+    lookup_index = get_index()
+    if lookup_index is None:
+        return False
+    return lookup_index.unindex_object(api.get_uid(brain_or_object))
+
+
+def is_available():
+    """Checks if the lookup index was built with all existing objects
+    """
+    lookup_index = get_index()
+    return lookup_index is not None and lookup_index.complete
+
+
+def lookup(value, fields=None, portal_types=None):
+    """Returns the records matching with the ID or barcode passed in, or None
+    if the lookup index was not built yet
+    """
+    lookup_index = get_index()
+    if lookup_index is None or not lookup_index.complete:
+        return None
+    return lookup_index.lookup(value, fields=fields, portal_types=portal_types)
+
+
+class IDLookupProcessor(object):
+    """Indexing queue processor that keeps the lookup index up to date
+    """
+    if USE_COLLECTIVE_INDEXING:
+        implements(IIndexQueueProcessor)
+
+    def index(self, obj, attributes=None):
+        index(obj)
+
+    def reindex(self, obj, attributes=None):
+        self.index(obj, attributes)
+
+    def unindex(self, obj):
+        if aq_base(obj).__class__.__name__ == "PathWrapper":
+            # Could be a PathWrapper object from collective.indexing.
+            obj = obj.context
+        unindex(obj)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def abort(self):
+        pass
@@ -18,7 +18,6 @@
 # Copyright 2018-2020 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
-import itertools
 import re
 
 from bika.lims import api
@@ -26,35 +25,16 @@ from bika.lims.api.snapshot import get_last_snapshot
 from bika.lims.api.snapshot import get_snapshot_count
 from bika.lims.api.snapshot import get_snapshot_metadata
 from bika.lims.api.snapshot import get_snapshots
+from bika.lims.api.snapshot import get_storage
+from bika.lims.api.snapshot import get_title_or_id_from_uid
 from bika.lims.api.user import get_user_id
 from bika.lims.interfaces import IAuditable, IAuditLogCatalog
 from plone.indexer import indexer
-from plone.memoize.ram import DontCache
-from plone.memoize.ram import cache
 
 UID_RX = re.compile(r"[a-z0-9]{32}$")
 DATE_RX = re.compile(r"\d{4}[-/]\d{2}[-/]\d{2}")
 
 
-def _uid_to_title_cache_key(func, uid):
-    brain = api.get_brain_by_uid(uid, default=None)
-    if brain is None:
-        raise DontCache
-    modified = api.get_modification_date(brain).millis()
-    return "{}-{}".format(uid, modified)
-
-
-@cache(_uid_to_title_cache_key)
-def get_title_or_id_from_uid(uid):
-    """Returns the title or ID from the given UID
-    """
-    obj = api.get_object_by_uid(uid, default=None)
-    if obj is None:
-        return ""
-    title_or_id = api.get_title(obj) or api.get_id(obj)
-    return title_or_id
-
-
 def get_meta_value_for(snapshot, key, default=None):
     """Returns the metadata value for the given key
     """
@@ -129,21 +109,19 @@ def action(instance):
     return get_action(last_snapshot)
 
 
-@indexer(IAuditable, IAuditLogCatalog)
-def listing_searchable_text(instance):
-    """Fulltext search for the audit metadata
+def get_searchable_tokens(values):
+    """Returns the searchable tokens of the given snapshot values
+
+    UIDs are kept as they are, so that the title of the referenced object is
+    looked up when the text is indexed
+
+    :param values: Dictionary of snapshot field/value pairs
+    :returns: set of tokens
     """
-    # get all snapshots
-    snapshots = get_snapshots(instance)
-    # extract all snapshot values, because we are not interested in the
-    # fieldnames (keys)
-    values = map(lambda s: s.values(), snapshots)
     # prepare a set of unified catalog data
-    catalog_data = set()
+    tokens = set()
     # values to skip
     skip_values = ["None", "true", "True", "false", "False"]
-    # internal uid -> title cache
-    uid_title_cache = {}
 
     # helper function to recursively unpack the snapshot values
     def append(value):
@@ -164,19 +142,32 @@ def listing_searchable_text(instance):
             # flush ISO dates
             if re.match(DATE_RX, value):
                 return
-            # fetch the title
-            if re.match(UID_RX, value):
-                if value in uid_title_cache:
-                    value = uid_title_cache[value]
-                else:
-                    title_or_id = get_title_or_id_from_uid(value)
-                    uid_title_cache[value] = title_or_id
-                    value = title_or_id
-            catalog_data.add(value)
-
-    # extract all meaningful values
-    for value in itertools.chain(values):
-        append(value)
+            tokens.add(value)
+
+    # extract all meaningful values, we are not interested in the fieldnames
+    map(append, values.values())
+
+    return tokens
+
+
+@indexer(IAuditable, IAuditLogCatalog)
+def listing_searchable_text(instance):
+    """Fulltext search for the audit metadata
+    """
+    # only the tokens of the snapshots taken since the last indexing are
+    # extracted, the tokens of the former snapshots are kept in the storage
+    storage = get_storage(instance)
+    tokens = storage.update_tokens(get_searchable_tokens)
+
+    catalog_data = set()
+    for token in tokens:
+        # fetch the title
+        if re.match(UID_RX, token):
+            token = get_title_or_id_from_uid(token, default="")
+            if not token:
+                continue
+            token = api.safe_unicode(token).encode("utf8")
+        catalog_data.add(token)
 
     return " ".join(catalog_data)
 
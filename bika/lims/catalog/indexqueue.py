@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Transaction scoped indexing queue for the SENAITE catalogs
+
+All (re)index and unindex requests for the SENAITE catalogs are collected in
+this queue instead of being applied immediately. Requests for the same object
+and catalog are merged into a single operation, where the indexes to update
+are the union of all requested indexes (`None` or an empty list means "all
+indexes" and takes precedence).
+
+The queue is flushed once before the transaction commits, in a stable order
+sorted by catalog id and path. Searches in a SENAITE catalog flush only the
+pending operations of the searched catalog beforehand, so that the results
+are consistent with the changes made in the current transaction.
+
+The queue joins the transaction as a data manager, so that rolling back to a
+savepoint restores the operations that were pending when it was made.
+"""
+
+import threading
+import weakref
+
+import transaction
+from bika.lims import logger
+from bika.lims.config import USE_COLLECTIVE_INDEXING
+from transaction.interfaces import ISavepointDataManager
+from zope.interface import implements
+
+if USE_COLLECTIVE_INDEXING:
+    from collective.indexing.queue import processQueue
+
+INDEX = "index"
+UNINDEX = "unindex"
+
+
+class QueueSavepoint(object):
+    """Savepoint of the pending operations of the queue
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.state = queue.get_state()
+
+    def rollback(self):
+        self.queue.set_state(self.state)
+
+
+class QueueDataManager(object):
+    """Transaction data manager of the queue
+
+    The operations are flushed by a before commit hook of the queue, so this
+    data manager only takes part in savepoints and aborts.
+    """
+    implements(ISavepointDataManager)
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.transaction_manager = transaction.manager
+
+    def savepoint(self):
+        return QueueSavepoint(self.queue)
+
+    def abort(self, txn):
+        # also called when rolling back to a savepoint made before joining
+        self.queue.abort()
+
+    def tpc_begin(self, txn):
+        pass
+
+    def commit(self, txn):
+        pass
+
+    def tpc_vote(self, txn):
+        pass
+
+    def tpc_finish(self, txn):
+        pass
+
+    def tpc_abort(self, txn):
+        self.queue.abort()
+
+    def sortKey(self):
+        return "bika.lims.catalog.indexqueue"
+
+
+class IndexQueue(threading.local):
+    """Thread local queue of pending catalog operations
+    """
+
+    def __init__(self):
+        self.transaction = None
+        self.data_manager = QueueDataManager(self)
+        self.joined = False
+        self.hooked = False
+        self.processing = False
+        # (catalog id, path) -> (operation, object, set of indexes or None)
+        self.queue = {}
+        # catalog id -> catalog
+        self.catalogs = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Resets the statistics of the current transaction
+        """
+        self.requests = 0
+        self.operations = 0
+        self.touched_paths = set()
+        self.touched_catalogs = set()
+
+    def clear(self):
+        """Discards all pending operations
+        """
+        self.queue.clear()
+        self.catalogs.clear()
+        self.joined = False
+        self.hooked = False
+
+    def abort(self):
+        """Discards all pending operations when the transaction is aborted or
+        rolled back to a savepoint made before the queue joined it
+        """
+        self.queue.clear()
+        self.catalogs.clear()
+        # the data manager is no longer part of the transaction
+        self.joined = False
+
+    def check_transaction(self):
+        """Discards the pending operations of a previous transaction
+        """
+        current = transaction.get()
+        txn = self.transaction and self.transaction()
+        if txn is not current:
+            self.clear()
+            self.reset_stats()
+            self.transaction = weakref.ref(current)
+            current.addAfterCommitHook(self.after_commit)
+        return current
+
+    def hook(self):
+        """Joins the transaction and registers the flush of the queue before
+        the transaction commits
+        """
+        txn = self.check_transaction()
+        if not self.joined:
+            txn.join(self.data_manager)
+            self.joined = True
+        if self.hooked:
+            return
+        txn.addBeforeCommitHook(self.before_commit)
+        self.hooked = True
+
+    def add(self, operation, catalog, path, obj=None, idxs=None):
+        """Adds an operation to the queue and merges it with the pending one
+        """
+        self.hook()
+        catalog_id = catalog.getId()
+        key = (catalog_id, path)
+        idxs = idxs and set(idxs) or None
+        pending = self.queue.get(key)
+
+        if operation == INDEX and pending is not None:
+            pending_op, pending_obj, pending_idxs = pending
+            if pending_op == UNINDEX:
+                # the object was removed and added again: catalog it fully
+                idxs = None
+            elif pending_idxs is None or idxs is None:
+                idxs = None
+            else:
+                idxs = pending_idxs.union(idxs)
+
+        self.queue[key] = (operation, obj, idxs)
+        self.catalogs[catalog_id] = catalog
+        self.requests += 1
+
+    def index(self, catalog, obj, path, idxs=None):
+        """Queue the object for (re)indexing in the given catalog
+        """
+        self.add(INDEX, catalog, path, obj=obj, idxs=idxs)
+
+    def unindex(self, catalog, path):
+        """Queue the path for removal from the given catalog
+        """
+        self.add(UNINDEX, catalog, path)
+
+    def length(self):
+        return len(self.queue)
+
+    def get_state(self):
+        """Returns a copy of the pending operations, to restore them after
+        rolling back to a transaction savepoint
+        """
+        self.check_transaction()
+        return dict(self.queue), dict(self.catalogs)
+
+    def set_state(self, state):
+        """Restores the pending operations returned by `get_state`
+
+        Operations processed in between were applied to the catalogs, which
+        are rolled back together with the savepoint, so they are pending again
+        """
+        queue, catalogs = state
+        self.queue = dict(queue)
+        self.catalogs = dict(catalogs)
+        if self.queue:
+            self.hook()
+
+    def get_pending(self, catalog_id=None):
+        """Returns the sorted keys of the pending operations
+        """
+        keys = self.queue.keys()
+        if catalog_id is not None:
+            keys = filter(lambda key: key[0] == catalog_id, keys)
+        return sorted(keys)
+
+    def process(self, catalog_id=None):
+        """Applies the pending operations to the catalogs
+
+        :param catalog_id: only process the operations of this catalog
+        :returns: number of operations applied
+        """
+        if not self.queue or self.processing:
+            # catalog indexers might search the catalogs while we process
+            return 0
+        self.check_transaction()
+
+        processed = 0
+        self.processing = True
+        try:
+            for key in self.get_pending(catalog_id):
+                # indexers might queue further operations while we process
+                operation, obj, idxs = self.queue.pop(key)
+                cid, path = key
+                catalog = self.catalogs[cid]
+                if operation == UNINDEX:
+                    if catalog._catalog.uids.get(path, None) is None:
+                        continue
+                    logger.debug("IndexQueue::unindex:catalog={} path={}"
+                                 .format(cid, path))
+                    catalog.uncatalog_object(path)
+                else:
+                    logger.debug("IndexQueue::index:catalog={} path={} idxs={}"
+                                 .format(cid, path, idxs))
+                    catalog.catalog_object(obj, path, idxs=list(idxs or []))
+                self.touched_paths.add(path)
+                self.touched_catalogs.add(cid)
+                processed += 1
+        finally:
+            self.processing = False
+
+        self.operations += processed
+        return processed
+
+    def before_commit(self):
+        """Flushes the queue before the transaction commits
+        """
+        self.hooked = False
+        self.process()
+        if self.queue:
+            # operations were added during processing
+            self.hook()
+
+    def after_commit(self, success):
+        """Logs a summary of the committed transaction
+        """
+        if success and self.operations:
+            logger.info(
+                "IndexQueue: {} objects in {} catalogs indexed with {} "
+                "operations ({} requests)".format(
+                    len(self.touched_paths), len(self.touched_catalogs),
+                    self.operations, self.requests))
+        self.clear()
+        self.reset_stats()
+        self.transaction = None
+
+
+_queue = IndexQueue()
+
+
+def get_queue():
+    """Returns the indexing queue of the current thread
+    """
+    return _queue
+
+
+def index(catalog, obj, path, idxs=None):
+    """Queue the object for (re)indexing in the given catalog
+    """
+    get_queue().index(catalog, obj, path, idxs=idxs)
+
+
+def unindex(catalog, path):
+    """Queue the path for removal from the given catalog
+    """
+    get_queue().unindex(catalog, path)
+
+
+def process(catalog_id=None):
+    """Applies the pending operations of the given catalog or all catalogs
+
+    The `collective.indexing` queue is processed first, because it feeds this
+    queue with the operations of the catalog multiplex processor.
+    """
+    if USE_COLLECTIVE_INDEXING:
+        processQueue()
+    return get_queue().process(catalog_id=catalog_id)
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Resumable and parallel rebuild of the SENAITE catalogs
+
+The objects to index are not found by walking the whole site, but enumerated
+from the UID index of `uid_catalog` (Archetypes) and `portal_catalog`
+(Dexterity), filtered by the portal types mapped to the catalog. They are
+indexed into the rebuilt catalog only.
+
+The UID space is split in ranges, one per worker. Each worker walks its range
+in UID order and commits in batches together with a checkpoint (the last
+UID indexed), which is stored in the catalog itself. An interrupted rebuild
+continues from the checkpoints, e.g.:
+
+    bin/instance run bika/lims/catalog/rebuild.py <site-id> <catalog-id> \\
+        [--workers N] [--batch-size N] [--instance bin/instance] [--resume]
+
+With more than one worker, every worker runs as a separate `instance run`
+process with its own ZEO connection.
+"""
+
+import argparse
+import itertools
+import subprocess
+import sys
+
+import transaction
+from BTrees.OOBTree import OOBTree
+from bika.lims import api
+from bika.lims import logger
+from plone.dexterity.interfaces import IDexterityFTI
+from Products.Archetypes.config import UID_CATALOG
+from ZODB.POSException import ConflictError
+
+# Objects to index between commits
+BATCH_SIZE = 1000
+
+# Max attempts to index a batch on conflicts with other workers
+RETRIES = 5
+
+# Attribute of the catalog where the checkpoints are stored
+CHECKPOINTS = "_rebuild_checkpoints"
+
+# Number of hex digits of the UIDs used to split the UID space
+UID_PREFIX_LEN = 8
+
+
+def get_sources(catalog):
+    """Returns the catalogs to enumerate the objects of the mapped types from
+
+    :returns: list of (catalog id, portal types)
+    """
+    pt = api.get_tool("portal_types")
+    dx_types = map(lambda fti: fti.getId(),
+                   filter(IDexterityFTI.providedBy, pt.listTypeInfo()))
+    mapped_types = catalog.get_mapped_types()
+    at_types = filter(lambda name: name not in dx_types, mapped_types)
+    dx_types = filter(lambda name: name in dx_types, mapped_types)
+    sources = []
+    if at_types:
+        sources.append((UID_CATALOG, at_types))
+    if dx_types:
+        sources.append(("portal_catalog", dx_types))
+    return sources
+
+
+def get_uid_range(worker, workers):
+    """Returns the (min, max) UIDs of the worker, max excluded. None means
+    unbounded
+    """
+    span = 16 ** UID_PREFIX_LEN
+    template = "{:0%dx}" % UID_PREFIX_LEN
+    start = end = None
+    if worker > 0:
+        start = template.format(span * worker // workers)
+    if worker < workers - 1:
+        end = template.format(span * (worker + 1) // workers)
+    return start, end
+
+
+def iter_candidates(source, portal_types, start=None, end=None,
+                    after=None):
+    """Yields (uid, path) of the objects of the given types in the source
+    catalog, sorted by UID
+
+    :param start: first UID to consider
+    :param end: UID to stop at (excluded)
+    :param after: last UID already processed
+    """
+    cat = source._catalog
+    uid_index = cat.getIndex("UID")
+    type_index = cat.getIndex("portal_type")
+    portal_types = set(portal_types)
+    if after is not None:
+        items = uid_index._index.items(after, end, excludemin=True,
+                                       excludemax=True)
+    else:
+        items = uid_index._index.items(start, end, excludemax=True)
+    for uid, rids in items:
+        if isinstance(rids, int):
+            rids = (rids, )
+        for rid in rids:
+            if type_index.getEntryForObject(rid) not in portal_types:
+                continue
+            yield uid, cat.paths[rid]
+
+
+def get_checkpoints(catalog):
+    """Returns the checkpoints of the running rebuild or None
+    """
+    return getattr(catalog, CHECKPOINTS, None)
+
+
+def get_checkpoint_key(source_id, worker, workers):
+    return "{}:{}/{}".format(source_id, worker, workers)
+
+
+def start_rebuild(catalog, workers=1):
+    """Clears the catalog and sets up the checkpoints of the workers
+    """
+    logger.info("Clearing catalog '{}' ...".format(catalog.getId()))
+    catalog.manage_catalogClear()
+    checkpoints = OOBTree()
+    checkpoints["workers"] = workers
+    for source_id, portal_types in get_sources(catalog):
+        for worker in range(workers):
+            key = get_checkpoint_key(source_id, worker, workers)
+            # (last UID indexed, done)
+            checkpoints[key] = (None, False)
+    setattr(catalog, CHECKPOINTS, checkpoints)
+
+
+def finish_rebuild(catalog):
+    """Removes the checkpoints if all workers are done
+
+    :returns: True if the rebuild is complete
+    """
+    checkpoints = get_checkpoints(catalog)
+    if checkpoints is None:
+        return True
+    for key, value in checkpoints.items():
+        if key != "workers" and not value[1]:
+            return False
+    delattr(catalog, CHECKPOINTS)
+    return True
+
+
+def index_batch(catalog, portal, batch):
+    """Indexes the objects of the batch into the catalog only
+    """
+    for uid, path in batch:
+        obj = portal.unrestrictedTraverse(path, None)
+        if obj is None or not catalog.is_indexable(obj):
+            logger.warn("Skipping {} ({})".format(path, uid))
+            continue
+        catalog.catalog_object(obj, api.get_path(obj))
+
+
+def rebuild_worker(catalog, worker=0, workers=1, batch_size=BATCH_SIZE,
+                   commit=True):
+    """Indexes the objects in the UID range of the worker, resuming from its
+    checkpoints
+
+    :param catalog: catalog to rebuild
+    :param worker: number of this worker, starting at 0
+    :param workers: total number of workers
+    :param batch_size: objects to index per transaction
+    :param commit: commit each batch with its checkpoint, savepoint otherwise
+    :returns: number of objects indexed
+    """
+    portal = api.get_portal()
+    cid = catalog.getId()
+    start, end = get_uid_range(worker, workers)
+    total = 0
+
+    for source_id, portal_types in get_sources(catalog):
+        key = get_checkpoint_key(source_id, worker, workers)
+        checkpoints = get_checkpoints(catalog)
+        after, done = checkpoints[key]
+        if done:
+            continue
+        source = api.get_tool(source_id)
+        while True:
+            # start a new range search after each commit, the UID index might
+            # have changed in between
+            candidates = iter_candidates(source, portal_types, start=start,
+                                         end=end, after=after)
+            batch = list(itertools.islice(candidates, batch_size))
+            done = len(batch) < batch_size
+            last = batch and batch[-1][0] or after
+
+            for attempt in range(RETRIES):
+                try:
+                    index_batch(catalog, portal, batch)
+                    get_checkpoints(catalog)[key] = (last, done)
+                    if commit:
+                        transaction.commit()
+                    else:
+                        transaction.savepoint(optimistic=True)
+                    break
+                except ConflictError:
+                    if not commit or attempt == RETRIES - 1:
+                        raise
+                    logger.info("Conflict in batch after {}, retrying ..."
+                                .format(after))
+                    transaction.abort()
+                    portal._p_jar.sync()
+
+            total += len(batch)
+            after = last
+            logger.info("Worker {}/{}: {} objects cataloged for {}"
+                        .format(worker + 1, workers, total, cid))
+            if done:
+                break
+    return total
+
+
+def rebuild_catalog(catalog, batch_size=BATCH_SIZE, commit=True):
+    """Clears and rebuilds the catalog in this process
+    """
+    start_rebuild(catalog)
+    total = rebuild_worker(catalog, batch_size=batch_size, commit=commit)
+    finish_rebuild(catalog)
+    if commit:
+        transaction.commit()
+    return total
+
+
+def main(app, args):
+    from AccessControl.SecurityManagement import newSecurityManager
+    from AccessControl.SpecialUsers import system
+    from Testing.makerequest import makerequest
+    from zope.component.hooks import setSite
+
+    parser = argparse.ArgumentParser(
+        prog="bin/instance run {}".format(__file__),
+        description="Clear and rebuild a catalog, or resume the rebuild")
+    parser.add_argument("site_id")
+    parser.add_argument("catalog_id")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--instance", default="bin/instance",
+                        help="instance script used to start the workers")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted rebuild")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    options = parser.parse_args(args)
+
+    app = makerequest(app)
+    site = app.get(options.site_id)
+    if site is None:
+        sys.exit("No site with id '{}'".format(options.site_id))
+    newSecurityManager(None, system)
+    setSite(site)
+    catalog = api.get_tool(options.catalog_id)
+    checkpoints = get_checkpoints(catalog)
+
+    if options.worker is not None:
+        # started by the coordinating process below
+        rebuild_worker(catalog, options.worker, checkpoints["workers"],
+                       batch_size=options.batch_size)
+        return
+
+    if not options.resume or checkpoints is None:
+        start_rebuild(catalog, options.workers)
+        transaction.commit()
+    workers = get_checkpoints(catalog)["workers"]
+
+    if workers == 1:
+        rebuild_worker(catalog, batch_size=options.batch_size)
+    else:
+        processes = []
+        for worker in range(workers):
+            command = [options.instance, "run", __file__,
+                       options.site_id, options.catalog_id,
+                       "--batch-size", str(options.batch_size),
+                       "--worker", str(worker)]
+            processes.append(subprocess.Popen(command))
+        failed = filter(None, map(lambda process: process.wait(), processes))
+        if failed:
+            sys.exit("{} workers failed, run again with --resume"
+                     .format(len(failed)))
+
+    app._p_jar.sync()
+    if not finish_rebuild(catalog):
+        sys.exit("Rebuild not complete, run again with --resume")
+    transaction.commit()
+    logger.info("Catalog '{}' rebuilt".format(options.catalog_id))
+
+
+if __name__ == "__main__":
+    # Run with `bin/instance run <this file> ...`. The `app` variable is
+    # provided by the instance script
+    main(app, sys.argv[1:])  # noqa
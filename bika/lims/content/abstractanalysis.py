@@ -19,7 +19,6 @@
 # Some rights reserved, see README and LICENSE.
 
 import cgi
-import math
 from decimal import Decimal
 
 from AccessControl import ClassSecurityInfo
@@ -492,17 +491,17 @@ class AbstractAnalysis(AbstractBaseAnalysis):
         # Set the result field
         self.getField("Result").set(self, val)
 
-    @security.public
-    def calculateResult(self, override=False, cascade=False):
-        """Calculates the result for the current analysis if it depends of
-        other analysis/interim fields. Otherwise, do nothing
+    @security.private
+    def getCalculationMapping(self, override=False, cascade=False):
+        """Returns the mapping of keyword -> value for the evaluation of the
+        formula of the calculation assigned to this analysis, with the values
+        of the interim fields and the results of the dependencies.
+        Returns None if the result cannot be calculated (no calculation, non
+        floatable interims or dependencies without result)
         """
-        if self.getResult() and override is False:
-            return False
-
         calc = self.getCalculation()
         if not calc:
-            return False
+            return None
 
         mapping = {}
 
@@ -522,7 +521,13 @@ class AbstractAnalysis(AbstractBaseAnalysis):
                 mapping[i['keyword']] = ivalue
             except (TypeError, ValueError):
                 # Interim not float, abort
-                return False
+                return None
+
+        if cascade:
+            # Try to calculate the results of the dependencies without result
+            # first, walking the dependency graph in topological order
+            for dependency in self.getDependenciesToCalculate():
+                dependency.calculateResult(override, cascade=False)
 
         # Add dependencies results to mapping
         dependencies = self.getDependencies()
@@ -530,12 +535,7 @@ class AbstractAnalysis(AbstractBaseAnalysis):
             result = dependency.getResult()
             if not result:
                 # Dependency without results found
-                if cascade:
-                    # Try to calculate the dependency result
-                    dependency.calculateResult(override, cascade)
-                    result = dependency.getResult()
-                else:
-                    return False
+                return None
             if result:
                 try:
                     result = float(str(result))
@@ -551,18 +551,56 @@ class AbstractAnalysis(AbstractBaseAnalysis):
                     mapping['%s.%s' % (key, 'BELOWLDL')] = int(bdl)
                     mapping['%s.%s' % (key, 'ABOVEUDL')] = int(adl)
                 except (TypeError, ValueError):
-                    return False
+                    return None
+
+        return mapping
+
+    @security.private
+    def getDependenciesToCalculate(self):
+        """Returns the dependencies without result, as well as the
+        dependencies without result of those, sorted so that each analysis
+        comes after the analyses it depends on
+        """
+        ordered = []
+        visited = set([api.get_uid(self)])
+        stack = [(self, iter(self.getDependencies()))]
+        while stack:
+            analysis, dependencies = stack[-1]
+            for dependency in dependencies:
+                uid = api.get_uid(dependency)
+                if uid in visited:
+                    continue
+                visited.add(uid)
+                if dependency.getResult():
+                    continue
+                stack.append((dependency, iter(dependency.getDependencies())))
+                break
+            else:
+                # All dependencies of this analysis have been processed
+                stack.pop()
+                if analysis is not self:
+                    ordered.append(analysis)
+        return ordered
+
+    @security.public
+    def calculateResult(self, override=False, cascade=False):
+        """Calculates the result for the current analysis if it depends of
+        other analysis/interim fields. Otherwise, do nothing
+        """
+        if self.getResult() and override is False:
+            return False
+
+        calc = self.getCalculation()
+        if not calc:
+            return False
+
+        mapping = self.getCalculationMapping(override, cascade)
+        if mapping is None:
+            return False
 
         # Calculate
-        formula = calc.getMinifiedFormula()
-        formula = formula.replace('[', '%(').replace(']', ')f')
         try:
-            formula = eval("'%s'%%mapping" % formula,
-                           {"__builtins__": None,
-                            'math': math,
-                            'context': self},
-                           {'mapping': mapping})
-            result = eval(formula, calc._getGlobals())
+            result = calc.evaluateFormula(mapping)
         except TypeError:
             self.setResult("NA")
             return True
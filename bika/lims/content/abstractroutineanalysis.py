@@ -41,13 +41,17 @@ from bika.lims.content.abstractanalysis import AbstractAnalysis
 from bika.lims.content.abstractanalysis import schema
 from bika.lims.content.clientawaremixin import ClientAwareMixin
 from bika.lims.content.reflexrule import doReflexRuleAction
+from bika.lims.utils.reflexrule import get_compiled_action_sets
 from bika.lims.interfaces import IAnalysis
 from bika.lims.interfaces import ICancellable
 from bika.lims.interfaces import IDynamicResultsRange
 from bika.lims.interfaces import IInternalUse
 from bika.lims.interfaces import IRoutineAnalysis
 from bika.lims.interfaces.analysis import IRequestAnalysis
+from bika.lims.utils.analysis import DependencyGraph
 from bika.lims.workflow import getTransitionDate
+from bika.lims.workflow.analysis import STATE_REJECTED
+from bika.lims.workflow.analysis import STATE_RETRACTED
 
 
 # True if the analysis is created by a reflex rule
@@ -351,6 +355,26 @@ class AbstractRoutineAnalysis(AbstractAnalysis, ClientAwareMixin):
         """
         raise NotImplementedError("getSiblings is not implemented.")
 
+    @security.private
+    def getDependencyGraph(self):
+        """Returns the graph of dependencies amongst this analysis and its
+        siblings, retracted and rejected included
+        """
+        siblings = self.getSiblings(retracted=True)
+        return DependencyGraph([self] + siblings)
+
+    @security.private
+    def _getGraphAnalyses(self, uids, retracted=False):
+        """Returns the analyses for the uids passed in
+        :param retracted: If false, retracted/rejected analyses are dismissed
+        """
+        analyses = map(api.get_object_by_uid, uids)
+        if retracted:
+            return analyses
+        retracted_states = [STATE_RETRACTED, STATE_REJECTED]
+        return filter(lambda an: api.get_workflow_status_of(an)
+                      not in retracted_states, analyses)
+
     @security.public
     def getDependents(self, retracted=False):
         """
@@ -360,21 +384,9 @@ class AbstractRoutineAnalysis(AbstractAnalysis, ClientAwareMixin):
         :return: Analyses the current analysis depends on
         :rtype: list of IAnalysis
         """
-        def is_dependent(analysis):
-            calculation = analysis.getCalculation()
-            if not calculation:
-                return False
-
-            services = calculation.getRawDependentServices()
-            if not services:
-                return False
-
-            query = dict(UID=services, getKeyword=self.getKeyword())
-            services = api.search(query, "bika_setup_catalog")
-            return len(services) > 0
-
-        siblings = self.getSiblings(retracted=retracted)
-        return filter(lambda sib: is_dependent(sib), siblings)
+        graph = self.getDependencyGraph()
+        uids = graph.get_dependents(self.UID())
+        return self._getGraphAnalyses(uids, retracted=retracted)
 
     @security.public
     def getDependencies(self, retracted=False):
@@ -395,14 +407,9 @@ class AbstractRoutineAnalysis(AbstractAnalysis, ClientAwareMixin):
         if len(service_uids) == 0:
             return []
 
-        dependencies = []
-        for sibling in self.getSiblings(retracted=retracted):
-            # We get all analyses that depend on me, also if retracted (maybe
-            # I am one of those that are retracted!)
-            deps = map(api.get_uid, sibling.getDependents(retracted=True))
-            if self.UID() in deps:
-                dependencies.append(sibling)
-        return dependencies
+        graph = self.getDependencyGraph()
+        uids = graph.get_dependencies(self.UID())
+        return self._getGraphAnalyses(uids, retracted=retracted)
 
     @security.public
     def getPrioritySortkey(self):
@@ -509,21 +516,24 @@ class AbstractRoutineAnalysis(AbstractAnalysis, ClientAwareMixin):
         :param wf_action: is a string containing the workflow action triggered
         """
         # Check out if the analysis has any reflex rule bound to it.
-        # First we have get the analysis' method because the Reflex Rule
-        # objects are related to a method.
-        a_method = self.getMethod()
-        if not a_method:
+        # The Reflex Rule objects are related to a method, so we look up the
+        # compiled rules for the analysis' method, service and the state
+        # change first, without waking up any rule.
+        method_uid = self.getField("Method").getRaw(self)
+        if not method_uid:
             return
-        # After getting the analysis' method we have to get all Reflex Rules
-        # related to that method.
-        all_rrs = a_method.getBackReferences('ReflexRuleMethod')
-        if not all_rrs:
+        action_sets = get_compiled_action_sets(
+            method_uid, self.getRawAnalysisService(), wf_action)
+        if not action_sets:
             return
-        # Once we have all the Reflex Rules with the same method as the
-        # analysis has, it is time to get the rules that are bound to the
-        # same analysis service that is using the analysis.
-        for rule in all_rrs:
-            if not api.is_active(rule):
+        # Get the rules with action sets for this analysis, in order
+        rule_uids = []
+        for action_set in action_sets:
+            if action_set["rule_uid"] not in rule_uids:
+                rule_uids.append(action_set["rule_uid"])
+        for rule_uid in rule_uids:
+            rule = api.get_object_by_uid(rule_uid, None)
+            if rule is None or not api.is_active(rule):
                 continue
             # Getting the rules to be done from the reflex rule taking
             # in consideration the analysis service, the result and
@@ -69,6 +69,24 @@ class Analysis(AbstractRoutineAnalysis):
 
         return siblings
 
+    @security.private
+    def getDependencyGraph(self):
+        """Returns the graph of dependencies amongst the analyses from the
+        Analysis Request this analysis belongs to
+        """
+        request = self.getRequest()
+        if not request:
+            return super(Analysis, self).getDependencyGraph()
+
+        graph = request.getAnalysesDependencyGraph()
+        if self.UID() not in graph:
+            # Not cataloged when the graph was built
+            graph = request.getAnalysesDependencyGraph(refresh=True)
+        if self.UID() not in graph:
+            # Not cataloged yet
+            return super(Analysis, self).getDependencyGraph()
+        return graph
+
     def workflow_script_publish(self):
         """
         If this is not here, acquisition causes recursion into
@@ -126,6 +126,7 @@ from bika.lims.utils import getUsers
 from bika.lims.utils import tmpID
 from bika.lims.utils import user_email
 from bika.lims.utils import user_fullname
+from bika.lims.utils.analysis import DependencyGraph
 from bika.lims.workflow import getTransitionDate
 from bika.lims.workflow import getTransitionUsers
 
@@ -1578,6 +1579,40 @@ class AnalysisRequest(BaseFolder, ClientAwareMixin):
             an_nums[1] += 1
         return an_nums
 
+    @security.private
+    def getAnalysesDependencyGraph(self, refresh=False):
+        """Returns the graph of dependencies amongst the analyses of this
+        Analysis Request, retracted and rejected analyses included.
+
+        The graph is cached on the object and built again when analyses are
+        added, removed or retested, as well as when any of the calculations
+        involved are modified
+
+        :param refresh: if True, build the graph again
+        """
+        version = getattr(self, "_analyses_graph_version", 0)
+        cached = getattr(self, "_v_analyses_graph", None)
+        if cached and not refresh and cached[0] == version \
+                and not cached[1].is_stale():
+            return cached[1]
+        graph = DependencyGraph(self.getAnalyses())
+        self._v_analyses_graph = (version, graph)
+        return graph
+
+    @security.private
+    def invalidateAnalysesDependencyGraph(self):
+        """Flushes the cached graph of dependencies amongst the analyses of
+        this Analysis Request and its ancestors
+        """
+        version = getattr(self, "_analyses_graph_version", 0)
+        # Persist the version, so the cached graphs of other ZODB connections
+        # get invalidated too
+        self._analyses_graph_version = version + 1
+        self._v_analyses_graph = None
+        parent = self.getParentAnalysisRequest()
+        if parent:
+            parent.invalidateAnalysesDependencyGraph()
+
     @security.public
     def getResponsible(self):
         """Return all manager info of responsible departments
@@ -100,6 +100,8 @@ schema = BikaSchema.copy() + Schema((
             "email_subject",
             "email_body",
             "email_attachments",
+            "email_id",
+            "email_status",
         ),
     ),
     TextField(
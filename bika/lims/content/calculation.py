@@ -36,6 +36,7 @@ from bika.lims.config import PROJECTNAME
 from bika.lims.content.bikaschema import BikaSchema
 from bika.lims.interfaces import IDeactivable
 from bika.lims.interfaces.calculation import ICalculation
+from bika.lims.utils import keywordregistry
 from Products.Archetypes.atapi import BaseFolder
 from Products.Archetypes.atapi import ReferenceWidget
 from Products.Archetypes.atapi import Schema
@@ -47,8 +48,12 @@ from Products.ATExtensions.field import RecordsField
 from Products.CMFCore.utils import getToolByName
 from Products.CMFCore.WorkflowCore import WorkflowException
 from Products.CMFPlone.utils import safe_unicode
+from plone.memoize.ram import cache
 from zope.interface import implements
 
+# Matches the keywords of a formula, e.g. [Ca], [Ca.LDL] or [IN1]
+FORMULA_KEYWORD_RX = re.compile(r"\[([^\]]+)\]")
+
 
 schema = BikaSchema.copy() + Schema((
 
@@ -167,6 +172,57 @@ schema['title'].widget.visible = True
 schema['description'].widget.visible = True
 
 
+def parse_formula(formula):
+    """Translates the formula into a Python expression
+
+    Each keyword enclosed in square brackets is replaced by a positional
+    variable name (`_v0`, `_v1`, ...), so keywords with dots, e.g. `[Ca.LDL]`,
+    can be bound without the need of string interpolation.
+
+    :param formula: The minified formula, e.g. `[Ca] + [Mg]`
+    :returns: tuple of (Python expression, tuple of keywords)
+    """
+    keywords = []
+
+    def to_variable(match):
+        keyword = match.group(1)
+        if keyword not in keywords:
+            keywords.append(keyword)
+        return "_v{}".format(keywords.index(keyword))
+
+    source = FORMULA_KEYWORD_RX.sub(to_variable, formula).strip()
+    return source, tuple(keywords)
+
+
+def compile_formula(formula):
+    """Compiles the formula into a code object that can be evaluated against
+    a mapping of keyword values
+
+    :param formula: The minified formula, e.g. `[Ca] + [Mg]`
+    :returns: tuple of (code object, tuple of keywords)
+    """
+    source, keywords = parse_formula(formula)
+    code = compile(source, "<formula>", "eval")
+    return code, keywords
+
+
+def _compiled_formula_cache_key(method, self):
+    # The formula is part of the key, because the modification date is not
+    # updated when the field is set without a reindex of the object
+    uid = api.get_uid(self)
+    modified = api.get_modification_date(self).millis()
+    formula = self.getMinifiedFormula()
+    return "{}-{}-{}".format(uid, modified, hash(formula))
+
+
+def _formula_globals_cache_key(method, self):
+    uid = api.get_uid(self)
+    modified = api.get_modification_date(self).millis()
+    imports = map(lambda i: (i.get("module"), i.get("function")),
+                  self.getPythonImports())
+    return "{}-{}-{}".format(uid, modified, hash(tuple(imports)))
+
+
 class Calculation(BaseFolder, HistoryAwareMixin):
     """Calculation for Analysis Results
     """
@@ -216,15 +272,13 @@ class Calculation(BaseFolder, HistoryAwareMixin):
     def setFormula(self, Formula=None):
         """Set the Dependent Services from the text of the calculation Formula
         """
-        bsc = getToolByName(self, 'bika_setup_catalog')
         if Formula is None:
             self.setDependentServices(None)
             self.getField('Formula').set(self, Formula)
         else:
             keywords = re.compile(r"\[([^.^\]]+)\]").findall(Formula)
-            brains = bsc(portal_type='AnalysisService',
-                         getKeyword=keywords)
-            services = [brain.getObject() for brain in brains]
+            # resolve the services from the keyword registry
+            services = keywordregistry.get_service_uids(keywords)
             self.getField('DependentServices').set(self, services)
             self.getField('Formula').set(self, Formula)
 
@@ -337,8 +391,13 @@ class Calculation(BaseFolder, HistoryAwareMixin):
         """Calculate formula with TestParameters and enter result into
          TestResult field.
         """
-        # Create mapping from TestParameters
-        mapping = {x['keyword']: x['value'] for x in self.getTestParameters()}
+        # Create mapping from TestParameters. Non-numeric values are skipped
+        mapping = {}
+        for param in self.getTestParameters():
+            try:
+                mapping[param['keyword']] = float(param['value'])
+            except (TypeError, ValueError):
+                continue
         # Gather up and parse formula
         formula = self.getMinifiedFormula()
         test_result_field = self.Schema().getField('TestResult')
@@ -347,15 +406,10 @@ class Calculation(BaseFolder, HistoryAwareMixin):
         if not formula:
             return test_result_field.set(self, "")
 
-        formula = formula.replace('[', '{').replace(']', '}').replace('  ', '')
         result = 'Failure'
 
         try:
-            # print "pre: {}".format(formula)
-            formula = formula.format(**mapping)
-            # print "formatted: {}".format(formula)
-            result = eval(formula, self._getGlobals())
-            # print "result: {}".format(result)
+            result = self.evaluateFormula(mapping)
         except TypeError as e:
             # non-numeric arguments in interim mapping?
             result = "TypeError: {}".format(str(e.args[0]))
@@ -369,6 +423,35 @@ class Calculation(BaseFolder, HistoryAwareMixin):
             result = "Unspecified exception: {}".format(str(e.args[0]))
         test_result_field.set(self, str(result))
 
+    @cache(_compiled_formula_cache_key)
+    def getCompiledFormula(self):
+        """Returns the compiled minified formula as a tuple of
+        (code object, keywords). The result is cached for the UID and
+        modification date of this calculation
+        """
+        return compile_formula(self.getMinifiedFormula())
+
+    @cache(_formula_globals_cache_key)
+    def getFormulaGlobals(self):
+        """Returns the globals dictionary for the formula calculation. The
+        result is cached for the UID and modification date of this calculation
+        """
+        return self._getGlobals()
+
+    def evaluateFormula(self, mapping):
+        """Evaluates the compiled formula with the values of the mapping
+
+        :param mapping: dict of keyword -> value, e.g. {"Ca": 1.0, "Mg": 2.0}
+        :returns: the result of the formula
+        :raises KeyError: a keyword of the formula is missing in the mapping
+        :raises ImportError: a member of the Python imports was not found
+        """
+        code, keywords = self.getCompiledFormula()
+        variables = {}
+        for num, keyword in enumerate(keywords):
+            variables["_v{}".format(num)] = mapping[keyword]
+        return eval(code, self.getFormulaGlobals(), variables)
+
     def _getGlobals(self, **kwargs):
         """Return the globals dictionary for the formula calculation
         """
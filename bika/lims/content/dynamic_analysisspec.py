@@ -18,6 +18,7 @@
 # Copyright 2018-2020 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+from binascii import hexlify
 from collections import defaultdict
 from StringIO import StringIO
 
@@ -26,6 +27,8 @@ from bika.lims.catalog import SETUP_CATALOG
 from openpyxl.reader.excel import load_workbook
 from openpyxl.shared.exc import InvalidFileException
 from plone.dexterity.content import Item
+from plone.memoize.ram import DontCache
+from plone.memoize.ram import cache
 from plone.namedfile import field as namedfile
 from plone.supermodel import model
 from zope.interface import Invalid
@@ -38,6 +41,49 @@ REQUIRED_COLUMNS = [
     "max",  # Upper Limit
 ]
 
+KEYWORD_COLUMN = "Keyword"
+
+
+def parse_specs_file(specs_file):
+    """Parses the rows of the first sheet of the given Excel file
+
+    :param specs_file: NamedBlobFile of the Excel
+    :returns: tuple of (header, rows), where each row is a tuple of cell values
+        in the order of the header
+    """
+    xls = load_workbook(StringIO(specs_file.data))
+    if not xls.worksheets:
+        return (), ()
+    rows = xls.worksheets[0].rows
+    if not rows:
+        return (), ()
+    header = tuple(map(lambda cell: cell.value, rows[0]))
+    rows = map(lambda row: tuple(map(lambda cell: cell.value, row)), rows[1:])
+    return header, tuple(rows)
+
+
+def get_row_values(header, row, columns):
+    """Returns the values of the row for the given columns
+
+    :returns: tuple of values, None for the columns not set in the row
+    """
+    values = []
+    for column in columns:
+        pos = header.index(column) if column in header else len(row)
+        values.append(row[pos] if pos < len(row) else None)
+    return tuple(values)
+
+
+def _specs_data_cache_key(method, self):
+    """Cache key by the identity and last commit of the specifications file
+    """
+    specs_file = self.specs_file
+    oid = getattr(specs_file, "_p_oid", None)
+    if oid is None:
+        # not yet committed
+        raise DontCache
+    return "{}-{}".format(hexlify(oid), hexlify(specs_file._p_serial))
+
 
 class IDynamicAnalysisSpec(model.Schema):
     """Dynamic Analysis Specification
@@ -96,30 +142,97 @@ class DynamicAnalysisSpec(Item):
             return None
         return sheets[0]
 
+    def get_specs_data(self):
+        """Returns the parsed rows of the specifications file
+
+        The rows are parsed once when the file is set and stored along with
+        the file, see `update_specs_data`. Objects that were not saved since
+        then are parsed once per file version and kept in the RAM cache.
+
+        :returns: tuple of (header, rows)
+        """
+        specs_file = self.specs_file
+        if not specs_file:
+            return (), ()
+        for stored in (getattr(self, "_specs_data", None),
+                       getattr(self, "_v_specs_data", None)):
+            if stored and stored[0] is specs_file:
+                return stored[1]
+        data = self._get_cached_specs_data()
+        self._v_specs_data = (specs_file, data)
+        return data
+
+    @cache(_specs_data_cache_key)
+    def _get_cached_specs_data(self):
+        return parse_specs_file(self.specs_file)
+
+    def update_specs_data(self):
+        """Parses the specifications file and stores the result along with it
+        """
+        specs_file = self.specs_file
+        if not specs_file:
+            self._specs_data = None
+            return
+        self._specs_data = (specs_file, parse_specs_file(specs_file))
+
     def get_header(self):
-        ps = self.get_primary_sheet()
-        if ps is None:
-            return []
-        return map(lambda cell: cell.value, ps.rows[0])
+        header, rows = self.get_specs_data()
+        return list(header)
 
     def get_specs(self):
-        ps = self.get_primary_sheet()
-        if ps is None:
-            return []
-        keys = self.get_header()
-        specs = []
-        for num, row in enumerate(ps.rows):
-            # skip the header
-            if num == 0:
-                continue
-            values = map(lambda cell: cell.value, row)
-            data = dict(zip(keys, values))
-            specs.append(data)
-        return specs
+        header, rows = self.get_specs_data()
+        return map(lambda row: dict(zip(header, row)), rows)
 
     def get_by_keyword(self):
-        specs = self.get_specs()
+        header, rows = self.get_specs_data()
         groups = defaultdict(list)
-        for spec in specs:
-            groups[spec.get("Keyword")].append(spec)
+        for keyword, keyword_rows in self.get_index(()).items():
+            groups[keyword] = map(lambda row: dict(zip(header, row)),
+                                  keyword_rows[()])
         return groups
+
+    def get_index(self, columns):
+        """Returns the rows indexed by keyword and the values of the columns
+
+        The rows of each keyword and values are kept in file order, so the
+        first one is the same row a scan over all rows would match first.
+
+        :param columns: tuple of column names to index
+        :returns: keyword -> {tuple of values -> list of rows}
+        """
+        data = self.get_specs_data()
+        indexes = getattr(self, "_v_specs_indexes", None)
+        if not indexes or indexes[0] is not data:
+            indexes = self._v_specs_indexes = (data, {})
+        index = indexes[1].get(columns)
+        if index is None:
+            header, rows = data
+            index = defaultdict(lambda: defaultdict(list))
+            for row in rows:
+                keyword = get_row_values(header, row, (KEYWORD_COLUMN, ))[0]
+                values = get_row_values(header, row, columns)
+                index[keyword][values].append(row)
+            index = indexes[1][columns] = dict(index)
+        return index
+
+    def find_spec(self, keyword, match_data):
+        """Returns the first row of the keyword that matches all the values
+
+        :param keyword: Analysis keyword
+        :param match_data: column name -> value mapping
+        :returns: column name -> value mapping of the row or None
+        """
+        header, rows = self.get_specs_data()
+        columns = tuple(sorted(match_data.keys()))
+        values = tuple(map(match_data.get, columns))
+        try:
+            matches = self.get_index(columns).get(keyword, {}).get(values)
+        except TypeError:
+            # unhashable values, compare the rows of the keyword one by one
+            rows = self.get_index(()).get(keyword, {}).get((), [])
+            matches = filter(
+                lambda row: get_row_values(header, row, columns) == values,
+                rows)
+        if not matches:
+            return None
+        return dict(zip(header, matches[0]))
@@ -21,6 +21,7 @@
 from datetime import date
 
 from AccessControl import ClassSecurityInfo
+from DateTime import DateTime
 
 from Products.CMFCore.utils import getToolByName
 from Products.CMFPlone.utils import safe_unicode
@@ -348,6 +349,17 @@ def getCalibrationAgents(context):
     return DisplayList(agents)
 
 
+# Reasons why an instrument is not valid
+REASON_OUT_OF_DATE = "out_of_date"
+REASON_QC_FAILED = "qc_failed"
+REASON_DISPOSED = "disposed_until_next_calibration_test"
+REASON_VALIDATION = "validation_in_progress"
+REASON_CALIBRATION = "calibration_in_progress"
+
+# Review states of the analyses that keep the instrument validity in catalog
+ACTIVE_ANALYSES_STATES = ["unassigned", "assigned", "to_be_verified"]
+
+
 class Instrument(ATFolder):
     """A physical gadget of the lab
     """
@@ -444,11 +456,111 @@ class Instrument(ATFolder):
         """ Returns if the current instrument is not out for verification, calibration,
         out-of-date regards to its certificates and if the latest QC succeed
         """
-        return self.isOutOfDate() is False \
-            and self.isQCValid() is True \
-            and self.getDisposeUntilNextCalibrationTest() is False \
-            and self.isValidationInProgress() is False \
-            and self.isCalibrationInProgress() is False
+        return self.getValidity()["valid"]
+
+    def computeValidity(self):
+        """Computes the validity state of the instrument
+
+        Returns a dict with the keys `valid`, `reasons` (list of reasons why
+        the instrument is not valid) and `valid_until`, the earliest date when
+        a certification, calibration or validation period starts or ends, so
+        the state has to be computed again. `valid_until` is None if no such
+        date is ahead
+        """
+        now = DateTime()
+        reasons = []
+        if self.isOutOfDate() is not False:
+            reasons.append(REASON_OUT_OF_DATE)
+        if self.isQCValid() is not True:
+            reasons.append(REASON_QC_FAILED)
+        if self.getDisposeUntilNextCalibrationTest() is not False:
+            reasons.append(REASON_DISPOSED)
+        if self.isValidationInProgress() is not False:
+            reasons.append(REASON_VALIDATION)
+        if self.isCalibrationInProgress() is not False:
+            reasons.append(REASON_CALIBRATION)
+
+        # Dates when the date ranges of the instrument start or end
+        dates = []
+        for cert in self.getCertifications():
+            dates.extend([cert.getValidFrom(), cert.getValidTo()])
+        periods = self.getCalibrations() + self.getValidations()
+        for period in periods:
+            dates.extend([period.getDownFrom(), period.getDownTo()])
+        dates = filter(lambda dt: dt and dt > now, dates)
+
+        return {
+            "valid": not reasons,
+            "reasons": reasons,
+            "valid_until": dates and min(dates) or None,
+        }
+
+    def isValidityExpired(self, validity, now=None):
+        """Returns whether the validity state passed in has to be computed
+        again because its `valid_until` date is already reached
+        """
+        valid_until = validity.get("valid_until")
+        if not valid_until:
+            return False
+        now = now or DateTime()
+        return now > valid_until
+
+    def getValidity(self):
+        """Returns the validity state of the instrument
+
+        The state is persisted by `updateValidity`. If not set yet or its
+        `valid_until` date is reached, the state is computed, but not stored
+        """
+        validity = getattr(self, "_validity", None)
+        if validity is None or self.isValidityExpired(validity):
+            validity = getattr(self, "_v_validity", None)
+            if validity is None or self.isValidityExpired(validity):
+                validity = self.computeValidity()
+                self._v_validity = validity
+        return validity
+
+    def updateValidity(self):
+        """Computes the validity state of the instrument and stores it. The
+        analyses assigned to this instrument are reindexed if the instrument
+        becomes valid or invalid
+
+        :returns: True if the validity of the instrument changed
+        """
+        validity = self.computeValidity()
+        current = getattr(self, "_validity", None)
+        if current == validity:
+            return False
+        self._validity = validity
+        self._v_validity = None
+        if current is None or current["valid"] == validity["valid"]:
+            # first time stored or only reasons or next date changed
+            return False
+        logger.info("Validity of instrument {} changed: valid={} reasons={}"
+                    .format(self.getId(), validity["valid"],
+                            ", ".join(validity["reasons"])))
+        self.reindexAffectedAnalyses()
+        return True
+
+    def reindexAffectedAnalyses(self):
+        """Reindexes the active analyses assigned to this instrument, so the
+        validity of the instrument is updated in their catalog metadata
+        """
+        query = {"getInstrumentUID": self.UID(),
+                 "review_state": ACTIVE_ANALYSES_STATES}
+        brains = api.search(query, CATALOG_ANALYSIS_LISTING)
+        for brain in brains:
+            analysis = api.get_object(brain)
+            analysis.reindexObject(idxs=["getInstrumentUID"])
+        self.reindexObject()
+        return len(brains)
+
+    def setDisposeUntilNextCalibrationTest(self, value):
+        """Sets whether the instrument is disposed until the next calibration
+        test and updates the validity of the instrument
+        """
+        self.getField("DisposeUntilNextCalibrationTest").set(self, value)
+        if not self.checkCreationFlag():
+            self.updateValidity()
 
     def isQCValid(self):
         """ Returns True if the results of the last batch of QC Analyses
@@ -649,6 +761,7 @@ class Instrument(ATFolder):
         # Set DisposeUntilNextCalibrationTest to False
         if (len(addedanalyses) > 0):
             self.getField('DisposeUntilNextCalibrationTest').set(self, False)
+            self.updateValidity()
 
         return addedanalyses
 
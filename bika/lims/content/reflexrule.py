@@ -34,10 +34,13 @@ from bika.lims import bikaMessageFactory as _
 from bika.lims.content.bikaschema import BikaSchema
 from bika.lims.interfaces import IReflexRule, IDeactivable
 from bika.lims.browser.fields import ReflexRuleField
-from bika.lims.utils import isnumber
 from bika.lims.utils import getUsers
 from bika.lims.utils import tmpID
 from bika.lims.utils.analysis import duplicateAnalysis
+from bika.lims.utils.reflexrule import compile_reflex_rule
+from bika.lims.utils.reflexrule import evaluate_conditions
+from bika.lims.utils.reflexrule import get_compiled_action_sets
+from bika.lims.utils.reflexrule import is_condition_met
 from bika.lims.idserver import renameAfterCreation
 from bika.lims import logger
 from bika.lims.workflow import doActionFor
@@ -93,6 +96,21 @@ class ReflexRule(BaseContent):
         from bika.lims.idserver import renameAfterCreation
         renameAfterCreation(self)
 
+    @security.private
+    def setMethod(self, value):
+        """Sets the method and updates the lookup table of the reflex rules
+        """
+        self.getField("Method").set(self, value)
+        compile_reflex_rule(self)
+
+    @security.private
+    def setReflexRules(self, value):
+        """Sets the action sets and updates the lookup table of the reflex
+        rules
+        """
+        self.getField("ReflexRules").set(self, value)
+        compile_reflex_rule(self)
+
     @security.private
     def _getAvailableMethodsDisplayList(self):
         """ Returns a DisplayList with the available Methods
@@ -111,7 +129,8 @@ class ReflexRule(BaseContent):
         action_set are met, and returns False otherwise.
         :analysis: the analysis full object which we want to obtain the
             rules for.
-        :action_set: a set of rules and actions as a dictionary.
+        :action_set: a compiled set of rules and actions as a dictionary (see
+            bika.lims.utils.reflexrule.compile_action_set). Stored as:
             {'actions': [{'act_row_idx': 0,
                 'action': 'setresult',
                 'an_result_id': 'set-4',
@@ -141,7 +160,7 @@ class ReflexRule(BaseContent):
         :returns: a Boolean.
         """
         conditions = action_set.get('conditions', [])
-        eval_str = ''
+        resolutions = []
         # Getting the analysis local id or its uid instead
         alocalid = analysis.getReflexRuleLocalID() if \
             analysis.getIsReflexAnalysis() and not forceuid else analysis.getServiceUID()
@@ -216,32 +235,16 @@ class ReflexRule(BaseContent):
             ans_related_to_set.append(curranalysis)
             # the value of the analysis' result as string
             result = curranalysis.getResult()
-            if len(analysis.getResultOptions()) > 0:
-                # Discrete result as expacted value
-                exp_val = condition.get('discreteresult', '')
-            else:
-                exp_val = (
-                    condition.get('range0', ''),
-                    condition.get('range1', '')
-                    )
+            # Discrete result as expected value
+            discrete = len(analysis.getResultOptions()) > 0
             and_or = condition.get('and_or', '')
             service_uid = curranalysis.getServiceUID()
 
             # Resolve the conditions
-            resolution = \
-                ans_uid_cond == service_uid and\
-                ((isnumber(result) and isinstance(exp_val, str) and
-                    exp_val == result) or
-                    (isnumber(result) and len(exp_val) == 2 and
-                        isnumber(exp_val[0]) and isnumber(exp_val[1]) and
-                        float(exp_val[0]) <= float(result) and
-                        float(result) <= float(exp_val[1])))
-            # Build a string and then use eval()
-            if and_or == 'no':
-                eval_str += str(resolution)
-            else:
-                eval_str += str(resolution) + ' ' + and_or + ' '
-        if eval_str and eval(eval_str):
+            resolution = ans_uid_cond == service_uid and \
+                is_condition_met(condition, result, discrete=discrete)
+            resolutions.append((resolution, and_or))
+        if evaluate_conditions(resolutions):
             for an in ans_related_to_set:
                 an.addReflexRuleActionsTriggered(rr_actions_triggered)
             return True
@@ -259,27 +262,25 @@ class ReflexRule(BaseContent):
             have to act in consideration of the action_set 'trigger' variable
         :returns: [{'action': 'duplicate', ...}, {,}, ...]
         """
-        # Setting up the analyses catalog
-        self.analyses_catalog = getToolByName(self, CATALOG_ANALYSIS_LISTING)
-        # Getting the action sets, those that contain action rows
-        action_sets = self.getReflexRules()
+        # Getting the compiled action sets of this rule for the service of
+        # the analysis and the trigger
+        action_sets = get_compiled_action_sets(
+            self.getRawMethod(), analysis.getServiceUID(), wf_action,
+            rule_uid=self.UID())
         rules_list = []
-        condition = False
         for action_set in action_sets:
-            # Validate the trigger
-            if action_set.get('trigger', '') == wf_action:
-                # Getting the conditions resolution
-                condition = self._areConditionsMet(action_set, analysis)
-                if condition:
-                    actions = action_set.get('actions', [])
-                    for act in actions:
-                        # Adding the rule number inside each action row because
-                        # need to get the rule number from a row action later.
-                        # we will need to get the rule number from a row
-                        # action later.
-                        act['rulenumber'] = action_set.get('rulenumber', '0')
-                        act['rulename'] = self.Title()
-                        rules_list.append(act)
+            # Getting the conditions resolution
+            condition = self._areConditionsMet(action_set, analysis)
+            if condition:
+                actions = action_set.get('actions', [])
+                for act in actions:
+                    # Adding the rule number inside each action row because
+                    # we will need to get the rule number from a row action
+                    # later. The compiled actions are shared, use a copy
+                    act = dict(act)
+                    act['rulenumber'] = action_set.get('rulenumber', '0')
+                    act['rulename'] = self.Title()
+                    rules_list.append(act)
         return rules_list
 
 atapi.registerType(ReflexRule, PROJECTNAME)
@@ -295,17 +296,17 @@ def _fetch_analysis_for_local_id(analysis, ans_cond):
     """
     # Getting the first reflexed analysis from the chain
     first_reflexed = analysis.getOriginalReflexedAnalysis()
-    # Getting all reflexed analysis created due to this first analysis
+    if not first_reflexed:
+        return None
+    # Getting the reflexed analysis created due to this first analysis that
+    # matches with the local id 'ans_cond'
     analyses_catalog = getToolByName(analysis, CATALOG_ANALYSIS_LISTING)
     derivatives_brains = analyses_catalog(
-        getOriginalReflexedAnalysisUID=first_reflexed.UID()
+        getOriginalReflexedAnalysisUID=first_reflexed.UID(),
+        getReflexRuleLocalID=ans_cond,
     )
-    # From all the related reflexed analysis, return the one that matches
-    # with the local id 'ans_cond'
     for derivative in derivatives_brains:
-        derivative = derivative.getObject()
-        if derivative.getReflexRuleLocalID() == ans_cond:
-            return derivative
+        return derivative.getObject()
     return None
 
 def doActionToAnalysis(base, action):
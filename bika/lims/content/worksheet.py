@@ -54,6 +54,9 @@ from zope.interface import implements
 ALL_ANALYSES_TYPES = "all"
 ALLOWED_ANALYSES_TYPES = ["a", "b", "c", "d"]
 
+# Number of analyses sorted by the first search when a template is applied
+ROUTINE_ANALYSES_WINDOW = 100
+
 
 schema = BikaSchema.copy() + Schema((
 
@@ -814,6 +817,43 @@ class Worksheet(BaseFolder, HistoryAwareMixin):
             slots.append(slot)
         return slots
 
+    def _search_analyses_in_windows(self, catalog, query):
+        """Yields the brains of the query in sort order, sorting only a window
+        of the results at a time, so the caller can stop early without having
+        sorted the whole result set.
+
+        The window is doubled after each search, so the number of searches
+        grows logarithmically with the number of results consumed.
+
+        :param catalog: catalog to search in
+        :param query: catalog query with a sort_on key
+        """
+        query = dict(query)
+        start = 0
+        limit = ROUTINE_ANALYSES_WINDOW
+        while True:
+            query["sort_limit"] = limit
+            brains = catalog(query)
+            for brain in brains[start:limit]:
+                yield brain
+            total = getattr(brains, "actual_result_count", len(brains))
+            if limit >= total:
+                return
+            start = limit
+            limit *= 2
+
+    def _is_routine_analysis_allowed(self, brain, instrument_uid, method_uid):
+        """Returns whether the analysis the brain refers to allows the
+        instrument and method of the worksheet template, based on metadata
+        """
+        if instrument_uid:
+            if instrument_uid not in (brain.getAllowedInstrumentUIDs or []):
+                return False
+        if method_uid:
+            if method_uid not in (brain.getAllowedMethodUIDs or []):
+                return False
+        return True
+
     def _apply_worksheet_template_routine_analyses(self, wst):
         """Add routine analyses to worksheet according to the worksheet template
         layout passed in w/o overwriting slots that are already filled.
@@ -824,6 +864,11 @@ class Worksheet(BaseFolder, HistoryAwareMixin):
         If the template passed in has a method assigned, only those routine
         analyses that allows the method will be added
 
+        Analyses are selected from catalog metadata, in priority order, and
+        only the analyses that are finally added are woken up. Once all slots
+        are taken, only the remaining analyses of the samples that got a slot
+        are searched for.
+
         :param wst: worksheet template used as the layout
         :returns: None
         """
@@ -838,12 +883,6 @@ class Worksheet(BaseFolder, HistoryAwareMixin):
             "is_active": True,
             "sort_on": "getPrioritySortkey"
         }
-        # Filter analyses their Analysis Requests have been received
-        analyses = bac(query)
-
-        # No analyses, nothing to do
-        if not analyses:
-            return
 
         # Available slots for routine analyses. Sort reverse, cause we need a
         # stack for sequential assignment of slots
@@ -853,90 +892,93 @@ class Worksheet(BaseFolder, HistoryAwareMixin):
         # If there is an instrument assigned to this Worksheet Template, take
         # only the analyses that allow this instrument into consideration.
         instrument = wst.getInstrument()
+        instrument_uid = instrument and api.get_uid(instrument) or None
 
         # If there is method assigned to the Worksheet Template, take only the
         # analyses that allow this method into consideration.
         method = wst.getRestrictToMethod()
+        method_uid = method and api.get_uid(method) or None
 
-        # This worksheet is empty?
-        num_routine_analyses = len(self.getRegularAnalyses())
+        # Slots of the Analysis Requests that are already in this worksheet
+        fixed_slots = dict()
+        if self.getRegularAnalyses():
+            for row in self.getLayout():
+                if row["type"] == "a" and row["container_uid"]:
+                    fixed_slots[row["container_uid"]] = to_int(row["position"])
 
-        # Group Analyses by Analysis Requests
+        # Group Analyses by Analysis Requests (keyed by UID)
         ar_analyses = dict()
         ar_slots = dict()
         ar_fixed_slots = dict()
+        ar_ids = dict()
+        seen = set()
+
+        def add_brain(brain, slot):
+            ar_uid = brain.getParentUID
+            ar_ids[ar_uid] = brain.getRequestID
+            ar_slots[ar_uid] = slot
+            ar_analyses.setdefault(ar_uid, list()).append(brain)
+            seen.add(brain.UID)
+
+        if available_slots:
+            for brain in self._search_analyses_in_windows(bac, query):
+                if not self._is_routine_analysis_allowed(
+                        brain, instrument_uid, method_uid):
+                    continue
 
-        for brain in analyses:
-            obj = api.get_object(brain)
-            arid = obj.getRequestID()
-
-            if instrument and not obj.isInstrumentAllowed(instrument):
-                # Exclude those analyses for which the worksheet's template
-                # instrument is not allowed
-                continue
-
-            if method and not obj.isMethodAllowed(method):
-                # Exclude those analyses for which the worksheet's template
-                # method is not allowed
-                continue
-
-            slot = ar_slots.get(arid, None)
-            if not slot:
-                # We haven't processed other analyses that belong to the same
-                # Analysis Request as the current one.
-                if len(available_slots) == 0 and num_routine_analyses == 0:
-                    # No more slots available for this worksheet/template, so
-                    # we cannot add more analyses to this WS. Also, there is no
-                    # chance to process a new analysis with an available slot.
-                    break
-
-                if num_routine_analyses == 0:
-                    # This worksheet is empty, but there are slots still
-                    # available, assign the next available slot to this analysis
-                    slot = available_slots.pop()
-                else:
-                    # This worksheet is not empty and there are slots still
-                    # available.
-                    slot = self.get_slot_position(obj.getRequest())
+                ar_uid = brain.getParentUID
+                slot = ar_slots.get(ar_uid, None)
+                if not slot:
+                    slot = fixed_slots.get(ar_uid, None)
                     if slot:
                         # Prefixed slot position
-                        ar_fixed_slots[arid] = slot
-                        if arid not in ar_analyses:
-                            ar_analyses[arid] = list()
-                        ar_analyses[arid].append(obj)
-                        continue
-
-                    # This worksheet does not contain any other analysis
-                    # belonging to the same Analysis Request as the current
-                    if len(available_slots) == 0:
-                        # There is the chance to process a new analysis that
-                        # belongs to an Analysis Request that is already
-                        # in this worksheet.
-                        continue
-
-                    # Assign the next available slot
-                    slot = available_slots.pop()
-
-            ar_slots[arid] = slot
-            if arid not in ar_analyses:
-                ar_analyses[arid] = list()
-            ar_analyses[arid].append(obj)
-
-        # Sort the analysis requests by sortable_title, so the ARs will appear
+                        ar_fixed_slots[ar_uid] = slot
+                    elif available_slots:
+                        # Assign the next available slot
+                        slot = available_slots.pop()
+                    else:
+                        # No more slots available. Only the analyses from
+                        # samples that got a slot can be added from now on
+                        break
+                add_brain(brain, slot)
+
+        # Remaining analyses of the samples that already have a slot, either
+        # in this worksheet or assigned above
+        sample_uids = set(fixed_slots.keys()).union(ar_slots.keys())
+        if sample_uids:
+            query = dict(query, getParentUID=list(sample_uids))
+            for brain in bac(query):
+                if brain.UID in seen:
+                    continue
+                if not self._is_routine_analysis_allowed(
+                        brain, instrument_uid, method_uid):
+                    continue
+                ar_uid = brain.getParentUID
+                slot = ar_slots.get(ar_uid, None)
+                if not slot:
+                    slot = fixed_slots[ar_uid]
+                    ar_fixed_slots[ar_uid] = slot
+                add_brain(brain, slot)
+
+        # No analyses, nothing to do
+        if not ar_analyses:
+            return
+
+        # Sort the analysis requests by their ids, so the ARs will appear
         # sorted in natural order. Since we will add the analysis with the
         # exact slot where they have to be displayed, we need to sort the slots
         # too and assign them to each group of analyses in natural order
-        sorted_ar_ids = sorted(ar_analyses.keys())
-        slots = sorted(ar_slots.values(), reverse=True)
+        sorted_ar_uids = sorted(ar_analyses.keys(), key=ar_ids.get)
+        slots = sorted([ar_slots[uid] for uid in ar_analyses.keys()
+                        if uid not in ar_fixed_slots], reverse=True)
 
-        # Add regular analyses
-        for ar_id in sorted_ar_ids:
-            slot = ar_fixed_slots.get(ar_id, None)
+        # Add regular analyses. Only the analyses to add are woken up
+        for ar_uid in sorted_ar_uids:
+            slot = ar_fixed_slots.get(ar_uid, None)
             if not slot:
                 slot = slots.pop()
-            ar_ans = ar_analyses[ar_id]
-            for ar_an in ar_ans:
-                self.addAnalysis(ar_an, slot)
+            for brain in ar_analyses[ar_uid]:
+                self.addAnalysis(api.get_object(brain), slot)
 
     def _apply_worksheet_template_duplicate_analyses(self, wst):
         """Add duplicate analyses to worksheet according to the worksheet template
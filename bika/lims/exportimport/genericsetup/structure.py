@@ -266,7 +266,8 @@ class ContentXMLAdapter(SenaiteSiteXMLAdapter):
             if child.nodeName == "auditlog":
                 snapshots = json.loads(child.firstChild.nodeValue)
                 storage = api.snapshot.get_storage(context)
-                storage[:] = map(json.dumps, snapshots)[:]
+                storage.clear()
+                storage.extend(snapshots)
                 # make sure the object provides `IAuditable`
                 alsoProvides(context, IAuditable)
                 return
@@ -18,45 +18,7 @@
 # Copyright 2018-2020 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
-import sys
-import inspect
-
-# from generic import xml
-from abbott.m2000rt import m2000rt
-from foss.fiastar import fiastar
-from foss.winescan import auto
-from foss.winescan import ft120
-from generic import two_dimension
-from thermoscientific.gallery import Ts9861x
-from thermoscientific.arena import xt20
-from thermoscientific.multiskan import go
-from panalytical.omnia import axios_xrf
-from alere.pima import beads, cd4
-from lachat import quickchem
-from lifetechnologies.qubit import qubit
-from metler.toledo import dl55
-from biodrop.ulite import ulite
-from tescan.tima import tima
-from sysmex.xs import i500, i1000
-from sysmex.xt import i1800, i4000
-from beckmancoulter.access import model2
-from rochecobas.taqman import model48
-from rochecobas.taqman import model96
-from sealanalytical.aq2 import aq2
-from shimadzu.gcms import qp2010se, tq8030
-from shimadzu.icpe import multitype
-from shimadzu.nexera import LC2040C, LCMS8050
-from horiba.jobinyvon import icp
-from abaxis.vetscan import vs2
-from scilvet.abc import plus
-from eltra.cs import cs2000
-from rigaku.supermini import wxrf
-from myself import myinstrument
-from nuclisens import easyq
-from genexpert import genexpert
-from varian.vistapro import icp
-from cobasintegra.model_400_plus import model_400_plus
-from facscalibur.calibur import model_e9750
+import importlib
 
 from bika.lims import api
 from zope.component import getAdapters
@@ -80,96 +42,149 @@ class IInstrumentAutoImportInterface(IInstrumentInterface):
     """
 
 
+# Registry of the classic instrument interfaces. Each entry is a tuple
+# (id, title, parser class, import, export), where the id is the path of the
+# module relative to this package. The parser class is used for auto-import,
+# if None, auto-import won't run for that interface. Title and capabilities are
+# declared here, so that listing the interfaces does not require to import the
+# modules: a module is only imported when its interface is actually used
 # TODO Remove this once classic instrument interface migrated
-__all__ = ['abaxis.vetscan.vs2',
-           'abbott.m2000rt.m2000rt',
-           'alere.pima.beads',
-           'alere.pima.cd4',
-           'beckmancoulter.access.model2',
-           'biodrop.ulite.ulite',
-           'eltra.cs.cs2000',
-           'foss.fiastar.fiastar',
-           'foss.winescan.auto',
-           'foss.winescan.ft120',
-           'generic.two_dimension',
-           # 'generic.xml',
-           'genexpert.genexpert',
-           'horiba.jobinyvon.icp',
-           'lachat.quickchem',
-           'lifetechnologies.qubit.qubit',
-           'metler.toledo.dl55',
-           'myself.myinstrument',
-           'nuclisens.easyq',
-           'panalytical.omnia.axios_xrf',
-           'rigaku.supermini.wxrf',
-           'rochecobas.taqman.model48',
-           'rochecobas.taqman.model96',
-           'scilvet.abc.plus',
-           'sealanalytical.aq2.aq2',
-           'shimadzu.gcms.qp2010se',
-           'shimadzu.gcms.tq8030',
-           'shimadzu.icpe.multitype',
-           'shimadzu.nexera.LC2040C',
-           'shimadzu.nexera.LCMS8050',
-           'sysmex.xs.i1000',
-           'sysmex.xs.i500',
-           'sysmex.xt.i1800',
-           'sysmex.xt.i4000',
-           'tescan.tima.tima',
-           'thermoscientific.arena.xt20',
-           'thermoscientific.gallery.Ts9861x',
-           'thermoscientific.multiskan.go',
-           'varian.vistapro.icp',
-           'cobasintegra.model_400_plus.model_400_plus',
-           'facscalibur.calibur.model_e9750'
-           ]
-
-# Parsers are for auto-import. If empty, then auto-import won't wun for that
-# interface
+INSTRUMENT_INTERFACES = (
+    ("abaxis.vetscan.vs2", "Abaxis VetScan - VS2",
+     "AbaxisVetScanCSVVS2Parser", True, False),
+    ("abbott.m2000rt.m2000rt", "Abbott - m2000 Real Time",
+     "Abbottm2000rtTSVParser", True, False),
+    ("alere.pima.beads", "Alere Pima Beads",
+     "AlerePimaSLKParser", True, False),
+    ("alere.pima.cd4", "Alere Pima CD4",
+     "AlerePimacd4SLKParser", True, False),
+    ("beckmancoulter.access.model2", "Beckman Coulter Access 2",
+     "BeckmancoulterAccess2CSVParser", True, False),
+    ("biodrop.ulite.ulite", "BioDrop uLite",
+     "BioDropCSVParser", True, False),
+    ("eltra.cs.cs2000", "Eltra CS - 2000",
+     "EltraCS2000CSVParser", True, False),
+    ("foss.fiastar.fiastar", "FOSS - FIAStar",
+     "FOSSFIAStarCSVParser", True, True),
+    ("foss.winescan.auto", "FOSS - Winescan Auto",
+     "WinescanAutoCSVParser", True, False),
+    ("foss.winescan.ft120", "FOSS - Winescan FT120",
+     "WinescanFT120CSVParser", True, False),
+    ("generic.two_dimension", "2-Dimensional-CSV",
+     "TwoDimensionCSVParser", True, False),
+    # ("generic.xml", "Generic XML", None, True, True),
+    ("genexpert.genexpert", "GeneXpert",
+     "GeneXpertParser", True, False),
+    ("horiba.jobinyvon.icp", "Horiba Jobin-Yvon - ICP",
+     "HoribaJobinYvonCSVParser", True, False),
+    ("lachat.quickchem", "LaChat QuickChem FIA",
+     "LaChatQuickCheckFIAParser", True, True),
+    ("lifetechnologies.qubit.qubit", "Life Technolgies - Qubit",
+     "QuBitCSVParser", True, False),
+    ("metler.toledo.dl55", "Metler Toledo DL55",
+     "MetlerToledoDL55Parser", True, False),
+    ("myself.myinstrument", "My Instrument",
+     "MyInstrumentCSVParser", True, False),
+    ("nuclisens.easyq", "Nuclisens EasyQ",
+     "EasyQXMLParser", True, False),
+    ("panalytical.omnia.axios_xrf", "PANalytical - Omnia - Axios XRF",
+     "AxiosXrfCSVParser", True, False),
+    ("rigaku.supermini.wxrf", "Rigaku Supermini - WXRF",
+     "RigakuSuperminiWXRFCSVParser", True, False),
+    ("rochecobas.taqman.model48", "Roche Cobas - Taqman - 48",
+     "RocheCobasTaqmanParser", True, False),
+    ("rochecobas.taqman.model96", "Roche Cobas - Taqman - 96",
+     "RocheCobasTaqmanRSFParser", True, False),
+    ("scilvet.abc.plus", "ScilVet abc - Plus",
+     "AbaxisVetScanCSVVS2Parser", True, False),
+    ("sealanalytical.aq2.aq2", "Seal Analytics - AQ2",
+     "SealAnalyticsAQ2CSVParser", True, False),
+    ("shimadzu.gcms.qp2010se", "Shimadzu - GCMS-QP2010 SE",
+     "GCMSQP2010SECSVParser", True, False),
+    ("shimadzu.gcms.tq8030", "Shimadzu GCMS-TQ8030 GC/MS/MS",
+     "GCMSTQ8030GCMSMSCSVParser", True, False),
+    ("shimadzu.icpe.multitype", "Shimadzu ICPE-9000 Multitype",
+     "ICPEMultitypeCSVParser", True, False),
+    ("shimadzu.nexera.LC2040C", "Shimadzu HPLC-PDA Nexera-I LC2040C",
+     "TSVParser", True, False),
+    ("shimadzu.nexera.LCMS8050", "Shimadzu LC MS/MS Nexera X2 LCMS-8050",
+     "TSVParser", True, False),
+    # No auto-import for the 1000i, 1800i and 4000i: their modules do not
+    # provide a parser of their own
+    ("sysmex.xs.i1000", "Sysmex XS - 1000i", None, True, False),
+    ("sysmex.xs.i500", "Sysmex XS - 500i",
+     "SysmexXS500iCSVParser", True, False),
+    ("sysmex.xt.i1800", "Sysmex XT - 1800i", None, True, False),
+    ("sysmex.xt.i4000", "Sysmex XT - 4000i", None, True, False),
+    ("tescan.tima.tima", "Tescan - TIMA",
+     "TimaCSVParser", True, False),
+    ("thermoscientific.arena.xt20", "Thermo Scientific - Arena 20XT",
+     "ThermoArena20XTRPRCSVParser", True, False),
+    ("thermoscientific.gallery.Ts9861x", "Thermo Scientific - Gallery 9861x",
+     "ThermoGallery9861xTSVParser", True, False),
+    ("thermoscientific.multiskan.go",
+     "Thermo Scientific Multiskan - GO Microplate Spectrophotometer",
+     "ThermoScientificMultiskanGOCSVParser", True, False),
+    ("varian.vistapro.icp", "Varian Vista-PRO ICP",
+     "VistaPROICPParser", True, True),
+    ("cobasintegra.model_400_plus.model_400_plus", "Cobas Integra 400 plus",
+     "CobasIntegra400plus2CSVParser", True, False),
+    ("facscalibur.calibur.model_e9750", "FACS Calibur",
+     "FacsCalibur2CSVParser", True, False),
+)
+
+# TODO Remove this once classic instrument interface migrated
+__all__ = [entry[0] for entry in INSTRUMENT_INTERFACES]
+
 # TODO Remove this once classic instrument interface migrated
-PARSERS = [
-           ['abaxis.vetscan.vs2', 'AbaxisVetScanCSVVS2Parser'],
-           ['abbott.m2000rt.m2000rt', 'Abbottm2000rtTSVParser'],
-           ['alere.pima.beads', 'AlerePimaSLKParser'],
-           ['alere.pima.cd4', 'AlerePimacd4SLKParser'],
-           ['beckmancoulter.access.model2', 'BeckmancoulterAccess2CSVParser'],
-           ['biodrop.ulite.ulite', 'BioDropCSVParser'],
-           ['eltra.cs.cs2000', 'EltraCS2000CSVParser'],
-           ['foss.fiastar.fiastar', 'FOSSFIAStarCSVParser'],
-           ['foss.winescan.auto', 'WinescanAutoCSVParser'],
-           ['foss.winescan.ft120', 'WinescanFT120CSVParser'],
-           ['generic.two_dimension', 'TwoDimensionCSVParser'],
-           # ['generic.xml', ''],
-           ['horiba.jobinyvon.icp', 'HoribaJobinYvonCSVParser'],
-           ['metler.toledo.dl55', 'MetlerToledoDL55Parser'],
-           ['rigaku.supermini.wxrf', 'RigakuSuperminiWXRFCSVParser'],
-           ['rochecobas.taqman.model48', 'RocheCobasTaqmanParser'],
-           ['rochecobas.taqman.model96', 'RocheCobasTaqmanRSFParser'],
-           ['thermoscientific.arena.xt20', 'ThermoArena20XTRPRCSVParser'],
-           ['thermoscientific.gallery.Ts9861x', 'ThermoGallery9861xTSVParser'],
-           ['panalytical.omnia.axios_xrf', 'AxiosXrfCSVParser'],
-           ['lachat.quickchem', 'LaChatQuickCheckFIAParser'],
-           ['lifetechnologies.qubit.qubit', 'QuBitCSVParser'],
-           ['sysmex.xs.i500', 'SysmexXS500iCSVParser'],
-           ['sysmex.xs.i1000', 'SysmexXS500iCSVParser'],
-           ['shimadzu.icpe.multitype', 'ICPEMultitypeCSVParser'],
-           ['shimadzu.gcms.qp2010se', 'GCMSQP2010SECSVParser'],
-           ['shimadzu.gcms.tq8030', 'GCMSTQ8030GCMSMSCSVParser'],
-           ['shimadzu.nexera.LC2040C', 'TSVParser'],
-           ['shimadzu.nexera.LCMS8050', 'TSVParser'],
-           ['sysmex.xt.i1800', 'SysmexXT1800iParser'],
-           ['sysmex.xt.i4000', 'SysmexXT1800iParser'],
-           ['scilvet.abc.plus', 'AbaxisVetScanCSVVS2Parser'],
-           ['sealanalytical.aq2.aq2', 'SealAnalyticsAQ2CSVParser'],
-           ['tescan.tima.tima', 'TimaCSVParser'],
-           ['thermoscientific.multiskan.go', 'ThermoScientificMultiskanGOCSVParser'],
-           ['myself.myinstrument', 'MyInstrumentCSVParser'],
-           ['nuclisens.easyq', 'EasyQXMLParser'],
-           ['genexpert.genexpert', 'GeneXpertParser'],
-           ['varian.vistapro.icp', 'VistaPROICPParser'],
-           ['cobasintegra.model_400_plus.model_400_plus','CobasIntegra400plus2CSVParser'],
-           ['facscalibur.calibur.model_e9750', 'FacsCalibur2CSVParser'],
-           ]
+PARSERS = [[entry[0], entry[2]] for entry in INSTRUMENT_INTERFACES
+           if entry[2]]
+
+_registry = None
+
+
+class ClassicInstrumentInterface(object):
+    """Classic (module based) instrument interface. The module is imported on
+    first access to any of its attributes, e.g. `Import` or `Export`
+    """
+
+    def __init__(self, id, title, parser=None, is_import=True,
+                 is_export=False):
+        self.id = id
+        self.title = title
+        self.parser = parser
+        self.is_import = is_import
+        self.is_export = is_export
+        self.__name__ = "{}.{}".format(__name__, id)
+        self._module = None
+
+    def get_module(self):
+        """Returns the module of this interface, imported on first call
+        """
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, name):
+        # Only called for the attributes not defined above
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get_module(), name)
+
+    def __repr__(self):
+        return "<ClassicInstrumentInterface {}>".format(self.id)
+
+
+def get_registry():
+    """Returns an ordered list of tuples (id, interface) of the classic
+    instrument interfaces. The registry is built once
+    """
+    global _registry
+    if _registry is None:
+        _registry = map(lambda entry: (entry[0],
+                                       ClassicInstrumentInterface(*entry)),
+                        INSTRUMENT_INTERFACES)
+    return _registry
 
 
 def get_instrument_interfaces():
@@ -184,13 +199,7 @@ def get_instrument_interfaces():
 
     # TODO Remove the following code once clasic instrument interfaces migrated
     # Now grab the information (the old way)
-    curr_module = sys.modules[__name__]
-    for name, obj in inspect.getmembers(curr_module):
-        if hasattr(obj, '__name__'):
-            obj_name = obj.__name__.replace(__name__, "")
-            obj_name = obj_name and obj_name[1:] or ""
-            if obj_name in __all__:
-                interfaces.append((obj_name, obj))
+    interfaces.extend(get_registry())
     return interfaces
 
 
@@ -201,10 +210,8 @@ def is_import_interface(instrument_interface):
         return True
 
     # TODO Remove this once classic instrument interface migrated
-    if hasattr(instrument_interface, '__name__'):
-        obj_name = instrument_interface.__name__.replace(__name__, "")
-        if obj_name[1:] in __all__ and hasattr(instrument_interface, "Import"):
-            return True
+    if isinstance(instrument_interface, ClassicInstrumentInterface):
+        return instrument_interface.is_import
     return False
 
 
@@ -215,10 +222,8 @@ def is_export_interface(instrument_interface):
         return True
 
     # TODO Remove this once classic instrument interface migrated
-    if hasattr(instrument_interface, '__name__'):
-        obj_name = instrument_interface.__name__.replace(__name__, "")
-        if obj_name[1:] in __all__ and hasattr(instrument_interface, "Export"):
-            return True
+    if isinstance(instrument_interface, ClassicInstrumentInterface):
+        return instrument_interface.is_export
     return False
 
 
@@ -240,6 +245,11 @@ def get_instrument_export_interfaces():
 def getExim(exim_id):
     """Returns the instrument interface for the exim_id passed in
     """
+    # TODO Remove this once classic instrument interface migrated
+    for id, interface in get_registry():
+        if id == exim_id:
+            return interface
+
     interfaces = filter(lambda i: i[0]==exim_id, get_instrument_interfaces())
     return interfaces and interfaces[0][1] or None
 
@@ -253,10 +263,10 @@ def get_automatic_parser(exim_id, infile):
         return adapter.get_automatic_parser(infile)
 
     # TODO Remove this once classic instrument interface migrated
-    parser_func = filter(lambda i: i[0] == exim_id, PARSERS)
-    parser_func = parser_func and parser_func[0][1] or None
-    if not parser_func or not hasattr(adapter, parser_func):
+    if not isinstance(adapter, ClassicInstrumentInterface) or \
+            not adapter.parser:
+        return None
+    parser_func = getattr(adapter.get_module(), adapter.parser, None)
+    if not parser_func:
         return None
-    parser_func = getattr(adapter, parser_func)
     return parser_func(infile)
-  
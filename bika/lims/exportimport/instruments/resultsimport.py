@@ -25,13 +25,36 @@ from Products.CMFCore.utils import getToolByName
 from Products.CMFPlone.utils import _createObjectByType
 from bika.lims import api
 from bika.lims import bikaMessageFactory as _, logger
+from bika.lims.api.analysis import calculate_results
 from bika.lims.catalog import CATALOG_ANALYSIS_REQUEST_LISTING
+from bika.lims.catalog import idlookup
 from bika.lims.exportimport.instruments.logger import Logger
 from bika.lims.idserver import renameAfterCreation
+from bika.lims.interfaces import ISubmitted
 from bika.lims.utils import t
 from bika.lims.utils import tmpID
 from bika.lims.workflow import doActionFor
 
+# (criteria, index, metadata column) to search samples by object id
+SAMPLE_SEARCH_CRITERIA = (
+    ("arid", "getId", "getId"),
+    ("csid", "getClientSampleID", "getClientSampleID"),
+    ("aruid", "UID", "UID"),
+)
+
+# metadata column -> field of the ID lookup index
+SAMPLE_LOOKUP_FIELDS = {
+    "getId": "id",
+    "getClientSampleID": "getClientSampleID",
+}
+
+# (criteria, index, metadata column) to search reference analyses by object id
+REFERENCE_SEARCH_CRITERIA = (
+    ("rgid", "getReferenceAnalysesGroupID", "getReferenceAnalysesGroupID"),
+    ("rid", "id", "getId"),
+    ("ruid", "UID", "UID"),
+)
+
 
 class InstrumentResultsFileParser(Logger):
 
@@ -374,6 +397,7 @@ class AnalysisResultsImporter(Logger):
         if not self._idsearch:
             self._idsearch = ['getId']
         self.instrument_uid = instrument_uid
+        self.prefetch([])
 
     def getParser(self):
         """ Returns the parser that will be used for the importer
@@ -439,11 +463,11 @@ class AnalysisResultsImporter(Logger):
         importedinsts = {}
         rawacodes = self._parser.getAnalysisKeywords()
         exclude = self.getKeywordsToBeExcluded()
+        services = self.getServicesByKeyword(rawacodes)
         for acode in rawacodes:
             if acode in exclude or not acode:
                 continue
-            service = self.bsc(getKeyword=acode)
-            if not service:
+            if acode not in services:
                 self.warn('Service keyword ${analysis_keyword} not found',
                           mapping={"analysis_keyword": acode})
             else:
@@ -456,18 +480,22 @@ class AnalysisResultsImporter(Logger):
         attachments = {}
         infile = self._parser.getInputFile()
 
-        for objid, results in self._parser.getRawResults().iteritems():
+        # Resolve the samples, reference samples and analyses of all the
+        # parsed object ids at once
+        rawresults = self._parser.getRawResults()
+        self.prefetch(rawresults.keys())
+
+        for objid, results in rawresults.iteritems():
             # Allowed more than one result for the same sample and analysis.
             # Needed for calibration tests
             for result in results:
-                analyses = self._getZODBAnalyses(objid)
+                analyses = self._getAnalysesBrains(objid)
                 inst = None
                 if len(analyses) == 0 and self.instrument_uid:
                     # No registered analyses found, but maybe we need to
                     # create them first if an instruemnt id has been set in
-                    insts = self.bsc(portal_type='Instrument',
-                                     UID=self.instrument_uid)
-                    if len(insts) == 0:
+                    inst = self.getInstrument()
+                    if inst is None:
                         # No instrument found
                         self.warn("No Sample with "
                                   "'${allowed_ar_states}' "
@@ -479,8 +507,6 @@ class AnalysisResultsImporter(Logger):
                         self.warn("Instrument not found")
                         continue
 
-                    inst = insts[0].getObject()
-
                     # Create a new ReferenceAnalysis and link it to
                     # the Instrument
                     # Here we have an objid (i.e. R01200012) and
@@ -488,11 +514,11 @@ class AnalysisResultsImporter(Logger):
                     # How can we create a ReferenceAnalysis if we don't know
                     # which ReferenceSample we might use?
                     # Ok. The objid HAS to be the ReferenceSample code.
-                    refsample = self.bc(portal_type='ReferenceSample', id=objid)
-                    if refsample and len(refsample) == 1:
-                        refsample = refsample[0].getObject()
+                    refsample = self.getReferenceSamples().get(objid, [])
+                    if len(refsample) == 1:
+                        refsample = api.get_object(refsample[0])
 
-                    elif refsample and len(refsample) > 1:
+                    elif len(refsample) > 1:
                         # More than one reference sample found!
                         self.warn(
                             "More than one reference sample found for"
@@ -508,10 +534,9 @@ class AnalysisResultsImporter(Logger):
 
                     # For each acode, create a ReferenceAnalysis and attach it
                     # to the Reference Sample
-                    services = self.bsc(portal_type='AnalysisService')
-                    service_uids = [service.UID for service in services
-                                    if service.getObject().getKeyword()
-                                    in result.keys()]
+                    service_uids = []
+                    for keyword in result.keys():
+                        service_uids.extend(services.get(keyword, []))
                     analyses = inst.addReferences(refsample, service_uids)
 
                 elif len(analyses) == 0:
@@ -526,6 +551,12 @@ class AnalysisResultsImporter(Logger):
                                  "object_id": objid})
                     continue
 
+                # Map the analyses (brains or objects) by keyword
+                analyses_by_keyword = {}
+                for analysis in analyses:
+                    keyword = self._getKeyword(analysis)
+                    analyses_by_keyword.setdefault(keyword, []).append(analysis)
+
                 # Look for timestamp
                 capturedate = result.get('DateTime', {}).get('DateTime', None)
                 if capturedate:
@@ -535,8 +566,8 @@ class AnalysisResultsImporter(Logger):
                         # Analysis keyword doesn't exist
                         continue
 
-                    ans = [analysis for analysis in analyses
-                           if analysis.getKeyword() == acode]
+                    ans = filter(self._isAllowedAnalysis,
+                                 analyses_by_keyword.get(acode, []))
 
                     if len(ans) > 1:
                         self.warn("More than one analysis found for "
@@ -552,7 +583,7 @@ class AnalysisResultsImporter(Logger):
                                            "analysis_keyword": acode})
                         continue
 
-                    analysis = ans[0]
+                    analysis = api.get_object(ans[0])
 
                     # Create attachment in worksheet linked to this analysis.
                     # Only if this import has not already created the
@@ -699,68 +730,183 @@ class AnalysisResultsImporter(Logger):
             fn_attachments[fn].append(att)
         return fn_attachments
 
-    def _getObjects(self, objid, criteria, states):
-        # self.log("Criteria: %s %s") % (criteria, obji))
-        obj = []
-        if criteria in ['arid']:
-            obj = self.ar_catalog(
-                           getId=objid,
-                           review_state=states)
-        elif criteria == 'csid':
-            obj = self.ar_catalog(
-                           getClientSampleID=objid,
-                           review_state=states)
-        elif criteria == 'aruid':
-            obj = self.ar_catalog(
-                           UID=objid,
-                           review_state=states)
-        elif criteria == 'rgid':
-            obj = self.bac(portal_type=['ReferenceAnalysis',
-                                        'DuplicateAnalysis'],
-                           getReferenceAnalysesGroupID=objid)
-        elif criteria == 'rid':
-            obj = self.bac(portal_type=['ReferenceAnalysis',
-                                        'DuplicateAnalysis'], id=objid)
-        elif criteria == 'ruid':
-            obj = self.bac(portal_type=['ReferenceAnalysis',
-                                        'DuplicateAnalysis'], UID=objid)
-        if obj and len(obj) > 0:
+    def getServicesByKeyword(self, keywords):
+        """Returns a mapping of keyword -> list of service UIDs for the
+        keywords passed in, with a single catalog query
+        """
+        keywords = filter(None, keywords)
+        services = {}
+        if not keywords:
+            return services
+        brains = self.bsc(portal_type="AnalysisService", getKeyword=keywords)
+        for brain in brains:
+            services.setdefault(brain.getKeyword, []).append(brain.UID)
+        return services
+
+    def getInstrument(self):
+        """Returns the instrument the results are imported to, if any
+        """
+        if not self.instrument_uid:
+            return None
+        if self._instrument is None:
+            insts = self.bsc(portal_type="Instrument", UID=self.instrument_uid)
+            self._instrument = insts and api.get_object(insts[0]) or None
+        return self._instrument
+
+    def getReferenceSamples(self):
+        """Returns a mapping of object id -> list of ReferenceSample brains
+        for the prefetched object ids, with a single catalog query
+        """
+        if self._refsamples is None:
+            brains = self._objids and self.bc(portal_type="ReferenceSample",
+                                              id=self._objids) or []
+            self._refsamples = self._groupBy(brains, "getId")
+        return self._refsamples
+
+    def prefetch(self, objids):
+        """Searches the samples, reference analyses and analyses of all the
+        object ids passed in with a handful of catalog queries.
+
+        The object ids can be either Sample IDs, Client Sample IDs, Sample
+        UIDs or the group ID, ID or UID of Reference Analyses. The analyses of
+        each object id are resolved later on demand from the prefetched data
+        """
+        self._objids = filter(None, objids)
+        self._instrument = None
+        self._refsamples = None
+        self._analyses = {}
+        self._searchresults = {}
+        self._sampleanalyses = {}
+
+        allowed_ar_states = self.getAllowedARStates()
+        allowed_an_states = self.getAllowedAnalysisStates()
+        if not self._objids:
+            return
+
+        # Samples in allowed states matching the object ids
+        sample_uids = set()
+        for criteria, index, column in SAMPLE_SEARCH_CRITERIA:
+            query = {index: self._objids, "review_state": allowed_ar_states}
+            uids = self._lookupSampleUIDs(column)
+            if uids is not None:
+                # resolved with the ID lookup index
+                query = {"UID": uids, "review_state": allowed_ar_states}
+            if uids == []:
+                # none of the object ids is a known sample
+                brains = []
+            else:
+                brains = self.ar_catalog(query)
+            sample_uids.update(map(api.get_uid, brains))
+            self._searchresults[criteria] = self._groupBy(brains, column)
+
+        # Reference and duplicate analyses matching the object ids
+        for criteria, index, column in REFERENCE_SEARCH_CRITERIA:
+            query = {index: self._objids,
+                     "portal_type": ["ReferenceAnalysis", "DuplicateAnalysis"]}
+            brains = self.bac(query)
+            self._searchresults[criteria] = self._groupBy(brains, column)
+
+        # Analyses in allowed states from the samples found
+        if not sample_uids:
+            return
+        brains = self.bac(portal_type="Analysis",
+                          getAncestorsUIDs=list(sample_uids),
+                          review_state=allowed_an_states)
+
+        # Analyses of partitions belong to their ancestor samples as well
+        parents = {}
+        pending = set(map(lambda brain: brain.getParentUID, brains))
+        while pending:
+            for sample in self.ar_catalog(UID=list(pending)):
+                parent = sample.getRawParentAnalysisRequest
+                parents[api.get_uid(sample)] = parent or None
+            for uid in pending:
+                parents.setdefault(uid, None)
+            pending = set(filter(None, parents.values())) - set(parents)
+
+        for brain in brains:
+            uid = brain.getParentUID
+            while uid:
+                if uid in sample_uids:
+                    self._sampleanalyses.setdefault(uid, []).append(brain)
+                uid = parents.get(uid)
+
+    def _lookupSampleUIDs(self, column):
+        """Returns the UIDs of the samples whose value for the column matches
+        with any of the prefetched object ids, from the ID lookup index.
+        Returns None if the column is not kept in the index
+        """
+        field = SAMPLE_LOOKUP_FIELDS.get(column)
+        if field is None or not idlookup.is_available():
+            return None
+        uids = set()
+        for objid in self._objids:
+            records = idlookup.lookup(objid, fields=[field],
+                                      portal_types=["AnalysisRequest"])
+            uids.update(map(lambda record: record["uid"], records))
+        return list(uids)
+
+    def _groupBy(self, brains, column):
+        """Returns a mapping of metadata column value -> list of brains
+        """
+        groups = {}
+        for brain in brains:
+            groups.setdefault(getattr(brain, column, None), []).append(brain)
+        return groups
+
+    def _getKeyword(self, analysis):
+        """Returns the keyword of the analysis brain or object
+        """
+        if api.is_brain(analysis):
+            return analysis.getKeyword
+        return analysis.getKeyword()
+
+    def _isAllowedAnalysis(self, analysis):
+        """Checks if the current status of the analysis allows the import
+        """
+        if api.get_portal_type(analysis) != "Analysis":
+            return True
+        # the status might have changed since the analysis was prefetched
+        status = api.get_review_status(api.get_object(analysis))
+        return status in self.getAllowedAnalysisStates()
+
+    def _getSearchResults(self, objid, criteria):
+        """Returns the prefetched brains for the object id and criteria
+        """
+        brains = self._searchresults.get(criteria, {}).get(objid, [])
+        if brains:
             self._priorizedsearchcriteria = criteria
-        return obj
+        return brains
 
-    def _getZODBAnalyses(self, objid):
-        """ Searches for analyses from ZODB to be filled with results.
-            objid can be either AR ID or Worksheet's Reference Sample IDs.
-            Only analyses that matches with getAnallowedAnalysisStates() will
+    def _getAnalysesBrains(self, objid):
+        """ Returns the analyses from the prefetched data to be filled with
+            results. objid can be either AR ID or Worksheet's Reference Sample
+            IDs.
+            Only analyses that matches with getAllowedAnalysisStates() will
             be returned. If not a ReferenceAnalysis, getAllowedARStates() is
             also checked.
             Returns empty array if no analyses found
         """
-        # ars = []
+        if objid in self._analyses:
+            return self._analyses[objid]
+
+        if objid not in self._objids:
+            # not prefetched yet
+            self._objids.append(objid)
+            self.prefetch(self._objids)
+
         analyses = []
-        searchcriteria = ['getId', 'getClientSampleID']
-        allowed_ar_states = self.getAllowedARStates()
         allowed_an_states = self.getAllowedAnalysisStates()
-        # allowed_ar_states_msg = [_(s) for s in allowed_ar_states]
         allowed_an_states_msg = [_(s) for s in allowed_an_states]
 
         # Acceleration of searches using priorization
         if self._priorizedsearchcriteria in ['rgid', 'rid', 'ruid']:
             # Look from reference analyses
-            analyses = self._getZODBAnalysesFromReferenceAnalyses(
+            analyses = self._getAnalysesFromReferenceAnalyses(
                     objid, self._priorizedsearchcriteria)
         if len(analyses) == 0:
             # Look from ar and derived
-            analyses = self._getZODBAnalysesFromAR(objid,
-                                                   '',
-                                                   searchcriteria,
-                                                   allowed_ar_states)
-
-        # Discard analyses that don't match with allowed_an_states
-        analyses = [analysis for analysis in analyses
-                    if analysis.portal_type != 'Analysis' or
-                    self.wf.getInfoFor(analysis, 'review_state')
-                    in allowed_an_states]
+            analyses = self._getAnalysesFromAR(objid)
 
         if len(analyses) == 0:
             self.warn(
@@ -770,62 +916,53 @@ class AnalysisResultsImporter(Logger):
                     allowed_an_states_msg),
                          "object_id": objid})
 
+        self._analyses[objid] = analyses
         return analyses
 
-    def _getZODBAnalysesFromAR(self, objid, criteria,
-                               allowedsearches, arstates):
+    def _getZODBAnalyses(self, objid):
+        """ Searches for analyses from ZODB to be filled with results.
+            Returns the analysis objects of _getAnalysesBrains
+        """
+        return map(api.get_object, self._getAnalysesBrains(objid))
+
+    def _getAnalysesFromAR(self, objid):
         ars = []
-        analyses = []
-        if criteria:
-            ars = self._getObjects(objid, criteria, arstates)
-            if not ars or len(ars) == 0:
-                return self._getZODBAnalysesFromAR(objid, None,
-                                                   allowedsearches, arstates)
-        else:
-            sortorder = ['arid', 'csid', 'aruid']
-            for crit in sortorder:
-                if (crit == 'arid' and 'getId' in allowedsearches) \
-                    or (crit == 'csid' and 'getClientSampleID'
-                                in allowedsearches) \
-                        or (crit == 'aruid' and 'getId' in allowedsearches):
-                    ars = self._getObjects(objid, crit, arstates)
-                    if ars and len(ars) > 0:
-                        break
-
-        if not ars or len(ars) == 0:
-            return self._getZODBAnalysesFromReferenceAnalyses(objid, None)
+        for criteria, index, column in SAMPLE_SEARCH_CRITERIA:
+            ars = self._getSearchResults(objid, criteria)
+            if ars:
+                break
+
+        if not ars:
+            return self._getAnalysesFromReferenceAnalyses(objid, None)
 
         elif len(ars) > 1:
             self.err("More than one Sample found for ${object_id}",
                      mapping={"object_id": objid})
             return []
 
-        ar = ars[0].getObject()
-        analyses = [analysis.getObject() for analysis in ar.getAnalyses()]
+        return self._sampleanalyses.get(api.get_uid(ars[0]), [])
 
-        return analyses
-
-    def _getZODBAnalysesFromReferenceAnalyses(self, objid, criteria):
+    def _getAnalysesFromReferenceAnalyses(self, objid, criteria):
         analyses = []
         if criteria:
-            refans = self._getObjects(objid, criteria, [])
+            refans = self._getSearchResults(objid, criteria)
             if len(refans) == 0:
                 return []
 
             elif criteria == 'rgid':
-                return [an.getObject() for an in refans]
+                return refans
 
             elif len(refans) == 1:
                 # The search has been made using the internal identifier
                 # from a Reference Analysis (id or uid). That is not usual.
-                an = refans[0].getObject()
+                an = api.get_object(refans[0])
                 worksheet = an.getWorksheet()
                 if worksheet:
                     # A regular QC test (assigned to a Worksheet)
-                    return [an, ]
+                    return refans
                 elif an.getInstrument():
                     # An Internal Calibration Test
-                    return [an, ]
+                    return refans
                 else:
                     # Oops. This should never happen!
                     # A ReferenceAnalysis must be always assigned to
@@ -845,10 +982,9 @@ class AnalysisResultsImporter(Logger):
                 return []
 
         else:
-            sortorder = ['rgid', 'rid', 'ruid']
-            for crit in sortorder:
-                analyses = self._getZODBAnalysesFromReferenceAnalyses(objid,
-                                                                      crit)
+            for criteria, index, column in REFERENCE_SEARCH_CRITERIA:
+                analyses = self._getAnalysesFromReferenceAnalyses(objid,
+                                                                  criteria)
                 if len(analyses) > 0:
                     return analyses
 
@@ -863,34 +999,41 @@ class AnalysisResultsImporter(Logger):
         :param objid: AR ID or Worksheet's Reference Sample IDs
         :param analysis: Analysis Object
         """
-        analyses = self._getZODBAnalyses(objid)
-        # Filter Analyses With Calculation
-        analyses_with_calculation = filter(
-                                        lambda an: an.getCalculation(),
-                                        analyses)
-        for analysis_with_calc in analyses_with_calculation:
+        # Only wake up the analyses with a calculation assigned
+        analyses = filter(lambda brain: brain.getCalculationUID,
+                          self._getAnalysesBrains(objid))
+        # The status might have changed within this import. Results of the
+        # analyses already submitted (e.g. calculated after the import of
+        # another dependency) are not calculated and submitted again
+        analyses = filter(self._isAllowedAnalysis,
+                          map(api.get_object, analyses))
+        analyses = filter(lambda an: not ISubmitted.providedBy(an), analyses)
+        # The analysis that we are currenly on
+        analysis_keyword = analysis.getKeyword()
+
+        def is_dependent(an):
             # Get the calculation to get the formula so that we can check
             # if param analysis keyword is used on the calculation formula
-            calcultion = analysis_with_calc.getCalculation()
-            formula = calcultion.getMinifiedFormula()
-            # The analysis that we are currenly on
-            analysis_keyword = analysis.getKeyword()
-            if analysis_keyword not in formula:
-                continue
-
-            # If the analysis_keyword is in the formula, it means that this
-            # analysis is a dependent on that calculated analysis
-            calc_passed = analysis_with_calc.calculateResult(override=self._override[1])
-            if calc_passed:
-                api.do_transition_for(analysis_with_calc, "submit")
-                self.log(
-                    "${request_id}: calculated result for "
-                    "'${analysis_keyword}': '${analysis_result}'",
-                    mapping={"request_id": objid,
-                             "analysis_keyword": analysis_with_calc.getKeyword(),
-                             "analysis_result": str(analysis_with_calc.getResult())}
-                )
-
+            calculation = an.getCalculation()
+            if not calculation:
+                return False
+            return analysis_keyword in calculation.getMinifiedFormula()
+
+        # If the analysis_keyword is in the formula, it means that this
+        # analysis is a dependent on that calculated analysis. Calculate
+        # them all at once, grouped by calculation
+        analyses_with_calculation = filter(is_dependent, analyses)
+        calculated = calculate_results(analyses_with_calculation,
+                                       override=self._override[1])
+        for analysis_with_calc in calculated:
+            api.do_transition_for(analysis_with_calc, "submit")
+            self.log(
+                "${request_id}: calculated result for "
+                "'${analysis_keyword}': '${analysis_result}'",
+                mapping={"request_id": objid,
+                         "analysis_keyword": analysis_with_calc.getKeyword(),
+                         "analysis_result": str(analysis_with_calc.getResult())}
+            )
 
     def _process_analysis(self, objid, analysis, values):
         resultsaved = False
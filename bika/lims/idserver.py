@@ -33,6 +33,7 @@ from bika.lims.interfaces import IAnalysisRequestPartition
 from bika.lims.interfaces import IAnalysisRequestRetest
 from bika.lims.interfaces import IAnalysisRequestSecondary
 from bika.lims.interfaces import IIdServer
+from bika.lims.interfaces import ISampleType
 from bika.lims.numbergenerator import INumberGenerator
 from DateTime import DateTime
 from Products.ATContentTypes.utils import DT2dt
@@ -404,9 +405,9 @@ def get_counted_number(context, config, variables, **kw):
     return number
 
 
-def get_generated_number(context, config, variables, **kw):
-    """Generate a new persistent number with the number generator for the
-    sequence type "Generated"
+def get_generated_key(context, config, variables, **kw):
+    """Returns the key of the number generator storage for the sequence type
+    "Generated"
     """
     # separator where to split the ID
     separator = kw.get('separator', '-')
@@ -423,9 +424,6 @@ def get_generated_number(context, config, variables, **kw):
     # The prefix template is the static part of the ID
     prefix_template = slice(id_template, separator=separator, end=split_length)
 
-    # get the number generator
-    number_generator = getUtility(INumberGenerator)
-
     # generate the key for the number generator storage
     prefix = prefix_template.format(**variables)
 
@@ -433,7 +431,63 @@ def get_generated_number(context, config, variables, **kw):
     prefix = api.normalize_filename(prefix)
 
     # The key used for the storage
-    key = make_storage_key(portal_type, prefix)
+    return make_storage_key(portal_type, prefix)
+
+
+def get_sample_generated_key(client, values):
+    """Returns the key of the number generator storage used for the ID of a
+    Sample to be created in the client with the given values. Returns None if
+    the ID is not generated or the key depends on the created Sample
+    """
+    # Secondary Samples are renamed after creation with their own key
+    if values.get("PrimaryAnalysisRequest"):
+        return None
+
+    portal_type = "AnalysisRequest"
+    config = get_config(None, portal_type=portal_type)
+    if config.get("sequence_type", "generated") != "generated":
+        return None
+
+    sample_type = values.get("SampleType")
+    if api.is_uid(sample_type):
+        sample_type = api.get_object_by_uid(sample_type, default=None)
+    if not ISampleType.providedBy(sample_type):
+        return None
+
+    # Variables as computed by `get_variables` once the Sample is created
+    now = DateTime()
+    variables = {
+        "portal_type": portal_type,
+        "year": get_current_year(),
+        "parent": client,
+        "seq": 0,
+        "alpha": Alphanumber(0),
+        "clientId": client.getClientID(),
+        "dateSampled": DT2dt(api.to_date(values.get("DateSampled"), now)),
+        "samplingDate": DT2dt(api.to_date(values.get("SamplingDate"), now)),
+        "sampleType": sample_type.getPrefix(),
+        "test_count": 1,
+    }
+    try:
+        return get_generated_key(None, config, variables,
+                                 portal_type=portal_type)
+    except KeyError:
+        # e.g. the ID or the context of the Sample are part of the key
+        return None
+
+
+def get_generated_number(context, config, variables, **kw):
+    """Generate a new persistent number with the number generator for the
+    sequence type "Generated"
+    """
+    # The ID format for string interpolation, e.g. WS-{seq:03d}
+    id_template = config.get("form", "")
+
+    # get the number generator
+    number_generator = getUtility(INumberGenerator)
+
+    # The key used for the storage
+    key = get_generated_key(context, config, variables, **kw)
 
     if not kw.get("dry_run", False):
         # Generate a new number
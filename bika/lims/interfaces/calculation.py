@@ -115,6 +115,18 @@ class ICalculation(Interface):
         """Get the result calculated with TestParameters value.
         """
 
+    def getCompiledFormula():
+        """Get the compiled formula as a tuple of (code, keywords)
+        """
+
+    def getFormulaGlobals():
+        """Get the globals dictionary for the formula calculation
+        """
+
+    def evaluateFormula(mapping):
+        """Evaluate the compiled formula with the keyword values of mapping
+        """
+
     def workflow_script_activate(self):
         """A calculation cannot be re-activated if services it depends on
         are deactivated.
@@ -78,6 +78,24 @@ def load_brain_metadata(proxy, include_fields):
     return ret
 
 
+def load_brain_values(proxy, include_fields):
+    """Load the values of the given catalog metadata columns into a dictionary
+
+    Values that can not be serialized to JSON are converted to string
+    """
+    ret = {}
+    for column in include_fields:
+        val = getattr(proxy, column, None)
+        if val == Missing.Value:
+            val = None
+        try:
+            json.dumps(val)
+        except:
+            val = str(val)
+        ret[column] = val
+    return ret
+
+
 def load_field_values(instance, include_fields):
     """Load values from an AT object schema fields into a list of dictionaries
     """
@@ -18,6 +18,7 @@
 # Copyright 2018-2020 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
+from Products.Archetypes import listTypes
 from Products.CMFPlone.utils import safe_unicode
 from bika.lims import logger, to_utf8
 from bika.lims.interfaces import IJSONReadExtender
@@ -26,15 +27,208 @@ from plone.jsonapi.core import router
 from plone.jsonapi.core.interfaces import IRouteProvider
 from plone.protect.authenticator import AuthenticatorView
 from bika.lims.jsonapi import load_brain_metadata
+from bika.lims.jsonapi import load_brain_values
 from bika.lims.jsonapi import load_field_values
 from bika.lims.jsonapi import get_include_methods
 from bika.lims.jsonapi import load_method_values
+from DateTime import DateTime
 from Products.CMFCore.utils import getToolByName
 from zope import interface
 from zope.component import getAdapters
+from zope.component import getSiteManager
+import base64
+import json
 import re
 import App
 
+# Index types that support range queries, required for cursor pagination
+CURSOR_INDEX_TYPES = ("FieldIndex", "DateIndex")
+
+# Number of objects written at once to the response when streaming
+STREAM_CHUNK_SIZE = 100
+
+# portal_type -> IJSONReadExtender factories registered for it
+_read_extenders = {}
+
+
+def get_read_extenders(portal_type):
+    """Returns the IJSONReadExtender factories registered for the objects of
+    the given portal type or None if the type can not be resolved
+    """
+    if portal_type in _read_extenders:
+        return _read_extenders[portal_type]
+    extenders = None
+    for data in listTypes():
+        if data["portal_type"] != portal_type:
+            continue
+        spec = interface.implementedBy(data["klass"])
+        registry = getSiteManager().adapters
+        extenders = map(lambda item: item[1],
+                        registry.lookupAll((spec, ), IJSONReadExtender))
+        break
+    _read_extenders[portal_type] = extenders
+    return extenders
+
+
+def has_read_extenders(portal_type, include_fields=None):
+    """Checks if there are IJSONReadExtender adapters for the objects of the
+    given portal type that add any of the fields requested. Returns True if
+    the type can not be resolved
+
+    Extenders can declare the keys they add to the data with the `fields`
+    attribute, so they are skipped if none of these keys is requested
+    """
+    extenders = get_read_extenders(portal_type)
+    if extenders is None:
+        return True
+    for extender in extenders:
+        fields = getattr(extender, "fields", None)
+        if fields is None or not include_fields:
+            return True
+        if set(fields).intersection(include_fields):
+            return True
+    return False
+
+
+def is_brain_only(catalog, include_fields, include_methods):
+    """Checks if the data requested can be read from the catalog metadata,
+    so that the objects do not need to be waken-up
+    """
+    if not include_fields or include_methods:
+        return False
+    columns = catalog.schema()
+    return all(map(lambda field: field in columns, include_fields))
+
+
+def encode_cursor(value, uid):
+    """Returns an opaque cursor for the sort value and UID passed in
+    """
+    if isinstance(value, DateTime):
+        value = {"DateTime": value.ISO8601()}
+    return base64.urlsafe_b64encode(json.dumps([value, uid]))
+
+
+def decode_cursor(cursor):
+    """Returns the sort value and the UID from the cursor passed in
+    """
+    try:
+        value, uid = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        raise ValueError("bad cursor: {}".format(cursor))
+    if isinstance(value, dict) and "DateTime" in value:
+        value = DateTime(value["DateTime"])
+    elif isinstance(value, unicode):
+        # metadata stores strings encoded
+        value = to_utf8(value)
+    return value, to_utf8(uid)
+
+
+def get_cursor_page(catalog, query, cursor, page_size):
+    """Returns the brains after the cursor and the cursor of the next page
+
+    Results are ordered by the sort value and the UID, so that the order is
+    stable even if many objects have the same sort value. The objects with the
+    sort value of the cursor are fetched with a range query and skipped here.
+
+    :param catalog: catalog to search
+    :param query: catalog query, with `sort_on` and `sort_order`
+    :param cursor: cursor returned for the previous page or empty
+    :param page_size: maximum number of brains to return
+    :returns: tuple of (brains, next cursor or None)
+    """
+    sort_on = query["sort_on"]
+    index = catalog.Indexes.get(sort_on)
+    if index is None or index.meta_type not in CURSOR_INDEX_TYPES \
+            or sort_on not in catalog.schema():
+        raise ValueError("sort_on '{}' can not be used with cursor"
+                         .format(sort_on))
+    query = dict(query)
+    query.pop("sort_limit", None)
+    reverse = query.get("sort_order") in ("descending", "reverse")
+
+    last = None
+    if cursor:
+        last = decode_cursor(cursor)
+        if sort_on not in query:
+            query[sort_on] = {"query": last[0],
+                              "range": reverse and "max" or "min"}
+
+    def get_key(brain):
+        return getattr(brain, sort_on), brain.UID
+
+    page = []
+    has_more = False
+    for brain in catalog(**query):
+        key = get_key(brain)
+        if last is not None:
+            if (key >= last) if reverse else (key <= last):
+                # already returned in a previous page
+                continue
+        if len(page) >= page_size and key[0] != get_key(page[-1])[0]:
+            # all the objects with the same sort value are in the page
+            has_more = True
+            break
+        page.append(brain)
+
+    page.sort(key=get_key, reverse=reverse)
+    has_more = has_more or len(page) > page_size
+    page = page[:page_size]
+    next_cursor = None
+    if has_more and page:
+        next_cursor = encode_cursor(*get_key(page[-1]))
+    return page, next_cursor
+
+
+def get_object_data(request, proxy, include_fields, include_methods,
+                    brain_only=False):
+    """Returns the data of the object the catalog brain passed in refers to
+    """
+    if brain_only and not has_read_extenders(proxy.portal_type,
+                                             include_fields):
+        # Requested data is catalog metadata: do not wake-up the object
+        obj_data = load_brain_values(proxy, include_fields)
+        obj_data['path'] = proxy.getPath()
+        return obj_data
+
+    obj_data = {}
+
+    # Place all proxy attributes into the result.
+    obj_data.update(load_brain_metadata(proxy, include_fields))
+
+    # Place all schema fields ino the result.
+    obj = proxy.getObject()
+    obj_data.update(load_field_values(obj, include_fields))
+    # Add methods results
+    obj_data.update(load_method_values(obj, include_methods))
+
+    obj_data['path'] = "/".join(obj.getPhysicalPath())
+
+    # call any adapters that care to modify this data.
+    adapters = getAdapters((obj, ), IJSONReadExtender)
+    for name, adapter in adapters:
+        adapter(request, obj_data)
+
+    return obj_data
+
+
+def stream_objects(request, ret, objects):
+    """Writes the objects to the response as JSON lines, in chunks
+
+    Totals and the cursor of the next page are sent as response headers
+    """
+    response = request.response
+    response.setHeader("Content-Type", "application/x-ndjson")
+    response.setHeader("X-Total-Objects", str(ret["total_objects"]))
+    if ret.get("next_cursor"):
+        response.setHeader("X-Next-Cursor", ret["next_cursor"])
+    lines = []
+    for obj_data in objects:
+        lines.append(json.dumps(obj_data))
+        if len(lines) >= STREAM_CHUNK_SIZE:
+            response.write("\n".join(lines) + "\n")
+            lines = []
+    if lines:
+        response.write("\n".join(lines) + "\n")
 
 def read(context, request):
     tag = AuthenticatorView(context, request).authenticator()
@@ -90,6 +284,8 @@ def read(context, request):
 
     include_methods = get_include_methods(request)
 
+    brain_only = is_brain_only(catalog, include_fields, include_methods)
+
     # Get matching objects from catalog
     proxies = catalog(**contentFilter)
 
@@ -114,30 +310,16 @@ def read(context, request):
     # page_size == 0: show all
     if page_size == 0:
         page_size = len(proxies)
-    first_item_nr = page_size * page_nr
-    if first_item_nr > len(proxies):
+    if "cursor" in request:
+        # stable pagination by sort value and UID, regardless of the depth
         first_item_nr = 0
-    page_proxies = proxies[first_item_nr:first_item_nr + page_size]
-    for proxy in page_proxies:
-        obj_data = {}
-
-        # Place all proxy attributes into the result.
-        obj_data.update(load_brain_metadata(proxy, include_fields))
-
-        # Place all schema fields ino the result.
-        obj = proxy.getObject()
-        obj_data.update(load_field_values(obj, include_fields))
-        # Add methods results
-        obj_data.update(load_method_values(obj, include_methods))
-
-        obj_data['path'] = "/".join(obj.getPhysicalPath())
-
-        # call any adapters that care to modify this data.
-        adapters = getAdapters((obj, ), IJSONReadExtender)
-        for name, adapter in adapters:
-            adapter(request, obj_data)
-
-        ret['objects'].append(obj_data)
+        page_proxies, ret['next_cursor'] = get_cursor_page(
+            catalog, contentFilter, request.get("cursor"), page_size)
+    else:
+        first_item_nr = page_size * page_nr
+        if first_item_nr > len(proxies):
+            first_item_nr = 0
+        page_proxies = proxies[first_item_nr:first_item_nr + page_size]
 
     ret['total_objects'] = len(proxies)
     ret['first_object_nr'] = first_item_nr
@@ -146,8 +328,17 @@ def read(context, request):
         last_object_nr = ret['total_objects']
     ret['last_object_nr'] = last_object_nr
 
-    return ret
+    objects = (get_object_data(request, proxy, include_fields,
+                               include_methods, brain_only=brain_only)
+               for proxy in page_proxies)
 
+    if request.get("stream"):
+        # the returned data is not rendered once the response is streamed
+        stream_objects(request, ret, objects)
+        return ret
+
+    ret['objects'] = list(objects)
+    return ret
 
 class Read(object):
     interface.implements(IRouteProvider)
@@ -169,6 +360,14 @@ class Read(object):
             - catalog_name: uses portal_catalog if unspecified
             - limit  default=1
             - All catalog indexes are searched for in the request.
+            - page_size, page_nr: offset based pagination
+            - cursor: pagination by sort value and UID. Empty for the first
+              page, the next_cursor of the previous response otherwise
+            - stream: write the objects as JSON lines to the response
+
+        If all include_fields are catalog metadata and no include_methods are
+        requested, the data is read from the catalog without waking-up the
+        objects.
 
         {
             runtime: Function running time.
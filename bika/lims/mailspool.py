@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Durable spool and background delivery of outgoing emails
+
+Messages are written to a maildir-like spool on disk once the transaction
+that queued them commits, so that nothing is sent for aborted transactions
+and no message is lost if the instance is restarted. A background worker
+delivers the spooled messages over a single SMTP connection that is reused
+until the spool is idle, and retries failed deliveries with an increasing
+delay. The delivery status of each message is passed to a callback, e.g. to
+keep track of the status in the send log of the published reports.
+
+The worker is started when the first message is queued, or on the first
+request to the site if messages are left in the spool from a former process.
+
+The spool is a directory with the following folders:
+
+    tmp/     messages being written
+    new/     messages pending delivery, the name starts with the time of the
+             next delivery attempt
+    failed/  messages that could not be delivered after `MAX_ATTEMPTS`
+"""
+
+import json
+import os
+import smtplib
+import socket
+import threading
+import time
+import uuid
+
+import transaction
+from App.config import getConfiguration
+from bika.lims import logger
+
+# Name of the <product-config> section and key in zope.conf to define the
+# directory of the mail spool, e.g.:
+#
+#   <product-config bika.lims>
+#       mail_spool_directory /var/spool/senaite
+#   </product-config>
+PRODUCT_CONFIG = "bika.lims"
+SPOOL_DIRECTORY_KEY = "mail_spool_directory"
+
+# Max delivery attempts of a message before giving up
+MAX_ATTEMPTS = 5
+
+# Seconds to wait before the first retry, doubled after each failed attempt
+RETRY_DELAY = 60
+
+# Seconds without messages to deliver before the SMTP connection is closed
+IDLE_TIMEOUT = 30
+
+# Delivery status of the messages
+QUEUED = "queued"
+SENT = "sent"
+RETRY = "retry"
+FAILED = "failed"
+
+# Errors that are considered temporary and the delivery is retried
+DELIVERY_ERRORS = (smtplib.SMTPException, socket.error)
+
+
+class MailSpool(object):
+    """Maildir-like spool of outgoing messages
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for folder in ("tmp", "new", "failed"):
+            folder = os.path.join(path, folder)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+
+    def get_name(self, msg_id, next_attempt=0):
+        return "{:012d}.{}".format(int(next_attempt), msg_id)
+
+    def put(self, from_addr, to_addr, message, **info):
+        """Writes a new message to the spool
+
+        :param from_addr: envelope sender address
+        :param to_addr: envelope recipient address
+        :param message: the message as string
+        :param info: additional information passed to the status callback
+        :returns: id of the message
+        """
+        msg_id = "{:.6f}.{}".format(time.time(), uuid.uuid4().hex)
+        envelope = {
+            "id": msg_id,
+            "from_addr": from_addr,
+            "to_addr": to_addr,
+            "message": message,
+            "attempts": 0,
+            "error": None,
+            "info": info,
+        }
+        self.write(self.get_name(msg_id), envelope)
+        return msg_id
+
+    def write(self, name, envelope, folder="new"):
+        """Writes the envelope to the folder in a single atomic rename
+        """
+        tmp = os.path.join(self.path, "tmp", name)
+        with open(tmp, "wb") as f:
+            json.dump(envelope, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, os.path.join(self.path, folder, name))
+
+    def get_due(self, now=None):
+        """Returns the names of the messages to deliver, oldest first
+        """
+        now = now or time.time()
+        due = self.get_name("", next_attempt=now)
+        names = sorted(os.listdir(os.path.join(self.path, "new")))
+        return filter(lambda name: name <= due, names)
+
+    def load(self, name):
+        with open(os.path.join(self.path, "new", name), "rb") as f:
+            return json.load(f)
+
+    def remove(self, name):
+        os.remove(os.path.join(self.path, "new", name))
+
+    def retry(self, name, envelope, error):
+        """Schedules the next delivery attempt of the message
+
+        :returns: True if the message will be retried, False if it failed
+        """
+        envelope["attempts"] += 1
+        envelope["error"] = error
+        if envelope["attempts"] >= MAX_ATTEMPTS:
+            self.write(name, envelope, folder="failed")
+            self.remove(name)
+            return False
+        delay = RETRY_DELAY * 2 ** (envelope["attempts"] - 1)
+        new_name = self.get_name(envelope["id"], time.time() + delay)
+        self.write(new_name, envelope)
+        self.remove(name)
+        return True
+
+    def __len__(self):
+        return len(os.listdir(os.path.join(self.path, "new")))
+
+
+class SMTPSender(object):
+    """Sends messages over a persistent SMTP connection
+    """
+
+    def __init__(self, host, port, user=None, password=None, timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.connection = None
+
+    def connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        connection.ehlo_or_helo_if_needed()
+        if connection.has_extn("starttls"):
+            connection.starttls()
+            connection.ehlo()
+        if self.user and self.password:
+            connection.login(self.user, self.password)
+        self.connection = connection
+
+    def send(self, from_addr, to_addr, message):
+        """Sends the message, connects or reconnects to the server if needed
+        """
+        for attempt in range(2):
+            if self.connection is None:
+                self.connect()
+            try:
+                self.connection.sendmail(from_addr, [to_addr], message)
+                return
+            except smtplib.SMTPServerDisconnected:
+                # the server closed the reused connection, try once again
+                self.connection = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.quit()
+        except DELIVERY_ERRORS:
+            pass
+        self.connection = None
+
+
+class SpoolWorker(threading.Thread):
+    """Background thread that delivers the messages of the spool
+    """
+
+    def __init__(self, spool, sender, callback=None,
+                 idle_timeout=IDLE_TIMEOUT):
+        super(SpoolWorker, self).__init__(name="senaite.mailspool")
+        self.daemon = True
+        self.spool = spool
+        self.sender = sender
+        self.callback = callback
+        self.idle_timeout = idle_timeout
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+
+    def notify(self):
+        """Wakes up the worker to deliver new messages
+        """
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                self.process()
+            except Exception as e:
+                logger.error("Mail spool: {}".format(e))
+            if not self.wakeup.wait(self.idle_timeout):
+                # nothing new to deliver
+                self.sender.close()
+
+    def process(self):
+        """Delivers the due messages of the spool
+
+        :returns: list of (envelope, status) of the processed messages
+        """
+        results = []
+        with self.lock:
+            for name in self.spool.get_due():
+                envelope = self.spool.load(name)
+                try:
+                    self.sender.send(envelope["from_addr"],
+                                     envelope["to_addr"],
+                                     envelope["message"])
+                except DELIVERY_ERRORS as e:
+                    # connection might be in an undefined state
+                    self.sender.close()
+                    logger.warn("Could not send email to {}: {}".format(
+                        envelope["to_addr"], e))
+                    retried = self.spool.retry(name, envelope, str(e))
+                    results.append((envelope, retried and RETRY or FAILED))
+                    continue
+                self.spool.remove(name)
+                results.append((envelope, SENT))
+
+        if results and self.callback is not None:
+            try:
+                self.callback(results)
+            except Exception as e:
+                logger.error("Mail spool: status callback failed: {}"
+                             .format(e))
+        return results
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+# Whether the spool has been checked for messages left by a former process
+_pending_checked = False
+
+
+def get_spool_directory():
+    """Returns the spool directory set in zope.conf or the default one in the
+    client home of the instance
+    """
+    configuration = getConfiguration()
+    product_config = getattr(configuration, "product_config", None)
+    config = (product_config or {}).get(PRODUCT_CONFIG) or {}
+    path = config.get(SPOOL_DIRECTORY_KEY)
+    if not path:
+        path = os.path.join(configuration.clienthome, "mailspool")
+    return path
+
+
+def get_sender():
+    """Returns a SMTP sender with the settings of the MailHost tool
+    """
+    from bika.lims import api
+    mailhost = api.get_tool("MailHost")
+    return SMTPSender(mailhost.smtp_host, mailhost.smtp_port,
+                      user=getattr(mailhost, "smtp_uid", None),
+                      password=getattr(mailhost, "smtp_pwd", None))
+
+
+def get_worker():
+    """Returns the running spool worker of this instance
+
+    The settings of the MailHost tool are read on every call, so the worker
+    must be requested from within a site
+    """
+    global _worker
+    with _worker_lock:
+        sender = get_sender()
+        if _worker is None or not _worker.is_alive():
+            from bika.lims.browser.publish.emailview import update_sendlog
+            spool = MailSpool(get_spool_directory())
+            _worker = SpoolWorker(spool, sender, callback=update_sendlog)
+            _worker.start()
+        else:
+            _worker.sender.host = sender.host
+            _worker.sender.port = sender.port
+            _worker.sender.user = sender.user
+            _worker.sender.password = sender.password
+        return _worker
+
+
+def start_pending_delivery():
+    """Starts the spool worker if there are messages left in the spool, e.g.
+    retries scheduled before the instance was restarted
+
+    The spool is only checked on the first call. Must be called from within a
+    site, like `get_worker`
+    """
+    global _pending_checked
+    if _pending_checked:
+        return
+    _pending_checked = True
+    spool = MailSpool(get_spool_directory())
+    if not len(spool):
+        return
+    logger.info("Mail spool: {} messages pending".format(len(spool)))
+    get_worker()
+
+
+def queue_email(from_addr, to_addr, message, **info):
+    """Queues the message for delivery once the current transaction commits
+
+    :param from_addr: envelope sender address
+    :param to_addr: envelope recipient address
+    :param message: email Message or string
+    :param info: additional information passed to the status callback
+    """
+    if not isinstance(message, basestring):
+        message = message.as_string()
+    worker = get_worker()
+
+    def spool(success):
+        if not success:
+            return
+        worker.spool.put(from_addr, to_addr, message, **info)
+        worker.notify()
+
+    transaction.get().addAfterCommitHook(spool)
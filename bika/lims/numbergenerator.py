@@ -18,19 +18,21 @@
 # Copyright 2018-2020 by it's authors.
 # Some rights reserved, see README and LICENSE.
 
-import thread
 import logging
-import datetime
-from bika.lims.interfaces import INumberGenerator
+import threading
+from contextlib import contextmanager
+
+from App.config import getConfiguration
 from BTrees.OIBTree import OIBTree
+from BTrees.OOBTree import OOBTree
+from bika.lims.interfaces import INumberGenerator
+from persistent import Persistent
 from plone import api
+from ZODB.POSException import ConflictError
 from zope.annotation.interfaces import IAnnotations
-from zope.component import getGlobalSiteManager
 from zope.interface import implements
 
-
-
-lock = thread.allocate_lock()
+import transaction
 
 logger = logging.getLogger("bika.lims.idserver")
 
@@ -39,6 +41,18 @@ STORAGE_HASH = "bika.lims.numbercounter.hash"
 
 NUMBER_STORAGE = "bika.lims.consecutive_numbers_storage"
 
+# Name of the <product-config> section and key in zope.conf to define the
+# amount of numbers each ZEO client reserves at once, e.g.:
+#
+#   <product-config bika.lims>
+#       number_generator_block_size 10
+#   </product-config>
+PRODUCT_CONFIG = "bika.lims"
+BLOCK_SIZE_KEY = "number_generator_block_size"
+
+# Max attempts to reserve a block of numbers before giving up
+RESERVE_RETRIES = 10
+
 
 def get_storage_location():
     """ get the portal with the plone.api
@@ -54,26 +68,96 @@ def get_portal_annotation():
     return IAnnotations(get_storage_location())
 
 
+def get_block_size():
+    """Returns the block size set in the product config of zope.conf or 1
+    """
+    product_config = getattr(getConfiguration(), "product_config", None)
+    config = (product_config or {}).get(PRODUCT_CONFIG) or {}
+    try:
+        return max(1, int(config.get(BLOCK_SIZE_KEY, 1)))
+    except (TypeError, ValueError):
+        logger.error("{}: Value must be an integer".format(BLOCK_SIZE_KEY))
+        return 1
+
+
+class NumberCounter(Persistent):
+    """Persistent counter of a single key
+
+    Each key lives in its own persistent object, so increments of different
+    keys never touch the same record and do not conflict each other.
+
+    NOTE: Concurrent increments of the *same* key are not resolved on purpose,
+          because both transactions would end up with the same number.
+    """
+
+    def __init__(self, value=0):
+        self.value = value
+        # Incremented each time the counter is explicitly set, so that blocks
+        # reserved before by other ZEO clients are discarded
+        self.epoch = 0
+
+    def increment(self, amount=1):
+        self.value += amount
+        return self.value
+
+    def __repr__(self):
+        return "<NumberCounter {}>".format(self.value)
+
+
 class NumberGenerator(object):
     """ perisistent consecutive numbers
     """
     implements(INumberGenerator)
 
+    def __init__(self, block_size=None):
+        # Block size used to reserve numbers. Falls back to zope.conf if None
+        self.block_size = block_size
+        # Blocks reserved by this process: (database, oid) -> [epoch, next, last]
+        self._blocks = {}
+        self._blocks_lock = threading.Lock()
+        # Numbers left to reserve per key within `allocate`, per thread
+        self._local = threading.local()
+
+    @property
+    def annotations(self):
+        """ annotation storage where the counters are kept
+        """
+        return get_portal_annotation()
+
     @property
     def storage(self):
         """ get the counter storage
         """
-        annotation = get_portal_annotation()
-        if annotation.get(NUMBER_STORAGE) is None:
-            annotation[NUMBER_STORAGE]  = OIBTree()
-        return annotation[NUMBER_STORAGE]
+        annotation = self.annotations
+        storage = annotation.get(NUMBER_STORAGE)
+        if storage is None:
+            storage = annotation[NUMBER_STORAGE] = OOBTree()
+        elif isinstance(storage, OIBTree):
+            storage = self.migrate_storage()
+        return storage
+
+    def migrate_storage(self):
+        """Migrates the legacy `OIBTree` storage to per-key counters
+        """
+        annotation = self.annotations
+        legacy = annotation.get(NUMBER_STORAGE)
+        if not isinstance(legacy, OIBTree):
+            return legacy
+        logger.info("Migrating {} numbers to counters ...".format(len(legacy)))
+        storage = OOBTree()
+        for key, value in legacy.items():
+            storage[key] = NumberCounter(value)
+        annotation[NUMBER_STORAGE] = storage
+        return storage
 
     def flush(self):
         """ delete all annotation storages
         """
-        annotations = get_portal_annotation()
+        annotations = self.annotations
         if annotations.get(NUMBER_STORAGE) is not None:
             del annotations[NUMBER_STORAGE]
+        with self._blocks_lock:
+            self._blocks.clear()
 
     def keys(self):
         out = []
@@ -83,40 +167,165 @@ class NumberGenerator(object):
 
     def values(self):
         out = []
-        for value in self.storage.values():
-            out.append(value)
+        for key in self.keys():
+            out.append(self.get(key))
         return out
 
+    def items(self):
+        return zip(self.keys(), self.values())
+
     def __iter__(self):
         return self.storage.__iter__()
 
     def __getitem__(self, key):
-        return self.storage.__getitem__(key)
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
 
     def get(self, key, default=None):
-        return self.storage.get(key, default)
+        """ get the last number generated for the given key
+        """
+        counter = self.storage.get(key)
+        if counter is None:
+            return default
+        block = self.get_block(counter)
+        if block is not None:
+            return block[1] - 1
+        return counter.value
+
+    def get_block_size(self, key=None):
+        """ get the amount of numbers to reserve at once for the given key
+        """
+        amounts = getattr(self._local, "amounts", {})
+        amount = amounts.get(key, 0)
+        if self.block_size is not None:
+            return max(1, self.block_size, amount)
+        return max(get_block_size(), amount)
+
+    @contextmanager
+    def allocate(self, amounts):
+        """Reserves at once the numbers to be generated within the context,
+        given as a mapping of key -> amount, e.g. to create many objects:
+
+            with number_generator.allocate({"analysisrequest-W": 10}):
+                ...
+
+        Numbers of these blocks that are not used within the context are
+        handed out later on by this process, also when blocks are disabled.
+        """
+        previous = getattr(self._local, "amounts", {})
+        current = dict(previous)
+        for key, amount in amounts.items():
+            current[key] = max(current.get(key, 0), amount)
+        self._local.amounts = current
+        try:
+            yield
+        finally:
+            self._local.amounts = previous
+
+    def count_allocated(self, key):
+        """ count a number generated for the given key within `allocate`
+        """
+        amounts = getattr(self._local, "amounts", {})
+        if amounts.get(key, 0) > 0:
+            # only reserve the numbers that are still to be generated
+            amounts[key] -= 1
+
+    def get_block_key(self, counter):
+        """ get the key for the blocks reserved by this process
+        """
+        jar = counter._p_jar
+        if jar is None or counter._p_oid is None:
+            # counter not yet committed
+            return None
+        return (jar.db().database_name, counter._p_oid)
+
+    def get_block(self, counter):
+        """ get the valid block of numbers reserved for this counter
+        """
+        block_key = self.get_block_key(counter)
+        if block_key is None:
+            return None
+        with self._blocks_lock:
+            block = self._blocks.get(block_key)
+            if block is None:
+                return None
+            if block[0] < counter.epoch:
+                # counter has been set after the block was reserved
+                del self._blocks[block_key]
+                return None
+            return block
 
     def get_number(self, key):
         """ get the next consecutive number
         """
         storage = self.storage
+        counter = storage.get(key)
+        if counter is None:
+            counter = storage[key] = NumberCounter()
 
-        logger.debug("NUMBER before => %s" % storage.get(key, '-'))
+        block_size = self.get_block_size(key)
+        self.count_allocated(key)
+        block_key = self.get_block_key(counter)
+        if block_size < 2 and block_key is not None:
+            # use up the numbers left from an allocation before
+            block = self.get_block(counter)
+            if block is None or block[1] > block[2]:
+                block_key = None
+        if block_key is None:
+            # increment within the current transaction. Only this counter is
+            # modified, so sequences with other keys do not conflict
+            number = counter.increment()
+            logger.debug("NUMBER {} => {}".format(key, number))
+            return number
+
+        with self._blocks_lock:
+            block = self._blocks.get(block_key)
+            # NOTE: the epoch seen by this transaction might be older than the
+            #       one of the block, so only discard blocks that are older
+            if block is None or block[0] < counter.epoch or block[1] > block[2]:
+                block = self.reserve_block(counter, block_size)
+                self._blocks[block_key] = block
+            number = block[1]
+            block[1] += 1
+
+        logger.debug("NUMBER {} => {} (block {})".format(key, number, block))
+        return number
+
+    def reserve_block(self, counter, size):
+        """Reserves a block of numbers for this process
+
+        The block is committed in a separate connection and transaction, so
+        the current transaction does not modify the counter and concurrent
+        requests of other ZEO clients won't conflict on it. Conflicts while
+        reserving are retried here instead of restarting the whole request.
+
+        NOTE: Numbers of a block that are not used (e.g. because the request
+              was aborted or the process restarted) are lost.
+        """
+        tm = transaction.TransactionManager()
+        connection = counter._p_jar.db().open(transaction_manager=tm)
         try:
-            logger.debug("*** consecutive number lock acquire ***")
-            lock.acquire()
-            try:
-                counter = storage[key]
-                storage[key] = counter + 1
-            except KeyError:
-                storage[key] = 1
+            for attempt in range(RESERVE_RETRIES):
+                tm.begin()
+                try:
+                    stored = connection.get(counter._p_oid)
+                    last = stored.increment(size)
+                    epoch = stored.epoch
+                    tm.commit()
+                except ConflictError:
+                    tm.abort()
+                    logger.info("Conflict while reserving numbers, retry {}"
+                                .format(attempt + 1))
+                    continue
+                logger.info("Reserved numbers {}-{}".format(
+                    last - size + 1, last))
+                return [epoch, last - size + 1, last]
+            raise ConflictError("Cannot reserve a block of numbers")
         finally:
-            logger.debug("*** consecutive number lock release ***")
-            self.storage._p_changed = True
-            lock.release()
-
-        logger.debug("NUMBER after => %s" % storage.get(key, '-'))
-        return storage[key]
+            tm.abort()
+            connection.close()
 
     def set_number(self, key, value):
         """ set a key's value
@@ -127,15 +336,32 @@ class NumberGenerator(object):
             logger.error("set_number: Value must be an integer")
             return
 
-        try:
-            lock.acquire()
-            storage[key] = value
-        finally:
-            self.storage._p_changed = True
-            lock.release()
+        counter = storage.get(key)
+        if counter is None:
+            counter = storage[key] = NumberCounter()
+        counter.value = value
+        counter.epoch += 1
+
+        # discard the numbers reserved by this process
+        block_key = self.get_block_key(counter)
+        with self._blocks_lock:
+            self._blocks.pop(block_key, None)
+
+        return counter.value
+
+    def delete_number(self, key):
+        """ remove the counter of the given key
+        """
+        counter = self.storage.pop(key)
 
-        return storage[key]
+        # discard the numbers reserved by this process. Blocks of other
+        # processes are bound to the removed counter and no longer used
+        block_key = self.get_block_key(counter)
+        with self._blocks_lock:
+            self._blocks.pop(block_key, None)
 
+    def __delitem__(self, key):
+        self.delete_number(key)
 
     def generate_number(self, key="default"):
         """ get a number
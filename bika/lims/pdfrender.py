@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""PDF rendering service
+
+HTML is rendered to PDF with WeasyPrint in a separate worker process for each
+rendering, so that rendering does not block the Zope worker threads for longer
+than needed and a hanging rendering can be stopped after a timeout, without
+affecting other renderings. The number of processes limits the number of
+concurrent renderings.
+
+The worker processes run `bika.lims.pdfworker` in a new Python interpreter.
+They are not forked from the Zope process, because locks held by its other
+threads at the time of the fork (e.g. of logging) would never be released in
+the worker and could hang it.
+
+The worker processes can not traverse the site, so the resources of the site
+referenced by the HTML (images, stylesheets and the resources these refer to)
+are fetched in advance by the calling thread and handed over to the worker.
+
+Rendered PDFs are kept in a content-addressed cache on disk, keyed by the hash
+of the HTML and CSS, so rendering the same HTML again (e.g. reprinting
+stickers) returns the cached PDF immediately.
+
+Settings are read from the bika.lims product-config of zope.conf:
+
+    <product-config bika.lims>
+        pdf_render_processes 2
+        pdf_render_timeout 120
+        pdf_cache_directory /var/cache/senaite/pdf
+        pdf_cache_size 512
+    </product-config>
+
+`pdf_render_processes 0` renders in the calling thread. `pdf_cache_size` is
+the max size of the cache in MB, 0 disables the cache.
+"""
+
+import cPickle
+import hashlib
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import urlparse
+
+from App.config import getConfiguration
+from bika.lims import logger
+from bika.lims.pdfworker import render
+from Products.CMFPlone.utils import safe_unicode
+
+PRODUCT_CONFIG = "bika.lims"
+
+# Default settings
+PROCESSES = 2
+TIMEOUT = 120
+CACHE_SIZE = 512
+
+# Cache writes after which the size of the cache is checked
+PRUNE_EVERY = 50
+
+# Script run by the worker processes
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      "pdfworker.py")
+
+# URLs referenced from HTML and CSS
+URL_RE = re.compile(r"""(?:src|href)\s*=\s*["']([^"']+)["']"""
+                    r"""|url\(\s*["']?([^"')]+)["']?\s*\)"""
+                    r"""|@import\s+["']([^"']+)["']""", re.IGNORECASE)
+
+_semaphore = None
+_semaphore_lock = threading.Lock()
+_cache = None
+
+
+class RenderTimeoutError(RuntimeError):
+    """The rendering did not finish within the timeout
+    """
+
+
+def get_config(key, default):
+    """Returns the value of the key in the product-config of zope.conf
+    """
+    product_config = getattr(getConfiguration(), "product_config", None)
+    config = (product_config or {}).get(PRODUCT_CONFIG) or {}
+    value = config.get(key)
+    if value is None:
+        return default
+    if isinstance(default, int):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            logger.error("{}: Value must be an integer".format(key))
+            return default
+    return value
+
+
+def to_utf8(text):
+    return safe_unicode(text).encode("utf-8")
+
+
+def get_key(html, css=None):
+    """Returns the cache key of the PDF for the HTML and CSS passed in
+    """
+    key = hashlib.sha256(to_utf8(html))
+    key.update("\0")
+    key.update(to_utf8(css or ""))
+    return key.hexdigest()
+
+
+class PDFCache(object):
+    """Content-addressed cache of rendered PDFs on disk
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.writes = 0
+
+    def get_path(self, key):
+        return os.path.join(self.path, key[:2], "{}.pdf".format(key))
+
+    def get(self, key):
+        """Returns the PDF for the given key or None
+        """
+        try:
+            with open(self.get_path(key), "rb") as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def set(self, key, data):
+        """Stores the PDF with the given key
+        """
+        path = self.get_path(key)
+        folder = os.path.dirname(path)
+        try:
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.rename(tmp, path)
+        except (IOError, OSError) as e:
+            logger.error("PDF cache: {}".format(e))
+            return
+        self.writes += 1
+        if self.writes % PRUNE_EVERY == 0:
+            self.prune()
+
+    def get_files(self):
+        files = []
+        for folder, dirnames, filenames in os.walk(self.path):
+            for filename in filenames:
+                path = os.path.join(folder, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def prune(self):
+        """Removes the least recently written PDFs until the cache is within
+        its max size
+        """
+        files = sorted(self.get_files(), reverse=True)
+        size = 0
+        for mtime, filesize, path in files:
+            size += filesize
+            if size <= self.max_size:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def get_cache():
+    """Returns the PDF cache or None if disabled
+    """
+    global _cache
+    max_size = get_config("pdf_cache_size", CACHE_SIZE) * 1024 * 1024
+    if max_size <= 0:
+        return None
+    if _cache is None:
+        path = get_config("pdf_cache_directory", None)
+        if not path:
+            path = os.path.join(getConfiguration().clienthome, "pdfcache")
+        _cache = PDFCache(path, max_size)
+    return _cache
+
+
+def get_urls(text, base_url=None):
+    """Returns the URLs referenced in the HTML or CSS text
+    """
+    urls = []
+    for match in URL_RE.findall(text or ""):
+        url = filter(None, match)[0].strip()
+        if base_url:
+            url = urlparse.urljoin(base_url, url)
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+def fetch_resources(html, css=None, url_fetcher=None, is_local=None):
+    """Fetches the site resources referenced by the HTML and CSS
+
+    Stylesheets are scanned for further resources
+
+    :param url_fetcher: WeasyPrint URL fetcher to use
+    :param is_local: function that tells if an URL has to be fetched here
+    :returns: mapping of URL -> resource
+    """
+    resources = {}
+    urls = get_urls(html) + get_urls(css)
+    while urls:
+        url = urls.pop(0)
+        if url in resources or not is_local(url):
+            continue
+        try:
+            resource = url_fetcher(url)
+        except Exception as e:
+            # let WeasyPrint report the missing resource
+            logger.warn("Could not fetch '{}': {}".format(url, e))
+            continue
+        if "file_obj" in resource:
+            file_obj = resource.pop("file_obj")
+            resource["string"] = file_obj.read()
+            file_obj.close()
+        resources[url] = resource
+        if (resource.get("mime_type") or "").endswith("css") \
+                or url.endswith(".css"):
+            urls.extend(get_urls(resource["string"], base_url=url))
+    return resources
+
+
+def get_semaphore():
+    """Returns the semaphore that limits the number of concurrent renderings
+    or None to render in-process
+    """
+    global _semaphore
+    processes = get_config("pdf_render_processes", PROCESSES)
+    if processes <= 0:
+        return None
+    with _semaphore_lock:
+        if _semaphore is None:
+            _semaphore = threading.BoundedSemaphore(processes)
+        return _semaphore
+
+
+def render_in_process(html, css, resources, timeout):
+    """Renders the PDF in a worker process of its own, which is killed if
+    the rendering does not finish within the timeout
+    """
+    # the worker imports WeasyPrint from the paths of this process
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    process = subprocess.Popen([sys.executable, WORKER], env=env,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, close_fds=True)
+    job = cPickle.dumps((html, css, resources), cPickle.HIGHEST_PROTOCOL)
+    output = []
+
+    def communicate():
+        output.extend(process.communicate(job))
+
+    # NOTE: communicate has no timeout in Python 2.7
+    thread = threading.Thread(target=communicate)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        logger.error("PDF rendering timed out after {}s".format(timeout))
+        process.kill()
+        thread.join()
+        raise RenderTimeoutError(timeout)
+
+    stdout, stderr = output
+    try:
+        success, data = cPickle.loads(stdout)
+    except (EOFError, ValueError, cPickle.UnpicklingError):
+        # the worker process died
+        raise RuntimeError("PDF rendering process exited with code {}: {}"
+                           .format(process.returncode, stderr[-1000:]))
+    if not success:
+        raise RuntimeError("PDF rendering failed: {}".format(data))
+    return data
+
+
+def render_pdf(html, css=None, url_fetcher=None, is_local=None,
+               timeout=None, cache=True):
+    """Returns the PDF for the HTML and CSS passed in
+
+    :param html: HTML to render
+    :param css: additional CSS as string
+    :param url_fetcher: URL fetcher for the resources of the site
+    :param is_local: function that tells if an URL is a resource of the site
+    :param timeout: seconds to wait for the rendering
+    :param cache: look up and store the PDF in the cache
+    :returns: PDF data
+    """
+    html = to_utf8(html)
+    css = css and to_utf8(css) or None
+    pdf_cache = cache and get_cache() or None
+    key = get_key(html, css)
+    if pdf_cache is not None:
+        pdf = pdf_cache.get(key)
+        if pdf is not None:
+            return pdf
+
+    resources = {}
+    if url_fetcher is not None and is_local is not None:
+        resources = fetch_resources(html, css, url_fetcher=url_fetcher,
+                                    is_local=is_local)
+
+    semaphore = get_semaphore()
+    if semaphore is None:
+        pdf = render(html, css, resources)
+    else:
+        timeout = timeout or get_config("pdf_render_timeout", TIMEOUT)
+        with semaphore:
+            pdf = render_in_process(html, css, resources, timeout)
+
+    if pdf_cache is not None:
+        pdf_cache.set(key, pdf)
+    return pdf
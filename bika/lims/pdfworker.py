@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+
+"""Worker of the PDF rendering service
+
+Renders HTML to PDF with WeasyPrint for `bika.lims.pdfrender`. It runs as a
+script in a new Python process, so it must not import anything but the
+standard library and WeasyPrint.
+
+The pickled (html, css, resources) are read from stdin and the pickled
+(success, PDF data or error message) are written to stdout.
+"""
+
+import cPickle
+import os
+import sys
+
+
+def render(html, css=None, resources=None):
+    """Renders the HTML to PDF with WeasyPrint
+
+    Runs in the worker processes: must not access the site
+
+    :param html: HTML as utf-8 string
+    :param css: additional CSS as string
+    :param resources: mapping of URL -> resource as returned by url fetchers
+    :returns: PDF data
+    """
+    from weasyprint import CSS
+    from weasyprint import HTML
+    from weasyprint import default_url_fetcher
+    resources = resources or {}
+
+    def url_fetcher(url):
+        if url in resources:
+            return dict(resources[url])
+        return default_url_fetcher(url)
+
+    stylesheets = css and [CSS(string=css)] or None
+    renderer = HTML(string=html, url_fetcher=url_fetcher, encoding="utf-8")
+    return renderer.write_pdf(stylesheets=stylesheets)
+
+
+def main(renderer=render):
+    """Renders the job read from stdin and writes the result to stdout
+    """
+    # keep stdout for the result, any output of the renderer goes to stderr
+    output = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    html, css, resources = cPickle.load(sys.stdin)
+    try:
+        result = (True, renderer(html, css, resources))
+    except Exception as e:
+        result = (False, "{}: {}".format(type(e).__name__, e))
+    cPickle.dump(result, output, cPickle.HIGHEST_PROTOCOL)
+    output.close()
+
+
+if __name__ == "__main__":
+    main()
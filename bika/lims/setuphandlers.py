@@ -23,8 +23,10 @@ import itertools
 from Acquisition import aq_base
 from bika.lims import api
 from bika.lims import logger
+from bika.lims.catalog import aggregates
 from bika.lims.catalog import auditlog_catalog
 from bika.lims.catalog import getCatalogDefinitions
+from bika.lims.catalog import idlookup
 from bika.lims.catalog import setup_catalogs
 from bika.lims.catalog.catalog_utilities import addZCTextIndex
 from plone import api as ploneapi
@@ -306,6 +308,12 @@ def setup_handler(context):
     # Set CMF Form actions
     setup_form_controller_actions(portal)
 
+    # Build the ID/barcode lookup index
+    setup_id_lookup_index(portal)
+
+    # Build the aggregated counts of the dashboard
+    setup_aggregates(portal)
+
     logger.info("SENAITE setup handler [DONE]")
 
 
@@ -548,3 +556,26 @@ def setup_html_filter(portal):
         if style not in style_whitelist:
             style_whitelist.append(style)
     adapter.style_whitelist = style_whitelist
+
+
+def setup_id_lookup_index(portal):
+    """Builds the ID/barcode lookup index from the catalog metadata of the
+    supported types, without waking up the objects
+    """
+    logger.info("*** Setup ID Lookup Index ***")
+    lookup_index = idlookup.get_index(create=True)
+    lookup_index.clear()
+    for portal_type in idlookup.SUPPORTED_TYPES:
+        brains = api.search(dict(portal_type=portal_type))
+        logger.info("Indexing IDs of {} {} objects".format(
+            len(brains), portal_type))
+        for brain in brains:
+            idlookup.index(brain)
+    lookup_index.complete = True
+
+
+def setup_aggregates(portal):
+    """Builds the aggregated counts of the dashboard from the catalog metadata
+    """
+    logger.info("*** Setup Dashboard Aggregates ***")
+    aggregates.rebuild()
@@ -36,6 +36,9 @@ def ObjectInitializedEventHandler(analysis, event):
     request = analysis.getRequest()
     wf.doActionFor(request, "rollback_to_receive")
 
+    # Flush the graph of dependencies amongst the analyses of the request
+    request.invalidateAnalysesDependencyGraph()
+
     # Reindex the indexes for UIDReference fields on creation!
     analysis.reindexObject(idxs="getServiceUID")
     return
@@ -49,6 +52,7 @@ def ObjectRemovedEventHandler(analysis, event):
     # Note there is no need to check if the Analysis Request allows a given
     # transition, cause this is already managed by doActionFor
     analysis_request = analysis.getRequest()
+    analysis_request.invalidateAnalysesDependencyGraph()
     wf.doActionFor(analysis_request, "submit")
     wf.doActionFor(analysis_request, "verify")
     return
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from bika.lims.utils.analysis import invalidate_analysis_prototype
+from bika.lims.utils.keywordregistry import register_keywords
+from bika.lims.utils.keywordregistry import unregister_keywords
+
+
+def ObjectModifiedEventHandler(service, event):
+    """Discards the analysis prototype of the modified service, so that new
+    analyses get the new values, and updates the keyword registry
+    """
+    invalidate_analysis_prototype(service)
+    register_keywords(service)
+
+
+def ObjectRemovedEventHandler(service, event):
+    """Removes the keywords of the deleted service from the keyword registry
+    """
+    unregister_keywords(service.UID())
@@ -22,6 +22,7 @@ from bika.lims import api
 from bika.lims.api.snapshot import has_snapshots
 from bika.lims.api.snapshot import supports_snapshots
 from bika.lims.api.snapshot import take_snapshot
+from bika.lims.catalog import indexqueue
 from bika.lims.interfaces import IDoNotSupportSnapshots
 from DateTime import DateTime
 from zope.interface import alsoProvides
@@ -41,14 +42,15 @@ def reindex_object(obj):
     handler for this event, you need to manually reindex new values.
     """
     auditlog_catalog = api.get_tool("auditlog_catalog")
-    auditlog_catalog.reindexObject(obj)
+    # merged with the other indexing operations of the transaction
+    indexqueue.index(auditlog_catalog, obj, api.get_path(obj))
 
 
 def unindex_object(obj):
     """Unindex the object in the `auditlog_catalog` catalog
     """
     auditlog_catalog = api.get_tool("auditlog_catalog")
-    auditlog_catalog.unindexObject(obj)
+    indexqueue.unindex(auditlog_catalog, api.get_path(obj))
 
 
 def ObjectTransitionedEventHandler(obj, event):
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+
+from bika.lims.interfaces import IInstrument
+
+
+def update_instrument_validity(instrument):
+    """Updates the stored validity state of the instrument
+    """
+    if IInstrument.providedBy(instrument):
+        instrument.updateValidity()
+
+
+def ObjectModifiedEventHandler(instance, event):
+    """Updates the validity of the instrument when a certification,
+    calibration or validation is created or modified
+    """
+    update_instrument_validity(instance.aq_parent)
+
+
+def ObjectRemovedEventHandler(instance, event):
+    """Updates the validity of the instrument when a certification,
+    calibration or validation is removed
+    """
+    if event.object is not instance:
+        # the instrument itself is being removed
+        return
+    update_instrument_validity(event.oldParent)
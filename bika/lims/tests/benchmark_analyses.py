@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Benchmark of the creation of analyses from a large profile
+
+Creates a profile with many services and adds it to many samples, first
+walking the service schemas for each new analysis (as done before the
+analysis prototypes) and then from the prototypes of the services. Nothing is
+committed, e.g.:
+
+    bin/instance run bika/lims/tests/benchmark_analyses.py <site-id> \\
+        [--services 60] [--samples 200]
+"""
+
+import argparse
+import sys
+import time
+
+import transaction
+from bika.lims import api
+from bika.lims.utils import analysis as analysis_utils
+from bika.lims.utils import tmpID
+from bika.lims.utils.analysisrequest import create_analysisrequest
+from DateTime import DateTime
+from Products.CMFPlone.utils import _createObjectByType
+
+
+def create_setup(services):
+    """Creates the objects needed for the samples and returns the values of
+    the samples
+    """
+    setup = api.get_setup()
+    client = api.create(api.get_portal().clients, "Client",
+                        Name="Benchmark", ClientID="BM")
+    contact = api.create(client, "Contact", Firstname="Bench",
+                         Lastname="Mark")
+    sampletype = api.create(setup.bika_sampletypes, "SampleType",
+                            title="Benchmark", Prefix="BM")
+    category = api.create(setup.bika_analysiscategories, "AnalysisCategory",
+                          title="Benchmark")
+    uids = []
+    for num in range(services):
+        service = api.create(setup.bika_analysisservices, "AnalysisService",
+                             title="Benchmark {}".format(num),
+                             Keyword="BM{}".format(num), Price="10",
+                             Category=category)
+        uids.append(api.get_uid(service))
+    profile = api.create(setup.bika_analysisprofiles, "AnalysisProfile",
+                         title="Benchmark", Service=uids)
+    transaction.savepoint(optimistic=True)
+    return client, {
+        "Client": api.get_uid(client),
+        "Contact": api.get_uid(contact),
+        "DateSampled": DateTime(),
+        "SampleType": api.get_uid(sampletype),
+        "Profiles": [api.get_uid(profile)],
+    }
+
+
+def copy_values(service, analysis, **kwargs):
+    analysis_utils.copy_analysis_field_values(service, analysis, **kwargs)
+
+
+def run(client, values, samples, request):
+    start = time.time()
+    for num in range(samples):
+        create_analysisrequest(client, request, values)
+    return time.time() - start
+
+
+def main(app, args):
+    from AccessControl.SecurityManagement import newSecurityManager
+    from AccessControl.SpecialUsers import system
+    from Testing.makerequest import makerequest
+    from zope.component.hooks import setSite
+
+    parser = argparse.ArgumentParser(
+        prog="bin/instance run {}".format(__file__),
+        description="Benchmark the creation of analyses from a profile")
+    parser.add_argument("site_id")
+    parser.add_argument("--services", type=int, default=60)
+    parser.add_argument("--samples", type=int, default=200)
+    options = parser.parse_args(args)
+
+    app = makerequest(app)
+    site = app.get(options.site_id)
+    if site is None:
+        sys.exit("No site with id '{}'".format(options.site_id))
+    newSecurityManager(None, system)
+    setSite(site)
+
+    client, values = create_setup(options.services)
+    analyses = options.services * options.samples
+    prototypes = analysis_utils.apply_analysis_prototype
+    try:
+        # walk the schema of the service for each new analysis
+        analysis_utils.apply_analysis_prototype = copy_values
+        schema = run(client, values, options.samples, app.REQUEST)
+        transaction.savepoint(optimistic=True)
+    finally:
+        analysis_utils.apply_analysis_prototype = prototypes
+    prototype = run(client, values, options.samples, app.REQUEST)
+    transaction.abort()
+
+    print("{} samples with {} analyses each".format(
+        options.samples, options.services))
+    for name, seconds in (("schema", schema), ("prototype", prototype)):
+        print("{:<10} {:.2f}s  {:.2f}ms per analysis".format(
+            name, seconds, seconds * 1000 / analyses))
+
+    # Only the creation of the analyses themselves
+    service = api.get_object_by_uid(values["Profiles"][0]).getService()[0]
+    sample = _createObjectByType("AnalysisRequest", client, tmpID())
+    for name, func in (("schema", copy_values), ("prototype", prototypes)):
+        start = time.time()
+        for num in range(analyses):
+            analysis = _createObjectByType("Analysis", sample, tmpID())
+            func(service, analysis)
+        seconds = time.time() - start
+        print("{:<10} {:.3f}ms per analysis (field values only)".format(
+            name, seconds * 1000 / analyses))
+    transaction.abort()
+
+
+if __name__ == "__main__":
+    # Run with `bin/instance run <this file> ...`. The `app` variable is
+    # provided by the instance script
+    main(app, sys.argv[1:])  # noqa
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+
+"""Startup benchmark of the instrument interfaces
+
+Compares the import time of `bika.lims` (which imports the instrument
+interfaces through the Instrument content type) with the lazy registry of
+instrument interfaces against importing all the interface modules at once, as
+done before the registry was introduced. Each run is done in a fresh
+interpreter, e.g.:
+
+    bin/zopepy bika/lims/tests/benchmark_instruments.py [runs]
+"""
+
+import os
+import subprocess
+import sys
+
+SETUP = """
+import time
+start = time.time()
+import bika.lims
+import bika.lims.content.instrument
+from bika.lims.exportimport import instruments
+"""
+
+EAGER = """
+import importlib
+for entry in instruments.INSTRUMENT_INTERFACES:
+    importlib.import_module("{}.{}".format(instruments.__name__, entry[0]))
+"""
+
+REPORT = """
+print(time.time() - start)
+"""
+
+
+def run(code):
+    """Returns the seconds the code took in a fresh interpreter
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output([sys.executable, "-c", code], env=env)
+    return float(output.strip().splitlines()[-1])
+
+
+def main(runs=5):
+    results = []
+    for name, code in (("eager", SETUP + EAGER + REPORT),
+                       ("lazy", SETUP + REPORT)):
+        timings = sorted(map(lambda num: run(code), range(runs)))
+        median = timings[len(timings) // 2]
+        results.append(median)
+        print("{:<6} median {:.3f}s  min {:.3f}s  max {:.3f}s".format(
+            name, median, timings[0], timings[-1]))
+    print("saved  {:.3f}s per startup".format(results[0] - results[1]))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
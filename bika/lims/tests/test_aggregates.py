@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+
+from bika.lims.catalog.aggregates import Aggregates
+from bika.lims.catalog.aggregates import get_record
+from DateTime import DateTime
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+CLIENT = "client-uid"
+DEPARTMENT = "department-uid"
+
+
+def analysis(review_state, created, creator="analyst1"):
+    return get_record("Analysis", review_state, DateTime(created),
+                      client_uid=CLIENT, department_uid=DEPARTMENT,
+                      creator=creator)
+
+
+class TestAggregates(unittest.TestCase):
+
+    def setUp(self):
+        self.aggregates = Aggregates()
+        self.aggregates.index_object(
+            "a1", analysis("unassigned", "2020-01-01 10:00"))
+        self.aggregates.index_object(
+            "a2", analysis("unassigned", "2020-01-01 18:00", "analyst2"))
+        self.aggregates.index_object(
+            "a3", analysis("to_be_verified", "2020-01-03 09:00"))
+
+    def test_record(self):
+        self.assertEqual(analysis("unassigned", "2020-01-01 10:00"), (
+            "Analysis", "unassigned", "2020-01-01", CLIENT, DEPARTMENT,
+            "analyst1"))
+
+    def test_count(self):
+        self.assertEqual(self.aggregates.count("Analysis"), 3)
+        self.assertEqual(self.aggregates.count("Analysis", ["unassigned"]), 2)
+        self.assertEqual(self.aggregates.count(
+            "Analysis", ["unassigned", "to_be_verified"], creator="analyst1"),
+            2)
+        self.assertEqual(self.aggregates.count("Worksheet"), 0)
+        self.assertEqual(self.aggregates.get_review_states("Analysis"),
+                         ["to_be_verified", "unassigned"])
+
+    def test_daily(self):
+        daily = self.aggregates.daily(
+            "Analysis", DateTime("2020-01-01"), DateTime("2020-01-02"))
+        self.assertEqual(daily, [("2020-01-01", "unassigned", 2)])
+        daily = self.aggregates.daily(
+            "Analysis", DateTime("2019-12-01"), DateTime("2020-01-31"),
+            creator="analyst1")
+        self.assertEqual(daily, [("2020-01-01", "unassigned", 1),
+                                 ("2020-01-03", "to_be_verified", 1)])
+
+    def test_transition(self):
+        # unchanged records do not modify the counters
+        self.assertFalse(self.aggregates.index_object(
+            "a1", analysis("unassigned", "2020-01-01 10:00")))
+        self.assertTrue(self.aggregates.index_object(
+            "a1", analysis("to_be_verified", "2020-01-01 10:00")))
+        self.assertEqual(self.aggregates.count("Analysis", ["unassigned"]), 1)
+        self.assertEqual(
+            self.aggregates.count("Analysis", ["to_be_verified"]), 2)
+        self.assertEqual(self.aggregates.count("Analysis"), 3)
+
+    def test_unindex(self):
+        self.assertTrue(self.aggregates.unindex_object("a3"))
+        self.assertFalse(self.aggregates.unindex_object("a3"))
+        self.assertEqual(self.aggregates.count("Analysis"), 2)
+        self.assertEqual(len(self.aggregates), 2)
+        daily = self.aggregates.daily(
+            "Analysis", DateTime("2020-01-01"), DateTime("2020-01-31"))
+        self.assertEqual(daily, [("2020-01-01", "unassigned", 2)])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestAggregates))
+    return suite
@@ -21,7 +21,9 @@
 import json
 
 import transaction
+from bika.lims import api
 from bika.lims.barcode import barcode_entry
+from bika.lims.catalog import idlookup
 from bika.lims.tests.base import BaseTestCase
 from bika.lims.utils import changeWorkflowState, tmpID
 from bika.lims.workflow import doActionFor
@@ -64,6 +66,7 @@ class TestBarcodeEntry(BaseTestCase):
             bs.bika_analysisservices, 'AnalysisService', title='Ecoli',
             Keyword="ECO")
         batch = self.addthing(self.portal.batches, 'Batch', title='B1')
+        self.batch = batch
         # Create an AR
         self.ar1 = self.addthing(
             self.client, 'AnalysisRequest', Contact=contact,
@@ -140,6 +143,37 @@ class TestBarcodeEntry(BaseTestCase):
                          "ar1 redirect should be self:%s but it's %s" % (
                              expected, value['url']))
 
+    def test_lookup_index(self):
+        self.portal.REQUEST['_authenticator'] = self.getAuthenticator()
+        # scanned IDs are normalized
+        self.portal.REQUEST['entry'] = "*%s*" % self.ar3.id.lower()
+        value = json.loads(barcode_entry(self.portal, self.portal.REQUEST)())
+        self.assertEqual(value['failure'], False)
+        expected = self.ar3.absolute_url() + "/manage_results"
+        self.assertEqual(value['url'], expected)
+        # the URL of objects without handler is built from the stored path
+        self.portal.REQUEST['entry'] = "B1"
+        value = json.loads(barcode_entry(self.portal, self.portal.REQUEST)())
+        self.assertEqual(value['url'], self.batch.absolute_url())
+
+    def test_lookup_index_not_built(self):
+        self.portal.REQUEST['_authenticator'] = self.getAuthenticator()
+        self.portal.REQUEST['entry'] = "B1"
+        # the catalogs are searched until the lookup index is complete
+        idlookup.get_index(create=True).complete = False
+        value = json.loads(barcode_entry(self.portal, self.portal.REQUEST)())
+        self.assertEqual(value['url'], self.batch.absolute_url())
+
+    def test_lookup_index_permission(self):
+        self.portal.REQUEST['_authenticator'] = self.getAuthenticator()
+        self.portal.REQUEST['entry'] = self.ar3.id
+        # objects the user is not allowed to view are not resolved
+        self.ar3.manage_permission("View", [], acquire=0)
+        self.ar3.reindexObject(idxs=['allowedRolesAndUsers'])
+        value = json.loads(barcode_entry(self.portal, self.portal.REQUEST)())
+        self.assertEqual(value['failure'], True)
+        self.assertEqual(api.get_review_status(self.ar3), "sample_due")
+
 
 def test_sample_with_single_ar_redirects_to_AR(self):
     self.portal.REQUEST['entry'] = self.sample2.id
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from BTrees.IIBTree import IITreeSet
+from BTrees.OOBTree import OOBTree
+from bika.lims.catalog.rebuild import get_uid_range
+from bika.lims.catalog.rebuild import iter_candidates
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+def uid(prefix):
+    return prefix.ljust(32, "0")
+
+
+class Index(object):
+
+    def __init__(self, index=None, unindex=None):
+        self._index = index
+        self._unindex = unindex
+
+    def getEntryForObject(self, rid):
+        return self._unindex[rid]
+
+
+class Catalog(object):
+    """Minimal catalog with a UID and a portal_type index
+    """
+
+    def __init__(self, records):
+        self.paths = {}
+        self.indexes = {
+            "UID": Index(index=OOBTree()),
+            "portal_type": Index(unindex={}),
+        }
+        for rid, (prefix, portal_type) in enumerate(records):
+            self.paths[rid] = "/plone/{}".format(prefix)
+            self.indexes["UID"]._index[uid(prefix)] = rid
+            self.indexes["portal_type"]._unindex[rid] = portal_type
+
+    @property
+    def _catalog(self):
+        return self
+
+    def getIndex(self, name):
+        return self.indexes[name]
+
+
+class TestCatalogRebuild(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = Catalog([
+            ("0a", "Analysis"),
+            ("3f", "Analysis"),
+            ("40", "AnalysisRequest"),
+            ("7f", "Analysis"),
+            ("80", "Analysis"),
+            ("ff", "Analysis"),
+        ])
+
+    def get_uids(self, **kw):
+        candidates = iter_candidates(self.catalog, ["Analysis"], **kw)
+        return map(lambda candidate: candidate[0][:2], candidates)
+
+    def test_uid_ranges(self):
+        self.assertEqual(get_uid_range(0, 1), (None, None))
+        self.assertEqual(get_uid_range(0, 2), (None, "80000000"))
+        self.assertEqual(get_uid_range(1, 2), ("80000000", None))
+        # ranges are contiguous
+        ranges = map(lambda worker: get_uid_range(worker, 3), range(3))
+        for (start, end), (next_start, next_end) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+
+    def test_candidates(self):
+        self.assertEqual(self.get_uids(), ["0a", "3f", "7f", "80", "ff"])
+        self.assertEqual(self.get_uids(after=uid("3f")), ["7f", "80", "ff"])
+
+    def test_candidates_of_workers(self):
+        uids = []
+        for worker in range(4):
+            start, end = get_uid_range(worker, 4)
+            uids.append(self.get_uids(start=start, end=end))
+        self.assertEqual(uids, [["0a", "3f"], ["7f"], ["80"], ["ff"]])
+        # resume within the range of the worker
+        start, end = get_uid_range(0, 4)
+        self.assertEqual(self.get_uids(start=start, end=end, after=uid("0a")),
+                         ["3f"])
+
+    def test_duplicate_uids(self):
+        self.catalog.indexes["UID"]._index[uid("3f")] = IITreeSet([1, 2])
+        self.catalog.indexes["portal_type"]._unindex[2] = "Analysis"
+        self.assertEqual(self.get_uids(start=uid("3f"), end=uid("40")), ["3f", "3f"])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestCatalogRebuild))
+    return suite
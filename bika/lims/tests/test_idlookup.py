@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from bika.lims.catalog.idlookup import IDLookupIndex
+from bika.lims.catalog.idlookup import normalize
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+SAMPLE_PATH = "/plone/clients/client-1/W-0001"
+
+
+class TestIDLookupIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = IDLookupIndex()
+        self.index.index_object(
+            "uid-1", "AnalysisRequest", SAMPLE_PATH,
+            (("id", u"w-0001"), ("getClientSampleID", u"cs-1")))
+
+    def test_normalize(self):
+        self.assertEqual(normalize(" *W-0001* "), u"w-0001")
+        self.assertEqual(normalize(None), "")
+
+    def test_lookup(self):
+        records = self.index.lookup("W-0001")
+        self.assertEqual(records, [{
+            "uid": "uid-1",
+            "portal_type": "AnalysisRequest",
+            "path": SAMPLE_PATH,
+            "field": "id",
+        }])
+        self.assertEqual(self.index.lookup("CS-1", fields=["id"]), [])
+        self.assertEqual(
+            len(self.index.lookup("CS-1", fields=["getClientSampleID"])), 1)
+        self.assertEqual(
+            self.index.lookup("W-0001", portal_types=["Worksheet"]), [])
+
+    def test_records_sorted_by_fields(self):
+        self.index.index_object(
+            "uid-2", "Batch", "/plone/batches/B-001",
+            (("id", u"b-001"), ("title", u"w-0001")))
+        records = self.index.lookup("W-0001", fields=["title", "id"])
+        self.assertEqual(map(lambda rec: rec["uid"], records),
+                         ["uid-2", "uid-1"])
+
+    def test_reindex(self):
+        # unchanged records are not written again
+        self.assertFalse(self.index.index_object(
+            "uid-1", "AnalysisRequest", SAMPLE_PATH,
+            (("id", u"w-0001"), ("getClientSampleID", u"cs-1"))))
+        # changed client sample id
+        self.assertTrue(self.index.index_object(
+            "uid-1", "AnalysisRequest", SAMPLE_PATH,
+            (("id", u"w-0001"), ("getClientSampleID", u"cs-2"))))
+        self.assertEqual(self.index.lookup("CS-1"), [])
+        self.assertEqual(len(self.index.lookup("CS-2")), 1)
+
+    def test_unindex(self):
+        self.assertTrue(self.index.unindex_object("uid-1"))
+        self.assertFalse(self.index.unindex_object("uid-1"))
+        self.assertEqual(self.index.lookup("W-0001"), [])
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(len(self.index._index), 0)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestIDLookupIndex))
+    return suite
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import transaction
+from bika.lims.catalog import indexqueue
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class Catalog(object):
+    """Records the operations applied to a catalog
+    """
+
+    def __init__(self, id):
+        self.id = id
+        self.calls = []
+        self.uids = {}
+
+    def getId(self):
+        return self.id
+
+    @property
+    def _catalog(self):
+        return self
+
+    def catalog_object(self, obj, uid, idxs=None):
+        self.calls.append(("index", uid, sorted(idxs or [])))
+        self.uids[uid] = obj
+
+    def uncatalog_object(self, uid):
+        self.calls.append(("unindex", uid))
+        del self.uids[uid]
+
+
+class TestIndexQueue(unittest.TestCase):
+
+    def setUp(self):
+        transaction.begin()
+        self.queue = indexqueue.get_queue()
+        self.analyses = Catalog("bika_analysis_catalog")
+        self.auditlog = Catalog("auditlog_catalog")
+
+    def tearDown(self):
+        transaction.abort()
+
+    def test_merge_indexes(self):
+        indexqueue.index(self.analyses, "a1", "/a1", idxs=["review_state"])
+        indexqueue.index(self.analyses, "a1", "/a1", idxs=["getResult"])
+        indexqueue.index(self.analyses, "a1", "/a1", idxs=["review_state"])
+        self.assertEqual(self.queue.length(), 1)
+        transaction.commit()
+        self.assertEqual(self.analyses.calls,
+                         [("index", "/a1", ["getResult", "review_state"])])
+
+    def test_all_indexes_take_precedence(self):
+        indexqueue.index(self.analyses, "a1", "/a1", idxs=["review_state"])
+        indexqueue.index(self.analyses, "a1", "/a1")
+        indexqueue.index(self.analyses, "a1", "/a1", idxs=["getResult"])
+        transaction.commit()
+        self.assertEqual(self.analyses.calls, [("index", "/a1", [])])
+
+    def test_stable_order(self):
+        indexqueue.index(self.auditlog, "a2", "/a2")
+        indexqueue.index(self.analyses, "a2", "/a2")
+        indexqueue.index(self.auditlog, "a1", "/a1")
+        indexqueue.index(self.analyses, "a1", "/a1")
+        self.assertEqual(self.queue.get_pending(), [
+            ("auditlog_catalog", "/a1"),
+            ("auditlog_catalog", "/a2"),
+            ("bika_analysis_catalog", "/a1"),
+            ("bika_analysis_catalog", "/a2"),
+        ])
+        transaction.commit()
+        self.assertEqual(self.queue.length(), 0)
+
+    def test_unindex_replaces_index(self):
+        self.analyses.uids["/a1"] = "a1"
+        indexqueue.index(self.analyses, "a1", "/a1", idxs=["getResult"])
+        indexqueue.unindex(self.analyses, "/a1")
+        # paths that are not cataloged are skipped
+        indexqueue.unindex(self.analyses, "/a2")
+        transaction.commit()
+        self.assertEqual(self.analyses.calls, [("unindex", "/a1")])
+
+    def test_index_after_unindex_catalogs_all_indexes(self):
+        indexqueue.unindex(self.analyses, "/a1")
+        indexqueue.index(self.analyses, "a1", "/a1", idxs=["getResult"])
+        transaction.commit()
+        self.assertEqual(self.analyses.calls, [("index", "/a1", [])])
+
+    def test_process_single_catalog(self):
+        indexqueue.index(self.analyses, "a1", "/a1")
+        indexqueue.index(self.auditlog, "a1", "/a1")
+        self.assertEqual(
+            self.queue.process(catalog_id="bika_analysis_catalog"), 1)
+        self.assertEqual(len(self.analyses.calls), 1)
+        self.assertEqual(len(self.auditlog.calls), 0)
+        transaction.commit()
+        self.assertEqual(len(self.analyses.calls), 1)
+        self.assertEqual(len(self.auditlog.calls), 1)
+
+    def test_abort_discards_operations(self):
+        indexqueue.index(self.analyses, "a1", "/a1")
+        transaction.abort()
+        transaction.begin()
+        indexqueue.index(self.auditlog, "a1", "/a1")
+        self.assertEqual(self.queue.get_pending(),
+                         [("auditlog_catalog", "/a1")])
+        transaction.commit()
+        self.assertEqual(self.analyses.calls, [])
+
+    def test_savepoint_rollback(self):
+        indexqueue.index(self.analyses, "a1", "/a1", idxs=["review_state"])
+        savepoint = transaction.savepoint()
+        indexqueue.index(self.analyses, "a1", "/a1", idxs=["getResult"])
+        indexqueue.index(self.analyses, "a2", "/a2")
+        savepoint.rollback()
+        self.assertEqual(self.queue.get_pending(),
+                         [("bika_analysis_catalog", "/a1")])
+        transaction.commit()
+        self.assertEqual(self.analyses.calls,
+                         [("index", "/a1", ["review_state"])])
+
+    def test_savepoint_rollback_before_queued_operations(self):
+        savepoint = transaction.savepoint()
+        indexqueue.index(self.analyses, "a1", "/a1")
+        savepoint.rollback()
+        self.assertEqual(self.queue.length(), 0)
+        # the queue joins the transaction again
+        indexqueue.index(self.auditlog, "a1", "/a1")
+        transaction.commit()
+        self.assertEqual(self.analyses.calls, [])
+        self.assertEqual(len(self.auditlog.calls), 1)
+
+    def test_operations_queued_during_commit(self):
+        def hook():
+            indexqueue.index(self.auditlog, "a1", "/a1")
+
+        indexqueue.index(self.analyses, "a1", "/a1")
+        # registered after the hook of the queue
+        transaction.get().addBeforeCommitHook(hook)
+        transaction.commit()
+        self.assertEqual(len(self.analyses.calls), 1)
+        self.assertEqual(len(self.auditlog.calls), 1)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestIndexQueue))
+    return suite
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+
+import importlib
+
+from bika.lims.exportimport import instruments
+from bika.lims.exportimport.instruments import ClassicInstrumentInterface
+from bika.lims.exportimport.instruments import INSTRUMENT_INTERFACES
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class TestInstrumentRegistry(unittest.TestCase):
+
+    def test_registry_is_lazy(self):
+        entry = INSTRUMENT_INTERFACES[0]
+        interface = ClassicInstrumentInterface(*entry)
+        self.assertEqual(interface.title, entry[1])
+        self.assertTrue(instruments.is_import_interface(interface))
+        self.assertIsNone(interface._module)
+        # the module is imported on first use
+        self.assertTrue(callable(interface.Import))
+        self.assertIsNotNone(interface._module)
+
+    def test_registry_is_built_once(self):
+        self.assertIs(instruments.get_registry(), instruments.get_registry())
+
+    def test_registry_matches_modules(self):
+        for id, title, parser, is_import, is_export in INSTRUMENT_INTERFACES:
+            name = "bika.lims.exportimport.instruments.{}".format(id)
+            module = importlib.import_module(name)
+            self.assertEqual(module.title, title, id)
+            self.assertEqual(hasattr(module, "Import"), is_import, id)
+            self.assertEqual(hasattr(module, "Export"), is_export, id)
+            if parser:
+                self.assertTrue(hasattr(module, parser), id)
+
+    def test_getExim(self):
+        exim = instruments.getExim("generic.two_dimension")
+        self.assertIsInstance(exim, ClassicInstrumentInterface)
+        self.assertEqual(exim.title, "2-Dimensional-CSV")
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestInstrumentRegistry))
+    return suite
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+from bika.lims import api
+from bika.lims.jsonapi.read import decode_cursor
+from bika.lims.jsonapi.read import encode_cursor
+from bika.lims.jsonapi.read import get_cursor_page
+from bika.lims.jsonapi.read import get_object_data
+from bika.lims.jsonapi.read import has_read_extenders
+from bika.lims.tests.base import BaseTestCase
+from DateTime import DateTime
+from plone.app.testing import TEST_USER_ID
+from plone.app.testing import setRoles
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class Brain(object):
+
+    def __init__(self, uid, priority):
+        self.UID = uid
+        self.priority = priority
+
+
+class Index(object):
+    meta_type = "FieldIndex"
+
+
+class Catalog(object):
+    """Sorts by the sort index only, like ZCatalog does
+    """
+
+    def __init__(self, brains):
+        self.brains = brains
+        self.Indexes = {"priority": Index()}
+
+    def schema(self):
+        return ["UID", "priority"]
+
+    def __call__(self, sort_on=None, sort_order=None, **query):
+        brains = self.brains
+        value = query.get(sort_on)
+        if value is not None:
+            if value["range"] == "min":
+                brains = filter(lambda b: b.priority >= value["query"], brains)
+            else:
+                brains = filter(lambda b: b.priority <= value["query"], brains)
+        return sorted(brains, key=lambda b: b.priority,
+                      reverse=sort_order == "descending")
+
+
+class BrainOnly(object):
+    """Catalog brain that does not allow to wake-up the object
+    """
+
+    def __init__(self, brain):
+        self.brain = brain
+
+    def __getattr__(self, name):
+        return getattr(self.brain, name)
+
+    def getObject(self):
+        raise AssertionError("Object woken-up")
+
+
+class TestCursorPagination(unittest.TestCase):
+
+    def setUp(self):
+        # many objects with the same sort value, in no particular order
+        self.catalog = Catalog([
+            Brain("uid-5", 2), Brain("uid-3", 1), Brain("uid-1", 1),
+            Brain("uid-4", 2), Brain("uid-2", 1), Brain("uid-6", 3),
+        ])
+
+    def get_uids(self, sort_order, page_size):
+        query = dict(sort_on="priority", sort_order=sort_order)
+        uids = []
+        cursor = ""
+        while True:
+            page, cursor = get_cursor_page(
+                self.catalog, query, cursor, page_size)
+            self.assertTrue(len(page) <= page_size)
+            uids.extend(map(lambda brain: brain.UID, page))
+            if not cursor:
+                return uids
+
+    def test_cursor(self):
+        value, uid = decode_cursor(encode_cursor(1, "uid-1"))
+        self.assertEqual((value, uid), (1, "uid-1"))
+        date = DateTime("2020-01-01 10:00")
+        self.assertEqual(decode_cursor(encode_cursor(date, "uid-1"))[0], date)
+        self.assertRaises(ValueError, decode_cursor, "not-a-cursor")
+
+    def test_ascending(self):
+        expected = ["uid-1", "uid-2", "uid-3", "uid-4", "uid-5", "uid-6"]
+        for page_size in range(1, 7):
+            self.assertEqual(self.get_uids("ascending", page_size), expected)
+
+    def test_descending(self):
+        expected = ["uid-6", "uid-5", "uid-4", "uid-3", "uid-2", "uid-1"]
+        for page_size in range(1, 7):
+            self.assertEqual(self.get_uids("descending", page_size), expected)
+
+    def test_unsupported_sort_index(self):
+        query = dict(sort_on="getId", sort_order="ascending")
+        self.assertRaises(ValueError, get_cursor_page,
+                          self.catalog, query, "", 10)
+
+
+class TestBrainOnlyRead(BaseTestCase):
+
+    def setUp(self):
+        super(TestBrainOnlyRead, self).setUp()
+        setRoles(self.portal, TEST_USER_ID, ["Manager"])
+        setup = self.portal.bika_setup
+        self.category = api.create(setup.bika_analysiscategories,
+                                   "AnalysisCategory", title="Metals")
+
+    def test_read_extenders(self):
+        # workflow transitions are added to all objects, but only if requested
+        self.assertFalse(has_read_extenders("AnalysisCategory", ["Title"]))
+        self.assertTrue(has_read_extenders("AnalysisCategory",
+                                           ["Title", "transitions"]))
+        self.assertTrue(has_read_extenders("AnalysisCategory"))
+        # extenders that do not declare their fields are always called
+        self.assertTrue(has_read_extenders("AnalysisRequest", ["getId"]))
+
+    def test_brain_only(self):
+        uid = api.get_uid(self.category)
+        brain = api.get_tool("bika_setup_catalog")(UID=uid)[0]
+        data = get_object_data(self.request, BrainOnly(brain),
+                               ["Title", "UID"], [], brain_only=True)
+        self.assertEqual(data, {
+            "Title": "Metals",
+            "UID": uid,
+            "path": api.get_path(self.category),
+        })
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestCursorPagination))
+    suite.addTest(unittest.makeSuite(TestBrainOnlyRead))
+    return suite
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import asyncore
+import os
+import shutil
+import smtpd
+import socket
+import tempfile
+import threading
+
+from bika.lims import mailspool
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+
+class SMTPServer(smtpd.SMTPServer):
+    """Local SMTP server that keeps the received messages
+    """
+
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ("127.0.0.1", 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.messages = []
+        self.connections = 0
+
+    def handle_accept(self):
+        self.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        self.messages.append((mailfrom, rcpttos, data))
+
+
+def get_free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestMailSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.spool = mailspool.MailSpool(self.path)
+        self.server = SMTPServer()
+        self.thread = threading.Thread(
+            target=asyncore.loop, kwargs={"timeout": 0.1})
+        self.thread.daemon = True
+        self.thread.start()
+        self.results = []
+
+    def tearDown(self):
+        self.server.close()
+        self.thread.join()
+        shutil.rmtree(self.path)
+
+    def get_worker(self, port=None):
+        sender = mailspool.SMTPSender("127.0.0.1", port or self.server.port)
+        return mailspool.SpoolWorker(self.spool, sender,
+                                     callback=self.results.extend)
+
+    def test_deliver_over_one_connection(self):
+        for num in range(3):
+            self.spool.put("lab@example.com",
+                           "client{}@example.com".format(num),
+                           "Subject: Results\n\nReport {}".format(num),
+                           email_id="1")
+        worker = self.get_worker()
+        results = worker.process()
+        worker.sender.close()
+
+        self.assertEqual(len(self.spool), 0)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(map(lambda msg: msg[1], self.server.messages),
+                         [["client0@example.com"], ["client1@example.com"],
+                          ["client2@example.com"]])
+        self.assertEqual(map(lambda res: res[1], results),
+                         [mailspool.SENT] * 3)
+        self.assertEqual(self.results, results)
+        self.assertEqual(results[0][0]["info"], {"email_id": "1"})
+
+    def test_retry(self):
+        self.spool.put("lab@example.com", "client@example.com",
+                       "Subject: Results\n\nReport")
+        # no server listening
+        worker = self.get_worker(port=get_free_port())
+        results = worker.process()
+        self.assertEqual(results[0][1], mailspool.RETRY)
+        self.assertEqual(results[0][0]["attempts"], 1)
+        # message is kept in the spool, but not due yet
+        self.assertEqual(len(self.spool), 1)
+        self.assertEqual(self.spool.get_due(), [])
+        self.assertEqual(worker.process(), [])
+
+    def test_failed(self):
+        self.spool.put("lab@example.com", "client@example.com",
+                       "Subject: Results\n\nReport")
+        worker = self.get_worker(port=get_free_port())
+        for attempt in range(mailspool.MAX_ATTEMPTS):
+            name = os.listdir(os.path.join(self.path, "new"))[0]
+            status = self.spool.retry(name, self.spool.load(name), "error")
+        self.assertFalse(status)
+        self.assertEqual(len(self.spool), 0)
+        self.assertEqual(len(os.listdir(os.path.join(self.path, "failed"))), 1)
+        self.assertEqual(worker.process(), [])
+
+    def test_start_pending_delivery(self):
+        started = []
+        get_spool_directory = mailspool.get_spool_directory
+        get_worker = mailspool.get_worker
+        mailspool.get_spool_directory = lambda: self.path
+        mailspool.get_worker = lambda: started.append(True)
+        try:
+            # messages left in the spool by a former process
+            self.spool.put("lab@example.com", "client@example.com",
+                           "Subject: Results\n\nReport")
+            mailspool._pending_checked = False
+            mailspool.start_pending_delivery()
+            self.assertEqual(started, [True])
+            # the spool is only checked once
+            mailspool.start_pending_delivery()
+            self.assertEqual(started, [True])
+        finally:
+            mailspool.get_spool_directory = get_spool_directory
+            mailspool.get_worker = get_worker
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestMailSpool))
+    return suite
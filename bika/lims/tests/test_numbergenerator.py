@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import os
+import shutil
+import tempfile
+import threading
+
+import transaction
+from bika.lims.numbergenerator import NUMBER_STORAGE
+from bika.lims.numbergenerator import NumberGenerator
+from BTrees.OIBTree import OIBTree
+from ZODB.DB import DB
+from ZODB.FileStorage import FileStorage
+from ZODB.POSException import ConflictError
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+THREADS = 8
+NUMBERS = 50
+KEY = "analysisrequest-W"
+
+
+class LocalNumberGenerator(NumberGenerator):
+    """Number generator that keeps the counters in the root of the ZODB
+    connection bound to the current thread
+    """
+
+    def __init__(self, block_size=None):
+        super(LocalNumberGenerator, self).__init__(block_size=block_size)
+        self.local = threading.local()
+
+    @property
+    def annotations(self):
+        return self.local.connection.root()
+
+
+class TestNumberGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        path = os.path.join(self.tempdir, "Data.fs")
+        # each thread uses a second connection to reserve blocks of numbers
+        self.db = DB(FileStorage(path), pool_size=THREADS * 2 + 1)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tempdir)
+
+    def generate(self, generator, keys, results, errors):
+        """Generates numbers for the given keys in a thread, one transaction
+        per number and retrying on conflicts like the publisher does
+        """
+        tm = transaction.TransactionManager()
+        connection = self.db.open(transaction_manager=tm)
+        generator.local.connection = connection
+        try:
+            for key in keys:
+                for attempt in range(100):
+                    tm.begin()
+                    try:
+                        number = generator.generate_number(key=key)
+                        tm.commit()
+                    except ConflictError:
+                        tm.abort()
+                        continue
+                    results.append((key, number))
+                    break
+                else:
+                    errors.append(key)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            tm.abort()
+            connection.close()
+
+    def run_threads(self, generators, keys):
+        """Generates the numbers for the given keys in each thread, with one
+        ZODB connection per thread
+        """
+        results = []
+        errors = []
+        threads = [threading.Thread(target=self.generate,
+                                    args=(generators[num % len(generators)],
+                                          keys, results, errors))
+                   for num in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), THREADS * len(keys))
+        return results
+
+    def open(self, generator):
+        tm = transaction.TransactionManager()
+        connection = self.db.open(transaction_manager=tm)
+        generator.local.connection = connection
+        return tm, connection
+
+    def test_unique_consecutive_numbers(self):
+        generator = LocalNumberGenerator(block_size=1)
+        results = self.run_threads([generator], [KEY] * NUMBERS)
+        numbers = sorted(map(lambda result: result[1], results))
+        # no gaps and no duplicates
+        self.assertEqual(numbers, range(1, THREADS * NUMBERS + 1))
+
+    def test_unique_numbers_per_key(self):
+        generator = LocalNumberGenerator(block_size=1)
+        keys = ["{}-{}".format(KEY, num % 5) for num in range(NUMBERS)]
+        results = self.run_threads([generator], keys)
+        for key in set(keys):
+            numbers = [number for k, number in results if k == key]
+            self.assertEqual(sorted(numbers), range(1, len(numbers) + 1))
+
+    def test_unique_numbers_with_blocks(self):
+        generator = LocalNumberGenerator(block_size=10)
+        # commit the counter first, blocks are only reserved for stored ones
+        tm, connection = self.open(generator)
+        generator.generate_number(key=KEY)
+        tm.commit()
+        connection.close()
+
+        # one generator per thread, like ZEO clients reserving their blocks
+        generators = [LocalNumberGenerator(block_size=10)
+                      for num in range(THREADS)]
+        results = self.run_threads(generators, [KEY] * NUMBERS)
+        numbers = map(lambda result: result[1], results)
+        self.assertEqual(len(numbers), len(set(numbers)))
+        self.assertTrue(min(numbers) > 1)
+
+        # the stored value is the end of the last reserved block
+        tm, connection = self.open(generator)
+        self.assertTrue(generator.get(KEY) >= max(numbers))
+        connection.close()
+
+    def test_set_number_discards_blocks(self):
+        generator = LocalNumberGenerator(block_size=10)
+        tm, connection = self.open(generator)
+        generator.generate_number(key=KEY)
+        tm.commit()
+        self.assertEqual(generator.generate_number(key=KEY), 2)
+        tm.commit()
+
+        # another process resets the counter
+        other = LocalNumberGenerator(block_size=10)
+        other_tm, other_connection = self.open(other)
+        other.set_number(KEY, 100)
+        other_tm.commit()
+        other_connection.close()
+
+        tm.begin()
+        self.assertEqual(generator.generate_number(key=KEY), 101)
+        tm.commit()
+        connection.close()
+
+    def test_delete_number(self):
+        generator = LocalNumberGenerator(block_size=10)
+        tm, connection = self.open(generator)
+        generator.generate_number(key=KEY)
+        tm.commit()
+        self.assertEqual(generator.generate_number(key=KEY), 2)
+        tm.commit()
+
+        # the counter and the block reserved by this process are removed
+        generator.delete_number(KEY)
+        tm.commit()
+        self.assertIsNone(generator.get(KEY))
+        self.assertEqual(generator._blocks, {})
+        self.assertEqual(generator.generate_number(key=KEY), 1)
+        tm.commit()
+
+        del generator[KEY]
+        tm.commit()
+        self.assertEqual(generator.keys(), [])
+        self.assertRaises(KeyError, generator.delete_number, KEY)
+        connection.close()
+
+    def test_allocate(self):
+        generator = LocalNumberGenerator(block_size=1)
+        tm, connection = self.open(generator)
+        generator.generate_number(key=KEY)
+        tm.commit()
+
+        # the numbers are reserved at once for all records
+        with generator.allocate({KEY: 5}):
+            self.assertEqual(generator.generate_number(key=KEY), 2)
+        tm.abort()
+        self.assertEqual(generator.storage[KEY].value, 6)
+
+        # the remaining numbers are used before incrementing the counter
+        numbers = [generator.generate_number(key=KEY) for num in range(5)]
+        tm.commit()
+        self.assertEqual(numbers, [3, 4, 5, 6, 7])
+        connection.close()
+
+    def test_allocate_per_key(self):
+        other = "{}-other".format(KEY)
+        generator = LocalNumberGenerator(block_size=1)
+        tm, connection = self.open(generator)
+        generator.generate_number(key=KEY)
+        generator.generate_number(key=other)
+        tm.commit()
+
+        with generator.allocate({KEY: 3, other: 1}):
+            self.assertEqual(generator.generate_number(key=KEY), 2)
+            self.assertEqual(generator.generate_number(key=other), 2)
+            self.assertEqual(generator.generate_number(key=KEY), 3)
+            self.assertEqual(generator.generate_number(key=KEY), 4)
+        tm.commit()
+
+        # only the numbers requested for each key were reserved
+        self.assertEqual(generator.storage[KEY].value, 4)
+        self.assertEqual(generator.storage[other].value, 2)
+        self.assertEqual(generator.generate_number(key=KEY), 5)
+        tm.commit()
+        connection.close()
+
+    def test_dry_run_does_not_generate(self):
+        generator = LocalNumberGenerator(block_size=1)
+        tm, connection = self.open(generator)
+        self.assertEqual(generator.get(KEY, 1), 1)
+        self.assertEqual(generator.generate_number(key=KEY), 1)
+        self.assertEqual(generator.get(KEY, 1), 1)
+        self.assertEqual(generator.generate_number(key=KEY), 2)
+        tm.commit()
+        connection.close()
+
+    def test_migrate_legacy_storage(self):
+        generator = LocalNumberGenerator()
+        tm, connection = self.open(generator)
+        legacy = OIBTree()
+        legacy[KEY] = 41
+        connection.root()[NUMBER_STORAGE] = legacy
+        tm.commit()
+
+        self.assertEqual(generator.get(KEY), 41)
+        self.assertEqual(generator.generate_number(key=KEY), 42)
+        tm.commit()
+        self.assertEqual(dict(generator.items()), {KEY: 42})
+        connection.close()
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestNumberGenerator))
+    return suite
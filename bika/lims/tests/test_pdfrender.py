@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from bika.lims import pdfrender
+from bika.lims.pdfrender import PDFCache
+from bika.lims.pdfrender import RenderTimeoutError
+from bika.lims.pdfrender import fetch_resources
+from bika.lims.pdfrender import get_key
+from bika.lims.pdfrender import get_urls
+from bika.lims.pdfrender import render_in_process
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+SITE_URL = "http://localhost:8080/senaite"
+
+HTML = """<html><head>
+<link rel="stylesheet" href="http://localhost:8080/senaite/sticker.css"/>
+</head><body>
+<img src='http://localhost:8080/senaite/logo.png'/>
+<img src="https://www.example.com/external.png"/>
+</body></html>"""
+
+RESOURCES = {
+    SITE_URL + "/sticker.css": {
+        "string": "@import 'print.css'; body { background: url(bg.png) }",
+        "mime_type": "text/css",
+    },
+    SITE_URL + "/print.css": {
+        "string": "h1 { color: red }",
+        "mime_type": "text/css",
+    },
+    SITE_URL + "/bg.png": {"string": "PNG", "mime_type": "image/png"},
+    SITE_URL + "/logo.png": {"string": "PNG", "mime_type": "image/png"},
+}
+
+
+# Worker that renders immediately, unless asked to hang or fail
+WORKER = """
+import imp
+import time
+
+worker = imp.load_source("pdfworker", {path!r})
+
+
+def render(html, css=None, resources=None):
+    if html == "hang":
+        time.sleep(60)
+    if html == "fail":
+        raise ValueError("Bad HTML")
+    return "%PDF-" + html
+
+
+worker.main(render)
+"""
+
+
+class TestPDFRender(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fetched = []
+        self.worker = pdfrender.WORKER
+        fd, pdfrender.WORKER = tempfile.mkstemp(suffix=".py")
+        with os.fdopen(fd, "w") as f:
+            f.write(WORKER.format(path=self.worker))
+
+    def tearDown(self):
+        os.remove(pdfrender.WORKER)
+        pdfrender.WORKER = self.worker
+        shutil.rmtree(self.path)
+
+    def url_fetcher(self, url):
+        self.fetched.append(url)
+        return dict(RESOURCES[url])
+
+    def test_key(self):
+        self.assertEqual(get_key(u"<p>é</p>"), get_key("<p>\xc3\xa9</p>"))
+        self.assertNotEqual(get_key("<p/>"), get_key("<p/>", "p {}"))
+
+    def test_get_urls(self):
+        self.assertEqual(get_urls(HTML), [
+            SITE_URL + "/sticker.css",
+            SITE_URL + "/logo.png",
+            "https://www.example.com/external.png",
+        ])
+
+    def test_fetch_resources(self):
+        resources = fetch_resources(
+            HTML, url_fetcher=self.url_fetcher,
+            is_local=lambda url: url.startswith(SITE_URL))
+        # resources referenced by stylesheets are fetched as well
+        self.assertEqual(sorted(resources.keys()), sorted(RESOURCES.keys()))
+        self.assertEqual(len(self.fetched), len(RESOURCES))
+
+    def test_cache(self):
+        cache = PDFCache(self.path, max_size=10)
+        key = get_key("<p/>")
+        self.assertIsNone(cache.get(key))
+        cache.set(key, "%PDF-1")
+        self.assertEqual(cache.get(key), "%PDF-1")
+
+    def test_prune(self):
+        cache = PDFCache(self.path, max_size=10)
+        for num in range(3):
+            key = get_key("<p>{}</p>".format(num))
+            cache.set(key, "%PDF-{}".format(num))
+            path = cache.get_path(key)
+            os.utime(path, (num, num))
+        cache.prune()
+        # the most recent PDF is kept
+        self.assertEqual(len(cache.get_files()), 1)
+        self.assertEqual(cache.get(key), "%PDF-2")
+
+    def test_render_in_process(self):
+        self.assertEqual(render_in_process("<p/>", None, {}, 10), "%PDF-<p/>")
+        self.assertRaises(RuntimeError, render_in_process, "fail", None, {}, 10)
+
+    def test_render_timeout(self):
+        errors = []
+
+        def hang():
+            try:
+                render_in_process("hang", None, {}, 2)
+            except RenderTimeoutError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=hang)
+        thread.start()
+        # other renderings are not affected by the hanging one
+        start = time.time()
+        self.assertEqual(render_in_process("<p/>", None, {}, 10), "%PDF-<p/>")
+        self.assertTrue(time.time() - start < 2)
+        thread.join()
+        self.assertEqual(len(errors), 1)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestPDFRender))
+    return suite
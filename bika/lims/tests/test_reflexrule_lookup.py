@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import itertools
+
+from bika.lims.utils.reflexrule import compile_action_set
+from bika.lims.utils.reflexrule import evaluate_conditions
+from bika.lims.utils.reflexrule import is_condition_met
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+ACTION_SET = {
+    "actions": [{"act_row_idx": 0, "action": "repeat"}],
+    "conditions": [
+        {"analysisservice": "rep-1", "and_or": "and", "cond_row_idx": 0,
+         "discreteresult": "", "range0": "5", "range1": "10"},
+        {"analysisservice": "rep-2", "and_or": "no", "cond_row_idx": 1,
+         "discreteresult": "2", "range0": "", "range1": ""},
+    ],
+    "mother_service_uid": "52853cf7d5114b5aa8c159afad2f3da1",
+    "rulenumber": "1",
+    "trigger": "submit",
+}
+
+
+class TestReflexRuleLookup(unittest.TestCase):
+
+    def test_compile_action_set(self):
+        action_set = compile_action_set("rule-uid", ACTION_SET)
+        self.assertEqual(action_set["rule_uid"], "rule-uid")
+        self.assertEqual(action_set["trigger"], "submit")
+        conditions = action_set["conditions"]
+        self.assertEqual(conditions[0]["range"], (5.0, 10.0))
+        self.assertIsNone(conditions[1]["range"])
+        # the actions of the rule are not shared
+        self.assertIsNot(action_set["actions"][0], ACTION_SET["actions"][0])
+
+    def test_is_condition_met(self):
+        conditions = compile_action_set("uid", ACTION_SET)["conditions"]
+        self.assertTrue(is_condition_met(conditions[0], "5"))
+        self.assertTrue(is_condition_met(conditions[0], "7.5"))
+        self.assertFalse(is_condition_met(conditions[0], "10.1"))
+        self.assertFalse(is_condition_met(conditions[0], ""))
+        self.assertTrue(is_condition_met(conditions[1], "2", discrete=True))
+        self.assertFalse(is_condition_met(conditions[1], "2"))
+
+    def test_evaluate_conditions(self):
+        self.assertFalse(evaluate_conditions([]))
+        # same results as evaluating the expression with Python
+        for values in itertools.product([True, False], repeat=3):
+            for ops in itertools.product(["and", "or"], repeat=2):
+                expression = "{} {} {} {} {}".format(
+                    values[0], ops[0], values[1], ops[1], values[2])
+                resolutions = zip(values, list(ops) + ["no"])
+                self.assertEqual(evaluate_conditions(resolutions),
+                                 eval(expression), expression)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestReflexRuleLookup))
+    return suite
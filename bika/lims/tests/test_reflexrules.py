@@ -22,6 +22,7 @@ from bika.lims.idserver import renameAfterCreation
 from bika.lims.tests.base import DataTestCase
 from bika.lims.utils import tmpID
 from bika.lims.utils.analysisrequest import create_analysisrequest
+from bika.lims.utils.reflexrule import get_compiled_action_sets
 from bika.lims.workflow import doActionFor
 from plone.app.testing import TEST_USER_ID, TEST_USER_NAME, login, setRoles
 
@@ -284,6 +285,13 @@ class TestReflexRules(DataTestCase):
             ans_list[0].UID() == rule.getReflexRules()[0]
             .get('mother_service_uid', '')
             )
+        # The action sets are compiled into the lookup table
+        action_sets = get_compiled_action_sets(
+            method.UID(), ans_list[0].UID(), 'submit')
+        self.assertEqual(len(action_sets), 1)
+        self.assertEqual(action_sets[0]['rule_uid'], rule.UID())
+        self.assertEqual(get_compiled_action_sets(
+            method.UID(), ans_list[0].UID(), 'verify'), [])
         # Create an analysis Request
         client = self.portal.clients['client-1']
         sampletype = self.portal.bika_setup.bika_sampletypes['sampletype-1']
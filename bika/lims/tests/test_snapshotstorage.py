@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+import json
+import os
+import shutil
+import tempfile
+
+import transaction
+from bika.lims import logger
+from bika.lims.api.snapshot import SnapshotStorage
+from persistent.list import PersistentList
+from ZODB.DB import DB
+from ZODB.FileStorage import FileStorage
+
+try:
+    import unittest2 as unittest
+except ImportError:  # Python 2.7
+    import unittest
+
+OBJECTS = 20
+VERSIONS = 30
+FIELDS = 60
+
+
+def generate_snapshots(seed):
+    """Generates the snapshots of an object that is edited/transitioned once
+    per version, with a single field changed each time
+    """
+    snapshot = dict(map(lambda num: ("Field{}".format(num),
+                                     "Value {} of object {}".format(num, seed)),
+                        range(FIELDS)))
+    snapshots = []
+    for version in range(VERSIONS):
+        snapshot = dict(snapshot)
+        snapshot["Field{}".format(version % FIELDS)] = "Changed {}".format(
+            version)
+        snapshot["__metadata__"] = {
+            "actor": "analyst",
+            "action": "action_{}".format(version),
+            "review_state": "state_{}".format(version),
+            "snapshot_created": "2020-01-01T00:00:{:02d}".format(version),
+        }
+        snapshots.append(snapshot)
+    return snapshots
+
+
+class TestSnapshotStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def get_database_size(self, factory, append):
+        """Stores the generated snapshots, one transaction per version, and
+        returns the size of the database before and after packing
+        """
+        path = os.path.join(self.tempdir, "{}.fs".format(factory.__name__))
+        db = DB(FileStorage(path))
+        try:
+            connection = db.open()
+            root = connection.root()
+            datasets = map(generate_snapshots, range(OBJECTS))
+            for num in range(OBJECTS):
+                root[num] = factory()
+            transaction.commit()
+            for version in range(VERSIONS):
+                for num in range(OBJECTS):
+                    append(root[num], datasets[num][version])
+                transaction.commit()
+            connection.close()
+            size = db.storage.getSize()
+            db.pack()
+            return size, db.storage.getSize()
+        finally:
+            db.close()
+
+    def test_reconstruct_versions(self):
+        snapshots = generate_snapshots(0)
+        storage = SnapshotStorage(snapshots, rebase_interval=7)
+        self.assertEqual(len(storage), VERSIONS)
+        self.assertEqual(list(storage), snapshots)
+        for version, snapshot in enumerate(snapshots):
+            self.assertEqual(storage.get(version), snapshot)
+        self.assertEqual(storage[-1], snapshots[-1])
+        self.assertEqual(storage.get(VERSIONS), None)
+        self.assertRaises(IndexError, storage.__getitem__, VERSIONS)
+
+    def test_removed_fields(self):
+        snapshots = [{"a": 1, "b": 2}, {"a": 1}, {"a": 1, "b": [3]}]
+        storage = SnapshotStorage(snapshots)
+        self.assertEqual(list(storage), snapshots)
+
+    def test_database_size(self):
+        legacy = self.get_database_size(
+            PersistentList, lambda storage, snapshot:
+            storage.append(json.dumps(snapshot)))
+        delta = self.get_database_size(
+            SnapshotStorage, lambda storage, snapshot:
+            storage.append(snapshot))
+
+        logger.info("Snapshots of {} objects with {} versions: "
+                    "{} -> {} bytes, packed {} -> {} bytes"
+                    .format(OBJECTS, VERSIONS, legacy[0], delta[0],
+                            legacy[1], delta[1]))
+
+        # every appended version rewrote the whole list before
+        self.assertTrue(delta[0] * 2 < legacy[0])
+        # only full snapshots were kept before
+        self.assertTrue(delta[1] * 2 < legacy[1])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestSnapshotStorage))
+    return suite
@@ -1696,7 +1696,7 @@ def change_analysis_requests_id_formatting(portal, p_type="AnalysisRequest"):
         number_generator = getUtility(INumberGenerator)
         ar_keys = dict()
         ar_keys_prev = dict()
-        for key, value in number_generator.storage.items():
+        for key, value in number_generator.items():
             if "sample-" in key:
                 ar_key = key.replace("sample-", "analysisrequest-")
                 ar_keys[ar_key] = api.to_int(value, 0)
@@ -26,19 +26,30 @@ import transaction
 from bika.lims import api
 from bika.lims import logger
 from bika.lims.api.mail import is_valid_email_address
+from bika.lims.api.snapshot import migrate_storage
+from bika.lims.api.snapshot import supports_snapshots
+from bika.lims.browser.fields import uidreferencefield
 from bika.lims.catalog import CATALOG_ANALYSIS_LISTING
 from bika.lims.catalog import CATALOG_ANALYSIS_REQUEST_LISTING
 from bika.lims.catalog.bikasetup_catalog import SETUP_CATALOG
 from bika.lims.config import PROJECTNAME as product
 from bika.lims.interfaces import IAnalysisRequestWithPartitions
+from bika.lims.interfaces import INumberGenerator
 from bika.lims.interfaces import ISubmitted
 from bika.lims.interfaces import IVerified
 from bika.lims.setuphandlers import add_dexterity_setup_items
+from bika.lims.setuphandlers import setup_aggregates
 from bika.lims.setuphandlers import setup_form_controller_actions
 from bika.lims.setuphandlers import setup_html_filter
+from bika.lims.setuphandlers import setup_id_lookup_index
 from bika.lims.upgrade import upgradestep
 from bika.lims.upgrade.utils import UpgradeUtils
+from bika.lims.utils.instrument import sweep_instruments_validity
+from bika.lims.utils.keywordregistry import rebuild_registry
+from bika.lims.utils.reflexrule import compile_reflex_rule
 from Products.Archetypes.config import UID_CATALOG
+from zope.annotation.interfaces import IAnnotations
+from zope.component import getUtility
 from zope.interface import alsoProvides
 
 version = "1.3.3"  # Remember version number in metadata.xml and setup.py
@@ -385,6 +396,33 @@ def upgrade(tool):
     # https://github.com/senaite/senaite.core/pull/1542
     fix_email_address(portal)
 
+    # Store the numbers of the number generator in per-key counters
+    migrate_number_generator_storage(portal)
+
+    # Store audit log snapshots as a base snapshot plus diffs per version
+    migrate_snapshot_storages(portal)
+
+    # Store UIDReferenceField backreferences in BTree based sets
+    migrate_backreferences_storages(portal)
+
+    # Resolve scanned IDs/barcodes with a lookup index
+    setup_id_lookup_index(portal)
+
+    # Store the validity state of instruments
+    sweep_instruments_validity()
+
+    # Aggregated counts for the dashboard
+    setup_aggregates(portal)
+
+    # Metadata-only productivity reports
+    add_productivity_metadata(portal)
+
+    # Lookup table of the reflex rules
+    setup_reflex_rules_lookup(portal)
+
+    # Registry of the keywords of services and interim fields
+    setup_keyword_registry(portal)
+
     logger.info("{0} upgraded to version {1}".format(product, version))
     return True
 
@@ -857,4 +895,127 @@ def fix_email_address(portal, portal_types=None, catalog_id="portal_catalog"):
                 logger.warn("Cannot resolve email address from '{}'"
                             .format(email_address))
 
-    logger.info("Fixing email addresses [DONE]")
\ No newline at end of file
+    logger.info("Fixing email addresses [DONE]")
+
+
+def migrate_number_generator_storage(portal):
+    """Migrates the numbers of the number generator from a single `OIBTree` to
+    one persistent counter per key, so the generation of numbers for different
+    keys does not conflict anymore
+    """
+    logger.info("Migrating number generator storage ...")
+    number_generator = getUtility(INumberGenerator)
+    number_generator.migrate_storage()
+    logger.info("Migrating number generator storage [DONE]")
+
+
+def migrate_snapshot_storages(portal):
+    """Migrates the audit log snapshots from a list of JSON snapshots to the
+    delta encoded `SnapshotStorage`
+    """
+    logger.info("Migrating snapshot storages ...")
+    uid_catalog = api.get_tool(UID_CATALOG)
+    brains = uid_catalog()
+    total = len(brains)
+    for num, brain in enumerate(brains):
+        if num and num % 1000 == 0:
+            logger.info("{}/{} Migrating snapshot storages ...".format(
+                num, total))
+            transaction.commit()
+
+        obj = api.get_object(brain)
+        if not supports_snapshots(obj):
+            continue
+        migrate_storage(obj)
+
+    logger.info("Migrating snapshot storages [DONE]")
+
+
+def migrate_backreferences_storages(portal):
+    """Migrates the backreferences of UIDReferenceFields from a dict of UID
+    lists to a BTree of UID sets, committing every 1000 objects
+    """
+    logger.info("Migrating backreferences storages ...")
+    uid_catalog = api.get_tool(UID_CATALOG)
+    brains = uid_catalog()
+    total = len(brains)
+    for num, brain in enumerate(brains):
+        if num and num % 1000 == 0:
+            logger.info("{}/{} Migrating backreferences storages ...".format(
+                num, total))
+            transaction.commit()
+
+        obj = api.get_object(brain)
+        annotation = IAnnotations(obj, None)
+        if annotation is None:
+            continue
+        if uidreferencefield.BACKREFS_STORAGE not in annotation:
+            continue
+        uidreferencefield.migrate_storage(obj)
+
+    logger.info("Migrating backreferences storages [DONE]")
+
+
+def add_productivity_metadata(portal):
+    """Adds the getDateVerified and getMaxTimeAllowed metadata columns to the
+    analyses catalog, used by the productivity reports to not wake-up the
+    analyses
+    """
+    logger.info("Adding productivity metadata ...")
+    catalog = api.get_tool(CATALOG_ANALYSIS_LISTING)
+    columns = ["getDateVerified", "getMaxTimeAllowed"]
+    columns = filter(lambda column: column not in catalog.schema(), columns)
+    if not columns:
+        logger.info("Productivity metadata already in catalog '{}' [SKIP]"
+                    .format(CATALOG_ANALYSIS_LISTING))
+        return
+    for column in columns:
+        catalog.addColumn(column)
+
+    # Only verified analyses are displayed in the productivity reports
+    query = dict(review_state=["verified", "published"])
+    brains = api.search(query, CATALOG_ANALYSIS_LISTING)
+    total = len(brains)
+    for num, brain in enumerate(brains):
+        if num and num % 1000 == 0:
+            logger.info("Adding productivity metadata: {}/{}"
+                        .format(num, total))
+            transaction.commit()
+        obj = api.get_object(brain)
+        obj.reindexObject(idxs=["review_state"])
+    logger.info("Adding productivity metadata [DONE]")
+
+
+def setup_reflex_rules_lookup(portal):
+    """Compiles the reflex rules into the lookup table and adds the
+    getReflexRuleLocalID index, used to find the analyses created by reflex
+    rules
+    """
+    logger.info("Compiling reflex rules ...")
+    for brain in api.search(dict(portal_type="ReflexRule"), "portal_catalog"):
+        compile_reflex_rule(api.get_object(brain))
+
+    catalog = api.get_tool(CATALOG_ANALYSIS_LISTING)
+    if "getReflexRuleLocalID" in catalog.indexes():
+        logger.info("Index 'getReflexRuleLocalID' already in catalog '{}' "
+                    "[SKIP]".format(CATALOG_ANALYSIS_LISTING))
+        return
+    catalog.addIndex("getReflexRuleLocalID", "FieldIndex")
+
+    # Only the analyses created by reflex rules have a local ID
+    index = catalog.Indexes["getOriginalReflexedAnalysisUID"]
+    uids = filter(None, index.uniqueValues())
+    if uids:
+        query = dict(getOriginalReflexedAnalysisUID=uids)
+        for brain in api.search(query, CATALOG_ANALYSIS_LISTING):
+            obj = api.get_object(brain)
+            obj.reindexObject(idxs=["getReflexRuleLocalID"])
+    logger.info("Compiling reflex rules [DONE]")
+
+
+def setup_keyword_registry(portal):
+    """Registers the keywords of all services and calculations
+    """
+    logger.info("Building the keyword registry ...")
+    rebuild_registry()
+    logger.info("Building the keyword registry [DONE]")
@@ -21,7 +21,6 @@
 import mimetypes
 import os
 import re
-import tempfile
 import urllib2
 from AccessControl import ModuleSecurityInfo
 from AccessControl import allow_module
@@ -42,11 +41,11 @@ from Products.DCWorkflow.events import AfterTransitionEvent
 from bika.lims import api
 from bika.lims import logger
 from bika.lims.browser import BrowserView
+from bika.lims.pdfrender import render_pdf
 from email.MIMEBase import MIMEBase
 from plone.memoize import ram
 from plone.registry.interfaces import IRegistry
 from plone.subrequest import subrequest
-from weasyprint import CSS, HTML
 from weasyprint import default_url_fetcher
 from zope.component import queryUtility
 from zope.event import notify
@@ -347,6 +346,39 @@ def isnumber(s):
     return api.is_floatable(s)
 
 
+def get_local_path(url):
+    """Returns the physical path of the site resource the URL points to, or
+    None if the URL is external
+    """
+    request = api.get_request()
+    if request is None:
+        return None
+    host = request.get_header("HOST")
+    try:
+        path = "/".join(request.physicalPathFromURL(url))
+    except ValueError:
+        return None
+
+    portal = api.get_portal()
+    context = portal.restrictedTraverse(path, None)
+
+    # We double check here to avoid an edge case, where we have the same path
+    # as well in our local site, e.g. we have `/senaite/img/systems/senaite.png`,
+    # but the user requested http://www.ridingbytes.com/img/systems/senaite.png:
+    #
+    # "/".join(request.physicalPathFromURL("http://www.ridingbytes.com/img/systems/senaite.png"))
+    # '/senaite/img/systems/senaite.png'
+    if context is None or not host or host not in url:
+        return None
+    return path
+
+
+def is_local_url(url):
+    """Checks if the URL points to a resource of the site
+    """
+    return get_local_path(url) is not None
+
+
 def senaite_url_fetcher(url):
     """Uses plone.subrequest to fetch an internal image resource.
 
@@ -380,22 +412,8 @@ def senaite_url_fetcher(url):
 
     logger.info("Fetching URL '{}' for WeasyPrint".format(url))
 
-    # get the pyhsical path from the URL
-    request = api.get_request()
-    host = request.get_header("HOST")
-    path = "/".join(request.physicalPathFromURL(url))
-
-    # fetch the object by sub-request
-    portal = api.get_portal()
-    context = portal.restrictedTraverse(path, None)
-
-    # We double check here to avoid an edge case, where we have the same path
-    # as well in our local site, e.g. we have `/senaite/img/systems/senaite.png`,
-    # but the user requested http://www.ridingbytes.com/img/systems/senaite.png:
-    #
-    # "/".join(request.physicalPathFromURL("http://www.ridingbytes.com/img/systems/senaite.png"))
-    # '/senaite/img/systems/senaite.png'
-    if context is None or host not in url:
+    path = get_local_path(url)
+    if path is None:
         logger.info("URL is external, passing over to the default URL fetcher...")
         return default_url_fetcher(url)
 
@@ -423,30 +441,21 @@ def createPdf(htmlreport, outfile=None, css=None, images={}):
     htmlreport: rendered html
     outfile: pdf filename; if supplied, caller is responsible for creating
              and removing it.
-    css: remote URL of css file to download
+    css: remote URL or local path of css file
     images: A dictionary containing possible URLs (keys) and local filenames
             (values) with which they may to be replaced during rendering.
-    # WeasyPrint will attempt to retrieve images directly from the URL
-    # referenced in the HTML report, which may refer back to a single-threaded
-    # (and currently occupied) zeoclient, hanging it.  All image source
-    # URL's referenced in htmlreport should be local files.
+    # The PDF is rendered by the rendering service of `bika.lims.pdfrender`
+    # in a separate process, which can not fetch resources of the site. The
+    # resources of the site referenced in htmlreport are fetched beforehand
+    # via sub-requests. Other URLs are fetched by the rendering process.
     """
-    # A list of files that should be removed after PDF is written
-    cleanup = []
     css_def = ''
     if css:
         if css.startswith("http://") or css.startswith("https://"):
-            # Download css file in temp dir
-            u = urllib2.urlopen(css)
-            _cssfile = tempfile.mktemp(suffix='.css')
-            localFile = open(_cssfile, 'w')
-            localFile.write(u.read())
-            localFile.close()
-            cleanup.append(_cssfile)
+            css_def = urllib2.urlopen(css).read()
         else:
-            _cssfile = css
-        cssfile = open(_cssfile, 'r')
-        css_def = cssfile.read()
+            with open(css, 'r') as cssfile:
+                css_def = cssfile.read()
 
     htmlreport = to_utf8(htmlreport)
 
@@ -454,19 +463,12 @@ def createPdf(htmlreport, outfile=None, css=None, images={}):
         htmlreport = htmlreport.replace(key, val)
 
     # render
-    htmlreport = to_utf8(htmlreport)
-    renderer = HTML(string=htmlreport, url_fetcher=senaite_url_fetcher, encoding='utf-8')
-    pdf_fn = outfile if outfile else tempfile.mktemp(suffix=".pdf")
-    if css:
-        renderer.write_pdf(pdf_fn, stylesheets=[CSS(string=css_def)])
-    else:
-        renderer.write_pdf(pdf_fn)
-    # return file data
-    pdf_data = open(pdf_fn, "rb").read()
-    if outfile is None:
-        os.remove(pdf_fn)
-    for fn in cleanup:
-        os.remove(fn)
+    pdf_data = render_pdf(htmlreport, css=css_def,
+                          url_fetcher=senaite_url_fetcher,
+                          is_local=is_local_url)
+    if outfile:
+        with open(outfile, "wb") as f:
+            f.write(pdf_data)
     return pdf_data
 
 
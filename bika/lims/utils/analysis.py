@@ -19,13 +19,19 @@
 # Some rights reserved, see README and LICENSE.
 
 import copy
+import itertools
 import math
+from collections import OrderedDict
+from collections import defaultdict
+from collections import deque
 
 import zope.event
 from Products.Archetypes.event import ObjectInitializedEvent
 from Products.CMFCore.utils import getToolByName
 from Products.CMFPlone.utils import _createObjectByType
+from bika.lims import api
 from bika.lims import bikaMessageFactory as _
+from bika.lims.catalog.bikasetup_catalog import SETUP_CATALOG
 from bika.lims.interfaces import IAnalysisService
 from bika.lims.utils import formatDecimalMark
 from bika.lims.utils import to_unicode
@@ -49,18 +55,169 @@ def duplicateAnalysis(analysis):
     return dup
 
 
+class DependencyGraph(object):
+    """Graph of dependencies amongst analyses that share the same container.
+
+    An analysis depends on another if the keyword of the latter is used in the
+    formula of the calculation assigned to the former. The graph is built with
+    a single catalog search for the keywords of the dependent services of all
+    the calculations involved, and answers the dependencies and dependents of
+    an analysis without further searches.
+
+    The graph stores the UIDs of the analyses only, so the review states of
+    the analyses must be checked by the caller.
+    """
+
+    def __init__(self, analyses):
+        """Builds the graph for the analyses passed in
+
+        :param analyses: list of analysis objects or catalog brains
+        """
+        # analysis uid -> keyword
+        self.keywords = OrderedDict()
+        # analysis uid -> calculation uid
+        self.calculations = {}
+        # calculation uid -> modification date
+        self.calculations_modified = {}
+
+        for analysis in analyses:
+            uid = api.get_uid(analysis)
+            self.keywords[uid] = self._get_value(analysis, "getKeyword")
+            calc_uid = self._get_value(analysis, "getCalculationUID")
+            if calc_uid:
+                self.calculations[uid] = calc_uid
+
+        # calculation uid -> keywords of dependent services
+        dependent_keywords = self._get_dependent_keywords(
+            set(self.calculations.values()))
+
+        # keyword -> analyses uids
+        by_keyword = defaultdict(list)
+        for uid, keyword in self.keywords.items():
+            by_keyword[keyword].append(uid)
+
+        self.dependencies = defaultdict(list)
+        self.dependents = defaultdict(list)
+        for uid, calc_uid in self.calculations.items():
+            for keyword in dependent_keywords.get(calc_uid, []):
+                for dependency_uid in by_keyword.get(keyword, []):
+                    if dependency_uid == uid:
+                        continue
+                    self.dependencies[uid].append(dependency_uid)
+                    self.dependents[dependency_uid].append(uid)
+
+    def _get_value(self, brain_or_object, name):
+        value = getattr(brain_or_object, name, None)
+        if callable(value):
+            value = value()
+        return value
+
+    def _get_dependent_keywords(self, calculation_uids):
+        """Returns a dict of calculation uid -> keywords of the services the
+        calculation depends on
+        """
+        services = {}
+        for calc_uid in calculation_uids:
+            calculation = api.get_object_by_uid(calc_uid, default=None)
+            if calculation is None:
+                continue
+            modified = api.get_modification_date(calculation)
+            self.calculations_modified[calc_uid] = modified.millis()
+            services[calc_uid] = calculation.getRawDependentServices() or []
+
+        service_uids = set(itertools.chain.from_iterable(services.values()))
+        if not service_uids:
+            return {}
+
+        query = dict(UID=list(service_uids))
+        brains = api.search(query, SETUP_CATALOG)
+        service_keywords = dict(map(
+            lambda brain: (api.get_uid(brain), brain.getKeyword), brains))
+
+        keywords = {}
+        for calc_uid, uids in services.items():
+            keywords[calc_uid] = set(
+                filter(None, map(service_keywords.get, uids)))
+        return keywords
+
+    def __contains__(self, uid):
+        return uid in self.keywords
+
+    def is_stale(self):
+        """Returns whether any of the calculations has been modified since the
+        graph was built
+        """
+        for calc_uid, modified in self.calculations_modified.items():
+            calculation = api.get_object_by_uid(calc_uid, default=None)
+            if calculation is None:
+                return True
+            if api.get_modification_date(calculation).millis() != modified:
+                return True
+        return False
+
+    def get_dependencies(self, uid):
+        """Returns the uids of the analyses the analysis depends on
+        """
+        return list(self.dependencies.get(uid, []))
+
+    def get_dependents(self, uid):
+        """Returns the uids of the analyses that depend on the analysis
+        """
+        return list(self.dependents.get(uid, []))
+
+    def get_sorted(self, uids=None):
+        """Returns the uids sorted in topological order, so each analysis
+        comes after the analyses it depends on. Analyses with circular
+        dependencies are placed at the end
+
+        :param uids: uids to sort. If None, all analyses from the graph
+        """
+        if uids is None:
+            uids = self.keywords.keys()
+        uids = filter(lambda uid: uid in self, uids)
+        selected = set(uids)
+
+        # number of selected dependencies not processed yet
+        pending = {}
+        for uid in uids:
+            deps = filter(lambda dep: dep in selected, self.dependencies[uid])
+            pending[uid] = len(deps)
+
+        queue = deque(filter(lambda uid: pending[uid] == 0, uids))
+        ordered = []
+        while queue:
+            uid = queue.popleft()
+            ordered.append(uid)
+            for dependent in self.dependents.get(uid, []):
+                if dependent not in selected:
+                    continue
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    queue.append(dependent)
+
+        # Circular dependencies
+        visited = set(ordered)
+        ordered.extend(filter(lambda uid: uid not in visited, uids))
+        return ordered
+
+
+# Some fields should not be copied from source!
+# BUT, if these fieldnames are present in kwargs, the value will
+# be set accordingly.
+IGNORE_FIELDNAMES = [
+    'UID', 'id', 'allowDiscussion', 'subject', 'location', 'contributors',
+    'creators', 'effectiveDate', 'expirationDate', 'language', 'rights',
+    'creation_date', 'modification_date', 'IsReflexAnalysis',
+    'OriginalReflexedAnalysis', 'ReflexAnalysisOf', 'ReflexRuleAction',
+    'ReflexRuleLocalID', 'ReflexRuleActionsTriggered', 'Hidden']
+
+# Analysis field values prototypes of the services: uid -> (key, prototype)
+_prototypes = {}
+
+
 def copy_analysis_field_values(source, analysis, **kwargs):
     src_schema = source.Schema()
     dst_schema = analysis.Schema()
-    # Some fields should not be copied from source!
-    # BUT, if these fieldnames are present in kwargs, the value will
-    # be set accordingly.
-    IGNORE_FIELDNAMES = [
-        'UID', 'id', 'allowDiscussion', 'subject', 'location', 'contributors',
-        'creators', 'effectiveDate', 'expirationDate', 'language', 'rights',
-        'creation_date', 'modification_date', 'IsReflexAnalysis',
-        'OriginalReflexedAnalysis', 'ReflexAnalysisOf', 'ReflexRuleAction',
-        'ReflexRuleLocalID', 'ReflexRuleActionsTriggered', 'Hidden']
     for field in src_schema.fields():
         fieldname = field.getName()
         if fieldname in IGNORE_FIELDNAMES and fieldname not in kwargs:
@@ -79,6 +236,82 @@ def copy_analysis_field_values(source, analysis, **kwargs):
             mutator(value)
 
 
+def to_prototype_value(value):
+    """Returns the value to keep in an analysis prototype. Objects are stored
+    as UIDs, so the prototype can be shared amongst ZODB connections
+    """
+    if isinstance(value, (list, tuple)):
+        return type(value)(map(to_prototype_value, value))
+    if api.is_object(value):
+        return api.get_uid(value)
+    return value
+
+
+def get_analysis_prototype(service, analysis):
+    """Returns the field values of the service to be set to new analyses
+
+    The prototype is built by walking the schema of the service once, and is
+    kept until the service is modified.
+
+    :param service: the Analysis Service the analysis is created from
+    :param analysis: a new analysis, used to look up the mutators
+    :returns: dict with the list of (fieldname, mutator name, value) to set
+        and the names of the fields that can be overridden with kwargs
+    """
+    uid = api.get_uid(service)
+    key = (service.modified(), service._p_serial)
+    cached = _prototypes.get(uid)
+    if cached and cached[0] == key and not service._p_changed:
+        return cached[1]
+
+    dst_schema = analysis.Schema()
+    values = []
+    fieldnames = set()
+    for field in service.Schema().fields():
+        fieldname = field.getName()
+        if fieldname not in dst_schema:
+            continue
+        fieldnames.add(fieldname)
+        if fieldname in IGNORE_FIELDNAMES:
+            continue
+        value = field.get(service)
+        if value:
+            mutator_name = dst_schema[fieldname].mutator
+            values.append((fieldname, mutator_name, to_prototype_value(value)))
+
+    prototype = dict(values=values, fieldnames=fieldnames)
+    if not service._p_changed:
+        # do not keep values that might be rolled back
+        _prototypes[uid] = (key, prototype)
+    return prototype
+
+
+def invalidate_analysis_prototype(service):
+    """Discards the analysis prototype of the service passed in
+    """
+    _prototypes.pop(api.get_uid(service), None)
+
+
+def apply_analysis_prototype(service, analysis, **kwargs):
+    """Sets the field values of the analysis from the prototype of the service
+    passed in. The values in kwargs take precedence, like with
+    `copy_analysis_field_values`
+    """
+    prototype = get_analysis_prototype(service, analysis)
+    for fieldname, mutator_name, value in prototype["values"]:
+        if fieldname in kwargs:
+            continue
+        mutator = getattr(analysis, mutator_name)
+        # Avoid references from the analysis to the values of the prototype
+        mutator(copy.deepcopy(value))
+
+    for fieldname, value in kwargs.items():
+        if fieldname not in prototype["fieldnames"] or not value:
+            continue
+        mutator = getattr(analysis, analysis.getField(fieldname).mutator)
+        mutator(value)
+
+
 def create_analysis(context, source, **kwargs):
     """Create a new Analysis.  The source can be an Analysis Service or
     an existing Analysis, and all possible field values will be set to the
@@ -92,16 +325,18 @@ def create_analysis(context, source, **kwargs):
     """
     an_id = kwargs.get('id', source.getKeyword())
     analysis = _createObjectByType("Analysis", context, an_id)
-    copy_analysis_field_values(source, analysis, **kwargs)
 
     # AnalysisService field is not present on actual AnalysisServices.
     if IAnalysisService.providedBy(source):
-        analysis.setAnalysisService(source)
+        service = source
+        apply_analysis_prototype(source, analysis, **kwargs)
     else:
-        analysis.setAnalysisService(source.getAnalysisService())
+        service = source.getAnalysisService()
+        copy_analysis_field_values(source, analysis, **kwargs)
+    analysis.setAnalysisService(service)
 
     # Set the interims from the Service
-    service_interims = analysis.getAnalysisService().getInterimFields()
+    service_interims = service.getInterimFields()
     # Avoid references from the analysis interims to the service interims
     service_interims = copy.deepcopy(service_interims)
     analysis.setInterimFields(service_interims)
@@ -25,11 +25,14 @@ import tempfile
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+import transaction
 from Products.Archetypes.config import UID_CATALOG
 from Products.CMFCore.utils import getToolByName
 from Products.CMFPlone.utils import _createObjectByType
 from Products.CMFPlone.utils import safe_unicode
 from email.Utils import formataddr
+from ZODB.POSException import ConflictError
+from zope.component import getUtility
 from zope.interface import alsoProvides
 from zope.lifecycleevent import modified
 
@@ -37,6 +40,7 @@ from bika.lims import api
 from bika.lims import bikaMessageFactory as _
 from bika.lims import logger
 from bika.lims.catalog import SETUP_CATALOG
+from bika.lims.idserver import get_sample_generated_key
 from bika.lims.idserver import renameAfterCreation
 from bika.lims.interfaces import IAnalysisRequest
 from bika.lims.interfaces import IAnalysisRequestRetest
@@ -44,6 +48,7 @@ from bika.lims.interfaces import IAnalysisRequestSecondary
 from bika.lims.interfaces import IAnalysisService
 from bika.lims.interfaces import IReceived
 from bika.lims.interfaces import IRoutineAnalysis
+from bika.lims.numbergenerator import INumberGenerator
 from bika.lims.utils import attachPdf
 from bika.lims.utils import changeWorkflowState
 from bika.lims.utils import copy_field_values
@@ -57,9 +62,15 @@ from bika.lims.workflow import push_reindex_to_actions_pool
 from bika.lims.workflow.analysisrequest import AR_WORKFLOW_ID
 from bika.lims.workflow.analysisrequest import do_action_to_analyses
 
+# Number of Samples created per transaction by `create_analysisrequests`
+BULK_CHUNK_SIZE = 100
+
+# Max attempts to create a chunk of Samples on conflicts
+BULK_RETRIES = 3
+
 
 def create_analysisrequest(client, request, values, analyses=None,
-                           results_ranges=None, prices=None):
+                           results_ranges=None, prices=None, cache=None):
     """Creates a new AnalysisRequest (a Sample) object
     :param client: The container where the Sample will be created
     :param request: The current Http Request object
@@ -70,6 +81,8 @@ def create_analysisrequest(client, request, values, analyses=None,
         from the Specification object defined in values["Specification"]
     :param prices: Mapping of AnalysisService UID -> price. If not set, prices
         are read from the associated analysis service.
+    :param cache: dict where services, profiles and templates are kept once
+        resolved, to share them amongst the creation of several Samples
     """
     # Don't pollute the dict param passed in
     values = dict(values.items())
@@ -77,7 +90,8 @@ def create_analysisrequest(client, request, values, analyses=None,
     # Resolve the Service uids of analyses to be added in the Sample. Values
     # passed-in might contain Profiles and also values that are not uids. Also,
     # additional analyses can be passed-in through either values or services
-    service_uids = to_services_uids(values=values, services=analyses)
+    service_uids = to_services_uids(values=values, services=analyses,
+                                    cache=cache)
 
     # Remove the Analyses from values. We will add them manually
     values.update({"Analyses": []})
@@ -87,12 +101,14 @@ def create_analysisrequest(client, request, values, analyses=None,
     ar.processForm(REQUEST=request, values=values)
 
     # Set the analyses manually
-    ar.setAnalyses(service_uids, prices=prices, specs=results_ranges)
+    services, dependencies = resolve_services(service_uids, cache=cache)
+    ar.setAnalyses(services, prices=prices, specs=results_ranges,
+                   dependencies=dependencies)
 
     # Handle hidden analyses from template and profiles
     # https://github.com/senaite/senaite.core/issues/1437
     # https://github.com/senaite/senaite.core/issues/1326
-    apply_hidden_services(ar)
+    apply_hidden_services(ar, cache=cache)
 
     # Handle rejection reasons
     rejection_reasons = resolve_rejection_reasons(values)
@@ -151,21 +167,160 @@ def create_analysisrequest(client, request, values, analyses=None,
     return ar
 
 
-def apply_hidden_services(sample):
+def create_analysisrequests(client, records, request=None,
+                            chunk_size=BULK_CHUNK_SIZE, commit=True):
+    """Creates Samples in bulk
+
+    Services, profiles and templates are resolved once for all records. The
+    records are created in chunks, each chunk within a single transaction:
+    the numbers for the IDs of the chunk are reserved at once and the catalog
+    operations are coalesced by the index queue until the chunk is committed.
+    A record that cannot be created is rolled back and reported, without
+    affecting the other records of the chunk.
+
+    :param client: The container where the Samples will be created
+    :param records: List of dicts with the values of the Samples, as passed to
+        `create_analysisrequest`. The keys "analyses", "results_ranges" and
+        "prices" are passed as the homonymous params
+    :param request: The current Http Request object
+    :param chunk_size: Number of Samples to create per transaction
+    :param commit: Whether to commit each chunk or make a savepoint only
+    :returns: list of dicts (one per record) with the keys "index", "uid",
+        "id" and "error". "error" is None if the Sample was created
+    """
+    if request is None:
+        request = api.get_request()
+    number_generator = getUtility(INumberGenerator)
+    cache = dict()
+    report = list()
+    chunk_size = max(1, chunk_size)
+
+    for start in range(0, len(records), chunk_size):
+        chunk = list(enumerate(records[start:start + chunk_size], start))
+        allocations = get_number_allocations(
+            client, map(lambda item: item[1], chunk))
+        for attempt in range(BULK_RETRIES):
+            results = list()
+            try:
+                with number_generator.allocate(allocations):
+                    for index, record in chunk:
+                        savepoint = transaction.savepoint(optimistic=True)
+                        try:
+                            sample = create_analysisrequest_from_record(
+                                client, request, record, cache=cache)
+                        except ConflictError:
+                            raise
+                        except Exception as e:
+                            logger.error("Cannot create Sample #{}: {}"
+                                         .format(index, e))
+                            savepoint.rollback()
+                            results.append(dict(index=index, uid=None,
+                                                id=None, error=repr(e)))
+                            continue
+                        results.append(dict(index=index, error=None,
+                                            uid=api.get_uid(sample),
+                                            id=api.get_id(sample)))
+                if commit:
+                    transaction.commit()
+                else:
+                    transaction.savepoint(optimistic=True)
+            except ConflictError:
+                if not commit or attempt == BULK_RETRIES - 1:
+                    raise
+                logger.info("Conflict while creating Samples {}-{}, "
+                            "retrying ...".format(start, start + len(chunk)))
+                transaction.abort()
+                continue
+            break
+        report.extend(results)
+        logger.info("Created {} of {} Samples".format(
+            len(filter(lambda result: not result["error"], report)),
+            len(records)))
+
+    return report
+
+
+def get_number_allocations(client, records):
+    """Returns a mapping of number generator key -> number of Samples created
+    from the records with an ID generated from this key
+    """
+    allocations = dict()
+    for record in records:
+        key = get_sample_generated_key(client, record)
+        if key is not None:
+            allocations[key] = allocations.get(key, 0) + 1
+    return allocations
+
+
+def create_analysisrequest_from_record(client, request, record, cache=None):
+    """Creates a Sample from a record of `create_analysisrequests`
+    """
+    values = dict(record.items())
+    analyses = values.pop("analyses", None)
+    results_ranges = values.pop("results_ranges", None)
+    prices = values.pop("prices", None)
+    return create_analysisrequest(client, request, values, analyses=analyses,
+                                  results_ranges=results_ranges, prices=prices,
+                                  cache=cache)
+
+
+def cached_call(cache, key, func, *args):
+    """Returns the result of func for the args passed in, stored in cache
+    with the given key if a cache is passed in
+    """
+    if cache is None:
+        return func(*args)
+    if key not in cache:
+        cache[key] = func(*args)
+    return cache[key]
+
+
+def resolve_services(service_uids, cache=None):
+    """Returns the services for the uids passed in and their dependencies
+    :param service_uids: list of Analysis Services uids
+    :param cache: dict to keep the services resolved
+    :returns: tuple of (list of services, list of dependencies)
+    """
+    def resolve(uid):
+        service = api.get_object_by_uid(uid, None)
+        if service is None:
+            logger.warn("'{}' is not a valid object!".format(repr(uid)))
+            return None, []
+        return service, service.getServiceDependencies()
+
+    services = list()
+    dependencies = list()
+    for uid in service_uids:
+        service, service_dependencies = cached_call(
+            cache, ("service", uid), resolve, uid)
+        if service is None:
+            continue
+        services.append(service)
+        dependencies.extend(service_dependencies)
+    return services, dependencies
+
+
+def apply_hidden_services(sample, cache=None):
     """
     Applies the hidden setting to the sample analyses in accordance with the
     settings from its template and/or profiles
     :param sample: the sample that contains the analyses
+    :param cache: dict to keep the hidden services of templates and profiles
     """
     hidden = list()
 
+    def get_hidden(profile_or_template):
+        key = ("hidden", api.get_uid(profile_or_template))
+        return cached_call(cache, key, get_hidden_service_uids,
+                           profile_or_template)
+
     # Get the "hidden" service uids from the template
     template = sample.getTemplate()
-    hidden = get_hidden_service_uids(template)
+    hidden = template and list(get_hidden(template)) or []
 
     # Get the "hidden" service uids from profiles
     profiles = sample.getProfiles()
-    hid_profiles = map(get_hidden_service_uids, profiles)
+    hid_profiles = map(get_hidden, profiles)
     hid_profiles = list(itertools.chain(*hid_profiles))
     hidden.extend(hid_profiles)
 
@@ -187,11 +342,13 @@ def get_hidden_service_uids(profile_or_template):
     return map(lambda setting: setting["uid"], hidden)
 
 
-def to_services_uids(services=None, values=None):
+def to_services_uids(services=None, values=None, cache=None):
     """
     Returns a list of Analysis Services uids
     :param services: A list of service items (uid, keyword, brain, obj, title)
     :param values: a dict, where keys are AR|Sample schema field names.
+    :param cache: dict to keep the uids resolved from keywords, titles and
+        profiles
     :returns: a list of Analyses Services UIDs
     """
     def to_list(value):
@@ -210,16 +367,27 @@ def to_services_uids(services=None, values=None):
     # Merge analyses from analyses_serv and values into one list
     uids = to_list(services) + to_list(values.get("Analyses"))
 
+    def to_uid(item):
+        if not isinstance(item, six.string_types):
+            return to_service_uid(item)
+        return cached_call(cache, ("uid", item), to_service_uid, item)
+
     # Convert them to a list of service uids
-    uids = filter(None, map(to_service_uid, uids))
+    uids = filter(None, map(to_uid, uids))
 
-    # Extend with service uids from profiles
-    profiles = to_list(values.get("Profiles"))
-    if profiles:
+    def get_profiles_services(profiles):
+        services = list()
         uid_catalog = api.get_tool(UID_CATALOG)
         for brain in uid_catalog(UID=profiles):
             profile = api.get_object(brain)
-            uids.extend(profile.getRawService() or [])
+            services.extend(profile.getRawService() or [])
+        return services
+
+    # Extend with service uids from profiles
+    profiles = to_list(values.get("Profiles"))
+    if profiles:
+        key = ("profiles", tuple(profiles))
+        uids.extend(cached_call(cache, key, get_profiles_services, profiles))
 
     # Get the service uids without duplicates, but preserving the order
     return list(dict.fromkeys(uids).keys())
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+
+"""Clock driven update of the validity state of instruments
+
+The validity of an instrument is stored by `Instrument.updateValidity` when a
+certification, calibration, validation or QC result changes. Date ranges that
+start or end as time goes by are handled by `sweep_instruments_validity`,
+which is meant to run periodically, either by calling the view
+`@@update_instruments_validity` of the site from a cron job, or by running this
+module as a script, e.g.:
+
+    bin/instance run bika/lims/utils/instrument.py <site-id> [<manager-id>]
+"""
+
+from DateTime import DateTime
+from bika.lims import api
+from bika.lims import logger
+
+
+def sweep_instruments_validity(now=None):
+    """Updates the validity of the instruments whose validity state is not
+    set yet or whose `valid_until` date is reached. The analyses assigned to
+    the instruments are only reindexed if the instrument became valid or
+    invalid
+
+    :returns: list of instruments whose validity changed
+    """
+    now = now or DateTime()
+    query = {"portal_type": "Instrument"}
+    changed = []
+    for brain in api.search(query, "bika_setup_catalog"):
+        instrument = api.get_object(brain)
+        validity = getattr(instrument, "_validity", None)
+        if validity is not None and \
+                not instrument.isValidityExpired(validity, now=now):
+            continue
+        if instrument.updateValidity():
+            changed.append(instrument)
+    logger.info("Validity of {} instruments changed".format(len(changed)))
+    return changed
+
+
+if __name__ == "__main__":
+    # Run with `bin/instance run <this file> <site-id> [<manager-id>]`. The
+    # `app` variable is provided by the instance script
+    import sys
+
+    import transaction
+    from AccessControl.SecurityManagement import newSecurityManager
+    from Testing.makerequest import makerequest
+    from zope.component.hooks import setSite
+
+    args = sys.argv[1:]
+    if not args:
+        sys.exit("Usage: bin/instance run {} <site-id> [<manager-id>]"
+                 .format(__file__))
+    site_id = args[0]
+    manager_id = len(args) > 1 and args[1] or "admin"
+
+    app = makerequest(app)  # noqa
+    site = app.get(site_id)
+    if site is None:
+        sys.exit("No site with id '{}'".format(site_id))
+    user = app.acl_users.getUser(manager_id)
+    if user is None:
+        sys.exit("No user with id '{}'".format(manager_id))
+    newSecurityManager(None, user.__of__(app.acl_users))
+    setSite(site)
+    sweep_instruments_validity()
+    transaction.commit()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Registry of the keywords of services, calculation interims and service
+interims
+
+Maps each keyword to its owners, so that the uniqueness of keywords can be
+checked and the services of a formula resolved without scanning all services
+and calculations. The registry is stored in the annotations of the portal and
+kept up to date by the modified and removed events of the services and
+calculations.
+
+An owner is a dict with the keys:
+
+    - kind: one of SERVICE, CALCULATION_INTERIM or SERVICE_INTERIM
+    - uid: UID of the service or calculation
+    - title: title of the service or calculation
+    - interim_title: title of the interim field, empty for services
+"""
+
+from BTrees.OOBTree import OOBTree
+from bika.lims import api
+from zope.annotation.interfaces import IAnnotations
+
+SERVICE = "service"
+CALCULATION_INTERIM = "calculation_interim"
+SERVICE_INTERIM = "service_interim"
+
+# keyword -> owners
+KEYWORDS_STORAGE = "bika.lims.keywordregistry.keywords"
+# interim title -> owners
+TITLES_STORAGE = "bika.lims.keywordregistry.titles"
+# UID -> (keywords, interim titles)
+OBJECTS_STORAGE = "bika.lims.keywordregistry.objects"
+
+
+def get_storage(key, create=False):
+    """Returns the storage of the registry for the key passed in, or None
+    """
+    annotations = IAnnotations(api.get_portal())
+    storage = annotations.get(key)
+    if storage is None and create:
+        storage = annotations[key] = OOBTree()
+    return storage
+
+
+def get_owners(keyword, kind=None, exclude=None):
+    """Returns the owners of the keyword
+
+    :param kind: only return owners of this kind (or list of kinds)
+    :param exclude: UID of an owner to skip, e.g. the object being validated
+    """
+    storage = get_storage(KEYWORDS_STORAGE)
+    if not storage or not keyword:
+        return []
+    owners = storage.get(keyword, ())
+    if kind is not None:
+        kinds = isinstance(kind, basestring) and [kind] or kind
+        owners = filter(lambda owner: owner["kind"] in kinds, owners)
+    if exclude:
+        owners = filter(lambda owner: owner["uid"] != exclude, owners)
+    return list(owners)
+
+
+def get_interim_owners(title, kind=None, exclude=None):
+    """Returns the owners of the interim fields with the title passed in. The
+    owners have an additional "keyword" key
+    """
+    storage = get_storage(TITLES_STORAGE)
+    if not storage or not title:
+        return []
+    owners = storage.get(title, ())
+    if kind is not None:
+        owners = filter(lambda owner: owner["kind"] == kind, owners)
+    if exclude:
+        owners = filter(lambda owner: owner["uid"] != exclude, owners)
+    return list(owners)
+
+
+def get_service_uids(keywords):
+    """Returns the UIDs of the services with the keywords passed in
+    """
+    uids = []
+    for keyword in keywords:
+        for owner in get_owners(keyword, kind=SERVICE):
+            if owner["uid"] not in uids:
+                uids.append(owner["uid"])
+    return uids
+
+
+def get_keyword_owners(obj):
+    """Returns a list of (keyword, owner) of the object passed in
+    """
+    uid = api.get_uid(obj)
+    title = api.get_title(obj)
+    owners = []
+    interim_kind = CALCULATION_INTERIM
+    if api.get_portal_type(obj) == "AnalysisService":
+        interim_kind = SERVICE_INTERIM
+        keyword = obj.getKeyword()
+        if keyword:
+            owners.append((keyword, {
+                "kind": SERVICE,
+                "uid": uid,
+                "title": title,
+                "interim_title": "",
+            }))
+    for interim in obj.getInterimFields() or []:
+        keyword = interim.get("keyword")
+        if not keyword:
+            continue
+        owners.append((keyword, {
+            "kind": interim_kind,
+            "uid": uid,
+            "title": title,
+            "interim_title": interim.get("title", ""),
+        }))
+    return owners
+
+
+def _remove(storage, key, uid):
+    owners = filter(lambda owner: owner["uid"] != uid, storage.get(key, ()))
+    if owners:
+        storage[key] = tuple(owners)
+    elif key in storage:
+        del storage[key]
+
+
+def _add(storage, key, owner):
+    storage[key] = storage.get(key, ()) + (owner, )
+
+
+def unregister_keywords(uid):
+    """Removes the keywords of the object with the UID passed in
+    """
+    objects = get_storage(OBJECTS_STORAGE)
+    if not objects or uid not in objects:
+        return
+    keywords, titles = objects[uid]
+    storage = get_storage(KEYWORDS_STORAGE)
+    for keyword in keywords:
+        _remove(storage, keyword, uid)
+    storage = get_storage(TITLES_STORAGE)
+    for title in titles:
+        _remove(storage, title, uid)
+    del objects[uid]
+
+
+def register_keywords(obj):
+    """Updates the registry with the keywords of the service or calculation
+    passed in
+    """
+    factory = api.get_tool("portal_factory", default=None)
+    if factory is not None and factory.isTemporary(obj):
+        # the object is not created yet
+        return
+    uid = api.get_uid(obj)
+    unregister_keywords(uid)
+    owners = get_keyword_owners(obj)
+    if not owners:
+        return
+    keywords_storage = get_storage(KEYWORDS_STORAGE, create=True)
+    titles_storage = get_storage(TITLES_STORAGE, create=True)
+    keywords = []
+    titles = []
+    for keyword, owner in owners:
+        _add(keywords_storage, keyword, owner)
+        keywords.append(keyword)
+        if owner["kind"] == SERVICE or not owner["interim_title"]:
+            continue
+        owner = dict(owner, keyword=keyword)
+        _add(titles_storage, owner["interim_title"], owner)
+        titles.append(owner["interim_title"])
+    get_storage(OBJECTS_STORAGE, create=True)[uid] = (
+        tuple(set(keywords)), tuple(set(titles)))
+
+
+def rebuild_registry():
+    """Registers the keywords of all services and calculations
+    """
+    annotations = IAnnotations(api.get_portal())
+    for key in (KEYWORDS_STORAGE, TITLES_STORAGE, OBJECTS_STORAGE):
+        if key in annotations:
+            del annotations[key]
+    query = dict(portal_type=["AnalysisService", "Calculation"])
+    for brain in api.search(query, "bika_setup_catalog"):
+        register_keywords(api.get_object(brain))
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of SENAITE.CORE.
+#
+# SENAITE.CORE is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright 2018-2020 by it's authors.
+# Some rights reserved, see README and LICENSE.
+
+"""Lookup table of the reflex rules
+
+The action sets of the reflex rules are compiled when the rules are saved
+into a lookup table, keyed by (method UID, service UID, trigger), which is
+stored in the annotations of the portal. The conditions of the action sets
+are parsed in advance, so that an analysis without applicable rules costs a
+single lookup, without waking up any rule.
+"""
+
+from BTrees.OOBTree import OOBTree
+from bika.lims import api
+from bika.lims.utils import isnumber
+from zope.annotation.interfaces import IAnnotations
+
+LOOKUP_STORAGE = "bika.lims.reflexrules.lookup"
+
+
+def get_lookup_storage(create=False):
+    """Returns the lookup table of the reflex rules, or None if not created
+    """
+    annotations = IAnnotations(api.get_portal())
+    storage = annotations.get(LOOKUP_STORAGE)
+    if storage is None and create:
+        storage = annotations[LOOKUP_STORAGE] = OOBTree()
+    return storage
+
+
+def to_range(min_value, max_value):
+    """Returns the (min, max) of the range as floats or None
+    """
+    if not isnumber(min_value) or not isnumber(max_value):
+        return None
+    return (float(min_value), float(max_value))
+
+
+def compile_condition(condition):
+    """Returns the condition with the expected values parsed
+    """
+    return {
+        "analysisservice": condition.get("analysisservice", ""),
+        "and_or": condition.get("and_or", ""),
+        "discreteresult": condition.get("discreteresult", ""),
+        "range": to_range(condition.get("range0", ""),
+                          condition.get("range1", "")),
+    }
+
+
+def compile_action_set(rule_uid, action_set):
+    """Returns the action set with the conditions parsed
+    """
+    return {
+        "rule_uid": rule_uid,
+        "rulenumber": action_set.get("rulenumber", ""),
+        "mother_service_uid": action_set.get("mother_service_uid", ""),
+        "trigger": action_set.get("trigger", ""),
+        "conditions": map(compile_condition,
+                          action_set.get("conditions", [])),
+        "actions": map(dict, action_set.get("actions", [])),
+    }
+
+
+def is_condition_met(condition, result, discrete=False):
+    """Returns whether the result matches the expected value of the condition
+
+    :param discrete: whether the expected value is a discrete result
+    """
+    if not isnumber(result):
+        return False
+    if discrete:
+        expected = condition["discreteresult"]
+        return isinstance(expected, str) and expected == result
+    expected = condition["range"]
+    return expected is not None and \
+        expected[0] <= float(result) <= expected[1]
+
+
+def evaluate_conditions(resolutions):
+    """Returns the result of the resolutions of the conditions joined with
+    their and/or operators, "and" taking precedence over "or"
+
+    :param resolutions: list of (resolution, and_or)
+    """
+    groups = [[]]
+    for resolution, and_or in resolutions:
+        groups[-1].append(resolution)
+        if and_or == "or":
+            groups.append([])
+    return any(map(all, filter(None, groups)))
+
+
+def get_compiled_action_sets(method_uid, service_uid, trigger, rule_uid=None):
+    """Returns the compiled action sets of the active and inactive rules for
+    the method, service and trigger passed in
+
+    :param rule_uid: only return the action sets of this rule
+    """
+    storage = get_lookup_storage()
+    if not storage or not method_uid or not service_uid:
+        return []
+    action_sets = storage.get((method_uid, service_uid, trigger), ())
+    if rule_uid is None:
+        return list(action_sets)
+    return filter(lambda action_set: action_set["rule_uid"] == rule_uid,
+                  action_sets)
+
+
+def remove_reflex_rule(rule_uid):
+    """Removes the compiled action sets of the rule from the lookup table
+    """
+    storage = get_lookup_storage()
+    if not storage:
+        return
+    for key, action_sets in list(storage.items()):
+        if not any(map(lambda a_set: a_set["rule_uid"] == rule_uid,
+                       action_sets)):
+            continue
+        action_sets = tuple(filter(
+            lambda a_set: a_set["rule_uid"] != rule_uid, action_sets))
+        if action_sets:
+            storage[key] = action_sets
+        else:
+            del storage[key]
+
+
+def compile_reflex_rule(rule):
+    """Updates the lookup table with the action sets of the rule passed in
+    """
+    factory = api.get_tool("portal_factory", default=None)
+    if factory is not None and factory.isTemporary(rule):
+        # the rule is not created yet
+        return
+    rule_uid = api.get_uid(rule)
+    remove_reflex_rule(rule_uid)
+    method_uid = rule.getRawMethod()
+    if not method_uid:
+        return
+    storage = get_lookup_storage(create=True)
+    for action_set in rule.getReflexRules() or []:
+        action_set = compile_action_set(rule_uid, action_set)
+        key = (method_uid, action_set["mother_service_uid"],
+               action_set["trigger"])
+        storage[key] = storage.get(key, ()) + (action_set, )
@@ -28,6 +28,7 @@ from bika.lims import bikaMessageFactory as _
 from bika.lims import logger
 from bika.lims.api import APIError
 from bika.lims.utils import to_utf8
+from bika.lims.utils import keywordregistry
 from Products.CMFCore.utils import getToolByName
 from Products.CMFPlone.utils import safe_unicode
 from Products.validation import validation
@@ -259,43 +260,36 @@ class ServiceKeywordValidator:
         if re.findall(r"[^A-Za-z\w\d\-\_]", value):
             return _("Validation failed: keyword contains invalid characters")
 
-        # check the value against all AnalysisService keywords
-        # this has to be done from catalog so we don't
-        # clash with ourself
-        bsc = getToolByName(instance, 'bika_setup_catalog')
-        services = bsc(portal_type='AnalysisService', getKeyword=value)
+        # check the value against all AnalysisService keywords, but ours
+        services = keywordregistry.get_owners(
+            value, kind=keywordregistry.SERVICE, exclude=instance.UID())
         for service in services:
-            if service.UID != instance.UID():
-                msg = _(
-                    "Validation failed: '${title}': This keyword "
-                    "is already in use by service '${used_by}'",
-                    mapping={
-                        'title': safe_unicode(value),
-                        'used_by': safe_unicode(service.Title)
-                    })
-                return to_utf8(translate(msg))
+            msg = _(
+                "Validation failed: '${title}': This keyword "
+                "is already in use by service '${used_by}'",
+                mapping={
+                    'title': safe_unicode(value),
+                    'used_by': safe_unicode(service["title"])
+                })
+            return to_utf8(translate(msg))
 
         calc = hasattr(instance, 'getCalculation') and \
             instance.getCalculation() or None
         our_calc_uid = calc and calc.UID() or ''
 
         # check the value against all Calculation Interim Field ids
-        calcs = [c for c in bsc(portal_type='Calculation')]
+        calcs = keywordregistry.get_owners(
+            value, kind=keywordregistry.CALCULATION_INTERIM,
+            exclude=our_calc_uid)
         for calc in calcs:
-            calc = calc.getObject()
-            interim_fields = calc.getInterimFields()
-            if not interim_fields:
-                continue
-            for field in interim_fields:
-                if field['keyword'] == value and our_calc_uid != calc.UID():
-                    msg = _(
-                        "Validation failed: '${title}': This keyword "
-                        "is already in use by calculation '${used_by}'",
-                        mapping={
-                            'title': safe_unicode(value),
-                            'used_by': safe_unicode(calc.Title())
-                        })
-                    return to_utf8(translate(msg))
+            msg = _(
+                "Validation failed: '${title}': This keyword "
+                "is already in use by calculation '${used_by}'",
+                mapping={
+                    'title': safe_unicode(value),
+                    'used_by': safe_unicode(calc["title"])
+                })
+            return to_utf8(translate(msg))
         return True
 
 
@@ -323,7 +317,6 @@ class InterimFieldsValidator:
         interim_fields = form.get(fieldname, [])
 
         translate = getToolByName(instance, 'translation_service').translate
-        bsc = getToolByName(instance, 'bika_setup_catalog')
 
         # We run through the validator once per form submit, and check all
         # values
@@ -380,30 +373,35 @@ class InterimFieldsValidator:
             return instance.REQUEST[key]
 
         # check all keywords against all AnalysisService keywords for dups
-        services = bsc(portal_type='AnalysisService', getKeyword=value)
+        services = keywordregistry.get_owners(
+            value, kind=keywordregistry.SERVICE)
         if services:
             msg = _(
                 "Validation failed: '${title}': "
                 "This keyword is already in use by service '${used_by}'",
                 mapping={
                     'title': safe_unicode(value),
-                    'used_by': safe_unicode(services[0].Title)
+                    'used_by': safe_unicode(services[0]["title"])
                 })
             instance.REQUEST[key] = to_utf8(translate(msg))
             return instance.REQUEST[key]
 
         # any duplicated interimfield titles must share the same keyword
         # any duplicated interimfield keywords must share the same title
-        calcs = bsc(portal_type='Calculation')
         keyword_titles = {}
         title_keywords = {}
-        for calc in calcs:
-            if calc.UID == instance.UID():
+        for field in interim_fields:
+            if field['keyword'] != value:
                 continue
-            calc = calc.getObject()
-            for field in calc.getInterimFields():
-                keyword_titles[field['keyword']] = field['title']
-                title_keywords[field['title']] = field['keyword']
+            # interim fields of other calculations with the same keyword or
+            # the same title
+            kind = keywordregistry.CALCULATION_INTERIM
+            for owner in keywordregistry.get_owners(
+                    field['keyword'], kind=kind, exclude=instance.UID()):
+                keyword_titles[field['keyword']] = owner['interim_title']
+            for owner in keywordregistry.get_interim_owners(
+                    field.get('title'), kind=kind, exclude=instance.UID()):
+                title_keywords[owner['interim_title']] = owner['keyword']
         for field in interim_fields:
             if field['keyword'] != value:
                 continue
@@ -461,9 +459,13 @@ class FormulaValidator:
         keywords = re.compile(r"\[([^\.^\]]+)\]").findall(value)
 
         for keyword in keywords:
+            if keyword in interim_keywords:
+                continue
             # Check if the service keyword exists and is active.
-            dep_service = bsc(getKeyword=keyword, is_active=True)
-            if not dep_service and keyword not in interim_keywords:
+            dep_service = keywordregistry.get_service_uids([keyword])
+            if dep_service:
+                dep_service = bsc(UID=dep_service, is_active=True)
+            if not dep_service:
                 msg = _(
                     "Validation failed: Keyword '${keyword}' is invalid",
                     mapping={
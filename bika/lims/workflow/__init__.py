@@ -458,6 +458,9 @@ class JSONReadExtender(object):
 
     implements(IJSONReadExtender)
 
+    # keys added to the data, only if requested
+    fields = ("transitions", )
+
     def __init__(self, context):
         self.context = context
 
@@ -605,7 +608,7 @@ class ActionHandlerPool(object):
             obj = api.get_object(brain)
             idxs = self.get_indexes(uid)
             idxs_str = idxs and ", ".join(idxs) or "-- All indexes --"
-            logger.info("Reindexing {}: {}".format(obj.getId(), idxs_str))
+            logger.debug("Reindexing {}: {}".format(obj.getId(), idxs_str))
             obj.reindexObject(idxs=idxs)
             processed.append(uid)
 
@@ -24,12 +24,22 @@ from bika.lims import workflow as wf
 from bika.lims.workflow.analysis import events as analysis_events
 
 
+def update_instrument_validity(reference_analysis):
+    """Updates the validity of the instrument assigned to the reference
+    analysis, cause the result of the latest QC might have changed
+    """
+    instrument = reference_analysis.getInstrument()
+    if instrument:
+        instrument.updateValidity()
+
+
 def after_submit(reference_analysis):
     """Method triggered after a 'submit' transition for the reference analysis
     passed in is performed.
     Delegates to bika.lims.workflow.analysis.events.after_submit
     """
     analysis_events.after_submit(reference_analysis)
+    update_instrument_validity(reference_analysis)
 
 
 def after_verify(reference_analysis):
@@ -38,14 +48,18 @@ def after_verify(reference_analysis):
     Delegates to bika.lims.workflow.analysis.events.after_verify
     """
     analysis_events.after_verify(reference_analysis)
+    update_instrument_validity(reference_analysis)
 
 
 def after_unassign(reference_analysis):
     """Removes the reference analysis from the system
     """
     analysis_events.after_unassign(reference_analysis)
+    instrument = reference_analysis.getInstrument()
     ref_sample = reference_analysis.aq_parent
     ref_sample.manage_delObjects([reference_analysis.getId()])
+    if instrument:
+        instrument.updateValidity()
 
 
 def after_retract(reference_analysis):
@@ -57,6 +71,7 @@ def after_retract(reference_analysis):
     service = reference_analysis.getAnalysisService()
     worksheet = reference_analysis.getWorksheet()
     instrument = reference_analysis.getInstrument()
+    update_instrument_validity(reference_analysis)
     if worksheet:
         # This a reference analysis in a worksheet
         slot = worksheet.get_slot_position_for(reference_analysis)